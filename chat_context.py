@@ -0,0 +1,172 @@
+"""Paralleles Laden des Chat-Kontexts für den System-Prompt von /chat.
+
+Alle Quellen werden gleichzeitig abgefragt. Jede Quelle hat ein eigenes
+Timeout und einen Standardwert, damit eine langsame oder fehlerhafte Abfrage
+den Chat nicht blockiert, sondern nur ihren Abschnitt leer lässt.
+"""
+import asyncio
+import datetime
+import os
+from typing import Any, Dict, List
+
+# Timeout pro Quelle in Sekunden (per Umgebungsvariable überschreibbar)
+CONTEXT_SOURCE_TIMEOUT = float(os.getenv("CONTEXT_SOURCE_TIMEOUT", "2.0"))
+SOURCE_TIMEOUTS: Dict[str, float] = {
+    # Die Historie ist für die Antwort am wichtigsten und bekommt etwas mehr Zeit
+    "historie": CONTEXT_SOURCE_TIMEOUT * 1.5,
+}
+
+
+async def _lade_quelle(db, name: str, query, standard: Any, timeout: float) -> Any:
+    """Führt eine Lese-Query mit eigenem Timeout aus; bei Timeout oder Fehler gilt der Standardwert."""
+    try:
+        return await db.fetch(query, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"Timeout beim Laden von '{name}' nach {timeout}s – verwende Standardwert.")
+    except Exception as e:
+        print(f"Fehler beim Laden von '{name}': {e}")
+    return standard
+
+
+def _bericht_text(rows: List[Dict[str, Any]], standard: str) -> str:
+    if not rows:
+        return standard
+    r = rows[0]
+    r_date = r['timestamp'][:10] if r.get('timestamp') else 'unbekannt'
+    return f"[Erstellt am {r_date}]\n{r['inhalt']}"
+
+
+async def lade_chat_kontext(db, user_id: str) -> Dict[str, Any]:
+    """Lädt alle Abschnitte des Chat-System-Prompts gleichzeitig.
+
+    Gibt dieselben Abschnitte zurück, die chat() bisher nacheinander aufgebaut hat,
+    plus die Rohdaten der Historie (älteste zuerst) unter "gespraechs_historie".
+    """
+    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    abfragen = {
+        "historie": db.table("conversation_history")
+            .select("user_input, ai_response, ai_prompt")
+            .eq("user_id", user_id)
+            .order("timestamp", desc=True)
+            .limit(10),
+        "wochenbericht": db.table("long_term_memory")
+            .select("inhalt, timestamp")
+            .eq("user_id", user_id)
+            .eq("thema", "Wochenrückblick")
+            .order("timestamp", desc=True)
+            .limit(1),
+        "monatsbericht": db.table("long_term_memory")
+            .select("inhalt, timestamp")
+            .eq("user_id", user_id)
+            .eq("thema", "Monatsrückblick")
+            .order("timestamp", desc=True)
+            .limit(1),
+        "ziele": db.table("goals")
+            .select("titel", "status", "deadline")
+            .eq("user_id", user_id)
+            .eq("status", "offen"),
+        "profil": db.table("profile")
+            .select("attribute_name, attribute_value")
+            .eq("user_id", user_id)
+            .eq("archived", False),
+        "routinen": db.table("todos")
+            .select("title, last_checked_date, recurrence_weekday, missed_count")
+            .eq("user_id", user_id)
+            .eq("is_recurring", True)
+            .not_.in_("status", ["completed", "archived"]),
+        "offene_todos": db.table("todos")
+            .select("title, priority, due_date, category, status")
+            .eq("user_id", user_id)
+            .eq("is_recurring", False)
+            .in_("status", ["open", "in_progress"])
+            .limit(10),
+        "ueberfaellige_todos": db.table("todos")
+            .select("title, priority, due_date, category")
+            .eq("user_id", user_id)
+            .eq("is_recurring", False)
+            .lt("due_date", today_date)
+            .not_.in_("status", ["completed", "archived", "skipped"]),
+        "gedaechtnis": db.table("long_term_memory")
+            .select("thema, inhalt, timestamp")
+            .eq("user_id", user_id)
+            .order("timestamp", desc=True)
+            .limit(10),
+        "zusammenfassung": db.table("conversation_summaries")
+            .select("woche, zusammenfassung")
+            .eq("user_id", user_id)
+            .order("woche", desc=True)
+            .limit(2),
+    }
+
+    ergebnisse = await asyncio.gather(*[
+        _lade_quelle(db, name, abfrage, [], SOURCE_TIMEOUTS.get(name, CONTEXT_SOURCE_TIMEOUT))
+        for name, abfrage in abfragen.items()
+    ])
+    daten: Dict[str, List[Dict[str, Any]]] = dict(zip(abfragen.keys(), ergebnisse))
+
+    gespraechs_historie = list(daten["historie"])
+    gespraechs_historie.reverse()  # Älteste zuerst
+
+    open_goals = daten["ziele"]
+    ziele_text = "Aktuelle offene Ziele:\n" + "\n".join([f"- {g['titel']} (Deadline: {g['deadline']})" for g in open_goals]) \
+        if open_goals else "Keine offenen Ziele."
+
+    profile_text_for_prompt = "Keine spezifischen Profilinformationen erfasst."
+    upcoming_events_text = "Keine bevorstehenden Termine oder laufenden Prozesse."
+    if daten["profil"]:
+        user_profile_details = {item["attribute_name"]: item["attribute_value"] for item in daten["profil"]}
+        profile_text_for_prompt = "Aktuelles Benutzerprofil:\n" + "\n".join([f"- {name}: {value}" for name, value in user_profile_details.items()])
+        upcoming = [
+            f"- {name}: {value}"
+            for name, value in user_profile_details.items()
+            if name.startswith(("Termin_", "Prozess_")) and "abgeschlossen" not in value.lower()
+        ]
+        upcoming_events_text = "\n".join(upcoming) if upcoming else "Keine bevorstehenden Termine oder laufenden Prozesse."
+
+    routines = daten["routinen"]
+    routines_text = "Aktuelle Routinen:\n" + "\n".join([f"- {r['title']} (Tag: {r['recurrence_weekday']}, Erledigt: {'Ja' if r.get('last_checked_date') == today_date else 'Nein'}, Verpasst: {str(r.get('missed_count', 0))})" for r in routines]) \
+        if routines else "Keine Routinen definiert."
+
+    todos_text = "Keine To-Dos definiert."
+    open_todos, overdue_todos = daten["offene_todos"], daten["ueberfaellige_todos"]
+    if open_todos or overdue_todos:
+        todos_parts = []
+        if open_todos:
+            todos_parts.append("Offene To-Dos:\n" + "\n".join([f"- {t['title']} (Priorität: {t['priority']}, Fällig: {t.get('due_date', 'Kein Datum')}, Kategorie: {t['category']})" for t in open_todos]))
+        if overdue_todos:
+            todos_parts.append("Überfällige To-Dos:\n" + "\n".join([f"- {t['title']} (Fällig seit: {t['due_date']}, Priorität: {t['priority']})" for t in overdue_todos]))
+        todos_text = "\n\n".join(todos_parts)
+
+    memory = daten["gedaechtnis"]
+    memory_text = "\n".join([f"[Aufgezeichnet: {m['timestamp'][:10] if m.get('timestamp') else 'unbekannt'}] {m['thema']}: {m['inhalt']}" for m in memory]) \
+        if memory else "Keine spezifischen Langzeit-Erkenntnisse gespeichert."
+
+    # Fortlaufende Zusammenfassung der letzten beiden Wochen (älteste zuerst)
+    zusammenfassung_text = "\n\n".join([f"Woche {z['woche']}:\n{z['zusammenfassung']}" for z in reversed(daten["zusammenfassung"])]) \
+        if daten["zusammenfassung"] else "Noch keine Zusammenfassung früherer Gespräche."
+
+    # Konversationshistorie für den System-Prompt formatieren
+    history_messages = []
+    for h in reversed(gespraechs_historie):
+        if h.get('user_input'):
+            history_messages.append(f"User: {h['user_input']}")
+        if h.get('ai_response'):
+            history_messages.append(f"Berater: {h['ai_response']}")
+        if h.get('ai_prompt'):
+            history_messages.append(f"Berater: {h['ai_prompt']}")
+    history_text = "\n".join(history_messages) if history_messages else "Bisher keine frühere Konversationshistorie."
+
+    return {
+        "gespraechs_historie": gespraechs_historie,
+        "history_text": history_text,
+        "wochenbericht_text": _bericht_text(daten["wochenbericht"], "Kein Wochenbericht verfügbar."),
+        "monatsbericht_text": _bericht_text(daten["monatsbericht"], "Kein Monatsbericht verfügbar."),
+        "ziele_text": ziele_text,
+        "profile_text_for_prompt": profile_text_for_prompt,
+        "upcoming_events_text": upcoming_events_text,
+        "routines_text": routines_text,
+        "todos_text": todos_text,
+        "memory_text": memory_text,
+        "zusammenfassung_text": zusammenfassung_text,
+    }
@@ -0,0 +1,46 @@
+"""Awaitable Datenzugriffsschicht über dem synchronen Supabase-Client.
+
+Queries werden wie gewohnt mit dem Supabase-Builder zusammengesetzt
+(db.table(...).select(...).eq(...)) – das passiert lokal ohne Netzwerk.
+Nur das eigentliche execute() läuft in einem begrenzten Thread-Pool, damit
+kein DB-Roundtrip den Event-Loop blockiert. Unabhängige Lesezugriffe können
+mit gather() gleichzeitig ausgeführt werden.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Optional
+
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "16"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+
+
+class Database:
+    def __init__(self, client, max_workers: int = DB_MAX_WORKERS, timeout: float = DB_TIMEOUT):
+        self._client = client
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="supabase")
+
+    def table(self, name: str):
+        """Query-Builder für eine Tabelle (noch ohne Roundtrip)."""
+        return self._client.table(name)
+
+    def rpc(self, fn: str, params: dict):
+        """Builder für einen Stored-Procedure-Aufruf (noch ohne Roundtrip)."""
+        return self._client.rpc(fn, params)
+
+    async def execute(self, query, timeout: Optional[float] = None):
+        """Führt eine Query im Thread-Pool aus und gibt die Supabase-Antwort zurück."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, query.execute), timeout or self.timeout)
+
+    async def fetch(self, query, timeout: Optional[float] = None) -> List[dict]:
+        """Wie execute(), gibt aber direkt die Zeilen (.data) zurück."""
+        return (await self.execute(query, timeout)).data
+
+    async def gather(self, *queries, return_exceptions: bool = False) -> List[Any]:
+        """Führt unabhängige Lese-Queries gleichzeitig aus; Ergebnisse in Aufrufreihenfolge."""
+        return await asyncio.gather(*[self.fetch(q) for q in queries], return_exceptions=return_exceptions)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
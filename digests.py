@@ -0,0 +1,315 @@
+"""Hierarchische Digests als Grundlage aller Berichte.
+
+Statt für jeden Bericht die rohe Konversationshistorie (Woche, Monat) oder
+ganze Stapel früherer Berichtstexte (Quartal, Jahr) neu zu lesen, wird pro
+Nutzer einmal ein kompakter, strukturierter Digest pro Tag erzeugt. Die
+Ebenen darüber entstehen nur aus den Digests der Ebene darunter:
+
+    tag (aus den Turns) → monat (aus den Tagen) → quartal (aus 3 Monaten) → jahr (aus 4 Quartalen)
+
+Der Wochenbericht liest die Tages-Digests seines Zeitraums, der Monatsbericht
+ebenso; Quartals- und Jahresbericht lesen nur Monats- bzw. Quartals-Digests.
+Die Kosten hängen damit von der Anzahl der Tage ab, nicht der Nachrichten.
+
+Tabelle digests (user_id, ebene, periode, inhalt, erstellt_am), eindeutig über
+(user_id, ebene, periode). periode ist "2026-10-18", "2026-10", "2026-Q4" bzw.
+"2026"; inhalt ist das Digest-JSON. Gespeichert werden nur abgeschlossene
+Perioden (auch leere, damit Tage ohne Gespräche nicht erneut gelesen werden);
+die laufende wird bei Bedarf frisch gebaut.
+
+Der monatliche Cleanup löscht die Turns ganzer Monate. Vor dem Monat des
+ältesten verbliebenen Turns ist ein Tag ohne Turns also nicht leer, sondern
+unbekannt: solche Tage werden nicht (als leer) gespeichert. Monats-, Quartals-
+und Jahres-Digests dieser Zeit entstehen stattdessen aus dem damals erzeugten
+Bericht in long_term_memory (Monatsrückblick, Quartalsbericht, Jahresrückblick).
+"""
+import asyncio
+import calendar
+import datetime
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from map_reduce import abschnitte, map_reduce, zeilen_seitenweise
+from metrics import metrics
+from rolling_summary import formatiere_turns
+
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+
+TABELLE = "digests"
+EBENEN = ("tag", "monat", "quartal", "jahr")
+# Höchstlänge pro Ebene (Wörter)
+DIGEST_WORTE = {"tag": 80, "monat": 150, "quartal": 200, "jahr": 250}
+FELDER = {
+    "themen": "Themen",
+    "fortschritte": "Fortschritte",
+    "herausforderungen": "Herausforderungen",
+    "vergangen": "Als vergangen eingeordnet/korrigiert",
+    "stimmung": "Stimmung",
+}
+
+# Bericht, aus dem ein Digest entsteht, wenn die Turns der Periode schon gelöscht sind
+BERICHT_THEMEN = {"monat": "Monatsrückblick", "quartal": "Quartalsbericht", "jahr": "Jahresrückblick"}
+
+Digest = Dict[str, object]
+
+
+def periode_von(ebene: str, tag: datetime.date) -> str:
+    if ebene == "tag":
+        return tag.isoformat()
+    if ebene == "monat":
+        return f"{tag.year}-{tag.month:02d}"
+    if ebene == "quartal":
+        return f"{tag.year}-Q{(tag.month - 1) // 3 + 1}"
+    return str(tag.year)
+
+
+def zeitraum(ebene: str, periode: str) -> Tuple[datetime.date, datetime.date]:
+    """Erster und letzter Tag einer Periode."""
+    if ebene == "tag":
+        tag = datetime.date.fromisoformat(periode)
+        return tag, tag
+    if ebene == "monat":
+        jahr, monat = map(int, periode.split("-"))
+        return datetime.date(jahr, monat, 1), datetime.date(jahr, monat, calendar.monthrange(jahr, monat)[1])
+    if ebene == "quartal":
+        jahr, quartal = int(periode[:4]), int(periode[-1])
+        letzter_monat = quartal * 3
+        return datetime.date(jahr, letzter_monat - 2, 1), datetime.date(jahr, letzter_monat, calendar.monthrange(jahr, letzter_monat)[1])
+    return datetime.date(int(periode), 1, 1), datetime.date(int(periode), 12, 31)
+
+
+def kind_perioden(ebene: str, periode: str) -> Tuple[str, List[str]]:
+    """Ebene und Perioden, aus denen ein Digest zusammengesetzt wird."""
+    start, ende = zeitraum(ebene, periode)
+    kind = EBENEN[EBENEN.index(ebene) - 1]
+    perioden = []
+    tag = start
+    while tag <= ende:
+        p = periode_von(kind, tag)
+        if p not in perioden:
+            perioden.append(p)
+        tag += datetime.timedelta(days=1)
+    return kind, perioden
+
+
+def vorherige_perioden(ebene: str, periode: str, anzahl: int) -> List[str]:
+    """Die `anzahl` Perioden vor `periode`, aufsteigend."""
+    perioden = []
+    start = zeitraum(ebene, periode)[0]
+    for _ in range(anzahl):
+        p = periode_von(ebene, start - datetime.timedelta(days=1))
+        perioden.insert(0, p)
+        start = zeitraum(ebene, p)[0]
+    return perioden
+
+
+def tage_zwischen(von: datetime.date, bis: datetime.date) -> List[str]:
+    return [(von + datetime.timedelta(days=i)).isoformat() for i in range((bis - von).days + 1)]
+
+
+def digest_text(digests: Dict[str, Digest]) -> str:
+    """Kompakte Textform für Prompts: eine Zeile pro Periode."""
+    zeilen = []
+    for periode in sorted(digests):
+        teile = []
+        for feld, label in FELDER.items():
+            wert = digests[periode].get(feld)
+            if isinstance(wert, list):
+                wert = ", ".join(str(w) for w in wert if w)
+            if wert:
+                teile.append(f"{label}: {wert}")
+        if teile:
+            zeilen.append(f"{periode}: " + "; ".join(teile))
+    return "\n".join(zeilen)
+
+
+def _heute() -> datetime.date:
+    return datetime.datetime.utcnow().date()
+
+
+class Digests:
+    def __init__(self, db, llm, parallel: int = DIGEST_CONCURRENCY):
+        self.db = db
+        self.llm = llm
+        self._semaphore = asyncio.Semaphore(parallel)
+
+    async def gespeichert(self, user_id: str, ebene: str, perioden: List[str]) -> Dict[str, Digest]:
+        """Nur bereits gespeicherte Digests (ohne etwas zu bauen); leere Perioden als {}."""
+        if not perioden:
+            return {}
+        rows = await self.db.fetch(self.db.table(TABELLE)
+            .select("periode, inhalt")
+            .eq("user_id", user_id)
+            .eq("ebene", ebene)
+            .in_("periode", perioden))
+        return {r["periode"]: json.loads(r["inhalt"]) for r in rows}
+
+    async def perioden(self, user_id: str, ebene: str, perioden: List[str]) -> Dict[str, Digest]:
+        """Digests der Perioden (leere ausgelassen). Fehlende werden aus der Ebene darunter gebaut, abgeschlossene gespeichert."""
+        return (await self._perioden(user_id, ebene, perioden))[0]
+
+    async def _perioden(self, user_id: str, ebene: str, perioden: List[str],
+                        historie_ab: Optional[datetime.date] = None) -> Tuple[Dict[str, Digest], bool]:
+        """Wie perioden(), zusätzlich ob alle Digests fehlerfrei erstellt werden konnten."""
+        heute = _heute()
+        abgeschlossen = [p for p in perioden if zeitraum(ebene, p)[1] < heute]
+        vorhanden = await self.gespeichert(user_id, ebene, abgeschlossen)
+        metrics.incr(f"digest.{ebene}.hit", len(vorhanden))
+        fehlend = [p for p in perioden if p not in vorhanden]
+        vollstaendig = True
+        if fehlend:
+            metrics.incr(f"digest.{ebene}.built", len(fehlend))
+            if historie_ab is None:
+                historie_ab = await self._historie_ab(user_id)
+            if ebene == "tag":
+                gebaut = await self._tage_bauen(user_id, fehlend, historie_ab)
+                speichern = {p: d is not None for p, d in gebaut.items()}
+            else:
+                # Turns schon gelöscht: aus dem damaligen Bericht, sofern es einen gibt
+                ohne_historie = [p for p in fehlend if zeitraum(ebene, p)[1] < historie_ab]
+                gebaut = await self._aus_berichten(user_id, ebene, ohne_historie) if ohne_historie else {}
+                speichern = {p: d is not None for p, d in gebaut.items()}
+                rest = [p for p in fehlend if p not in gebaut]
+                ergebnisse = await asyncio.gather(*[self._aus_kindern(user_id, ebene, p, historie_ab) for p in rest])
+                gebaut.update({p: d for p, (d, _) in zip(rest, ergebnisse)})
+                speichern.update({p: ok for p, (_, ok) in zip(rest, ergebnisse)})
+            # Fehler (None) oder unvollständige Teile: nicht speichern, beim nächsten Mal erneut versuchen
+            vollstaendig = all(speichern.values())
+            neu = {p: d for p, d in gebaut.items() if d is not None}
+            await self._speichern(user_id, ebene, {p: d for p, d in neu.items() if p in abgeschlossen and speichern[p]})
+            vorhanden.update(neu)
+        return {p: vorhanden[p] for p in perioden if vorhanden.get(p)}, vollstaendig
+
+    async def _historie_ab(self, user_id: str) -> datetime.date:
+        """Ab diesem Tag liegen die Turns vollständig vor: der Monatserste des ältesten verbliebenen Turns."""
+        rows = await self.db.fetch(self.db.table("conversation_history")
+            .select("timestamp")
+            .eq("user_id", user_id)
+            .order("timestamp", desc=False)
+            .limit(1))
+        tag = datetime.date.fromisoformat(rows[0]["timestamp"][:10]) if rows else _heute()
+        return tag.replace(day=1)
+
+    async def _aus_berichten(self, user_id: str, ebene: str, perioden: List[str]) -> Dict[str, Optional[Digest]]:
+        """Digests aus den gespeicherten Berichten (nur Perioden, zu denen es einen gibt; None bei Fehlern).
+
+        Der Bericht einer Periode entsteht zu Beginn der Periode danach; es zählt der erste dort.
+        """
+        if ebene not in BERICHT_THEMEN:
+            return {}
+        danach = {p: periode_von(ebene, zeitraum(ebene, p)[1] + datetime.timedelta(days=1)) for p in perioden}
+        rows = await self.db.fetch(self.db.table("long_term_memory")
+            .select("inhalt, timestamp")
+            .eq("user_id", user_id)
+            .eq("thema", BERICHT_THEMEN[ebene])
+            .gte("timestamp", zeitraum(ebene, min(perioden))[1].isoformat() + "T00:00:00Z")
+            .order("timestamp", desc=False))
+        berichte: Dict[str, str] = {}
+        for row in rows:
+            berichte.setdefault(periode_von(ebene, datetime.date.fromisoformat(row["timestamp"][:10])), row["inhalt"])
+
+        async def bauen(periode: str) -> Optional[Digest]:
+            try:
+                return json.loads(await self._digest(ebene, berichte[danach[periode]], quelle=BERICHT_THEMEN[ebene]))
+            except Exception as e:
+                print(f"Fehler beim Erstellen des {ebene}-Digests {periode} aus dem Bericht für User {user_id}: {e}")
+                return None
+
+        mit_bericht = [p for p in perioden if danach[p] in berichte]
+        metrics.incr(f"digest.{ebene}.from_report", len(mit_bericht))
+        return dict(zip(mit_bericht, await asyncio.gather(*[bauen(p) for p in mit_bericht])))
+
+    async def _speichern(self, user_id: str, ebene: str, digests: Dict[str, Digest]):
+        if not digests:
+            return
+        jetzt = datetime.datetime.utcnow().isoformat() + 'Z'
+        await self.db.execute(self.db.table(TABELLE).upsert([
+            {"user_id": user_id, "ebene": ebene, "periode": p, "inhalt": json.dumps(d, ensure_ascii=False), "erstellt_am": jetzt}
+            for p, d in digests.items()
+        ], on_conflict="user_id,ebene,periode"))
+
+    async def _aus_kindern(self, user_id: str, ebene: str, periode: str, historie_ab: datetime.date) -> Tuple[Optional[Digest], bool]:
+        """Digest aus den Digests der Ebene darunter; zweiter Wert: ob er gespeichert werden darf."""
+        kind, teilperioden = kind_perioden(ebene, periode)
+        teile, vollstaendig = await self._perioden(user_id, kind, teilperioden, historie_ab)
+        if not teile:
+            return {}, vollstaendig
+        try:
+            return json.loads(await self._digest(ebene, digest_text(teile))), vollstaendig
+        except Exception as e:
+            print(f"Fehler beim Erstellen des {ebene}-Digests {periode} für User {user_id}: {e}")
+            return None, False
+
+    async def _tage_bauen(self, user_id: str, perioden: List[str], historie_ab: datetime.date) -> Dict[str, Optional[Digest]]:
+        # Vor historie_ab sind die Turns gelöscht: unbekannt (None), nicht leer
+        ergebnis: Dict[str, Optional[Digest]] = {t: None for t in perioden if t < historie_ab.isoformat()}
+        metrics.incr("digest.tag.without_history", len(ergebnis))
+        perioden = [t for t in perioden if t not in ergebnis]
+        if not perioden:
+            return ergebnis
+        # Alle fehlenden Tage mit einer (seitenweisen) Abfrage über den Gesamtzeitraum lesen
+        bis = datetime.date.fromisoformat(max(perioden)) + datetime.timedelta(days=1)
+        turns = zeilen_seitenweise(self.db, lambda: self.db.table("conversation_history")
+            .select("user_input, ai_response, ai_prompt, timestamp")
+            .eq("user_id", user_id)
+            .gte("timestamp", min(perioden) + "T00:00:00Z")
+            .lt("timestamp", bis.isoformat() + "T00:00:00Z")
+            .order("timestamp", desc=False))
+        nach_tag: Dict[str, List[Dict]] = defaultdict(list)
+        async for row in turns:
+            nach_tag[row["timestamp"][:10]].append(row)
+
+        async def bauen(tag: str) -> Optional[Digest]:
+            if not nach_tag.get(tag):
+                return {}
+            try:
+                return json.loads(await self._tagesdigest(nach_tag[tag]))
+            except Exception as e:
+                print(f"Fehler beim Erstellen des Tages-Digests {tag} für User {user_id}: {e}")
+                return None
+
+        ergebnis.update(zip(perioden, await asyncio.gather(*[bauen(t) for t in perioden])))
+        return ergebnis
+
+    async def _tagesdigest(self, rows: List[Dict]) -> str:
+        """Ein Tag passt meist in einen Aufruf; sehr lange Tage werden per Map-Reduce verdichtet."""
+        async def strom():
+            for row in rows:
+                yield row
+
+        return await map_reduce(
+            abschnitte(strom(), formatiere_turns),
+            zusammenfassen=self._stichpunkte,
+            zusammenfuehren=lambda text: self._digest("tag", text),
+        )
+
+    async def _stichpunkte(self, text: str) -> str:
+        async with self._semaphore:
+            response = await self.llm.complete(
+                model="gpt-4o-mini",
+                messages=[{"role": "user", "content": f"Fasse diesen Gesprächsausschnitt in höchstens 120 Wörtern als Stichpunkte zusammen. Erhalte, was der Nutzer als vergangen eingeordnet oder am Berater korrigiert hat.\n\n{text}"}],
+                temperature=0.3,
+                tag="digest"
+            )
+        return response.choices[0].message.content.strip()
+
+    async def _digest(self, ebene: str, text: str, quelle: Optional[str] = None) -> str:
+        quelle = quelle or ("Gesprächsverlauf eines Tages" if ebene == "tag" else "Digests der Teilzeiträume")
+        async with self._semaphore:
+            response = await self.llm.complete(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "Du verdichtest Gespräche zwischen einem Nutzer und seinem persönlichen Berater zu kompakten Digests."},
+                    {"role": "user", "content": f"""Verdichte den folgenden {quelle} zu einem Digest (Ebene: {ebene}), insgesamt höchstens {DIGEST_WORTE[ebene]} Wörter in kurzen Stichpunkten.
+"vergangen": Themen, die der Nutzer als vergangen/abgeschlossen eingeordnet oder bei denen er den Berater korrigiert hat.
+Antworte NUR mit JSON: {{"themen": [], "fortschritte": [], "herausforderungen": [], "vergangen": [], "stimmung": ""}}
+
+{text}"""},
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.3,
+                tag="digest"
+            )
+        return response.choices[0].message.content
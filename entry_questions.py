@@ -0,0 +1,253 @@
+"""Vorbereitete Einstiegsfragen für /start_interaction.
+
+Die Einstiegsfrage braucht rund acht Supabase-Abfragen und einen gpt-4o-Aufruf –
+zu viel für den Moment, in dem die Seite lädt. Deshalb wird die nächste Frage
+im Voraus erzeugt und pro Nutzer in der Tabelle entry_questions (user_id,
+frage, mode, stand, erstellt_am; eindeutig über user_id) abgelegt:
+
+- direkt nachdem eine Frage ausgeliefert wurde (für den nächsten Besuch),
+- und erneut, wenn nach einem Chat ENTRY_QUESTION_IDLE_SECONDS lang nichts
+  mehr kam (die Sitzung ist vorbei, die Frage soll sie berücksichtigen).
+
+Frische-Regel: Eine vorbereitete Frage wird nur ausgeliefert, wenn sie nicht
+älter als ENTRY_QUESTION_MAX_AGE_HOURS ist und sich die offenen To-Dos und
+Routinen seitdem nicht geändert haben (Fingerabdruck "stand"). Ein neuer Tag
+allein macht sie nicht ungültig – nur wenn dadurch ein To-Do überfällig oder
+heute fällig wird bzw. eine Routine heute ansteht. Sonst wird sie verworfen
+und die Frage wie bisher sofort erzeugt.
+
+Wiederholungen verhindert eine Neuheitsprüfung statt langer Verbotslisten im
+Prompt: Jede gestellte Frage landet als Embedding im Vektor-Index (Quelle
+"einstiegsfrage"). Ist eine neue Frage einer früheren ähnlicher als
+ENTRY_QUESTION_NOVELTY_THRESHOLD, werden mehrere Kandidaten erzeugt und der
+neuartigste genommen. Im Prompt stehen nur noch die letzten
+ENTRY_QUESTION_PROMPT_RECENT Fragen.
+
+Beim Erzeugen wird erst der Modus gewählt und dann nur geladen, was sein
+Prompt verwendet (EINSTIEG_QUELLEN, quellen_fuer_modus).
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import metrics
+from vector_index import EMBEDDING_DIM, EMBEDDING_MODEL
+
+ENTRY_QUESTION_IDLE_SECONDS = float(os.getenv("ENTRY_QUESTION_IDLE_SECONDS", "600"))
+ENTRY_QUESTION_MAX_AGE_HOURS = float(os.getenv("ENTRY_QUESTION_MAX_AGE_HOURS", "12"))
+ENTRY_QUESTION_NOVELTY_THRESHOLD = float(os.getenv("ENTRY_QUESTION_NOVELTY_THRESHOLD", "0.85"))
+ENTRY_QUESTION_CANDIDATES = int(os.getenv("ENTRY_QUESTION_CANDIDATES", "3"))
+ENTRY_QUESTION_PROMPT_RECENT = int(os.getenv("ENTRY_QUESTION_PROMPT_RECENT", "3"))
+
+TABELLE = "entry_questions"
+
+
+def _tagesbezug(todo: Dict[str, Any], heute: datetime.datetime) -> Optional[str]:
+    """Was ein To-Do heute für die Frage bedeutet (überfällig, heute fällig/offen) – ohne das Datum selbst."""
+    datum = heute.strftime("%Y-%m-%d")
+    if todo.get("is_recurring"):
+        faellig = todo.get("recurrence_type") == "daily" or (todo.get("recurrence_weekday") or "").lower() == heute.strftime("%A").lower()
+        if not faellig:
+            return None
+        return "erledigt" if todo.get("last_checked_date") == datum else "offen"
+    if not todo.get("due_date"):
+        return None
+    if todo["due_date"] < datum:
+        return "ueberfaellig"
+    return "heute" if todo["due_date"] == datum else "spaeter"
+
+
+async def aktueller_stand(db, user_id: str) -> str:
+    """Fingerabdruck über alle offenen To-Dos/Routinen des Nutzers.
+
+    Das Datum selbst gehört nicht dazu – sonst wäre jede Frage vom Vortag beim
+    ersten Besuch veraltet. Stattdessen zählt pro To-Do nur, was sich mit dem
+    Tag für die Frage ändert (überfällig, heute fällig, Routine heute offen).
+    """
+    todos = await db.fetch(db.table("todos")
+        .select("id, status, due_date, priority, is_recurring, recurrence_type, recurrence_weekday, last_checked_date, missed_count")
+        .eq("user_id", user_id)
+        .not_.in_("status", ["completed", "archived"]))
+    heute = datetime.datetime.now()
+    todos = sorted((dict(t, heute=_tagesbezug(t, heute)) for t in todos), key=lambda t: str(t.get("id")))
+    roh = json.dumps(todos, sort_keys=True, default=str)
+    return hashlib.sha256(roh.encode("utf-8")).hexdigest()
+
+
+async def aehnlichkeiten(index, llm, user_id: str, fragen: List[str]) -> List[float]:
+    """Höchste Ähnlichkeit jeder Frage zu den bisher gestellten Fragen des Nutzers (-1.0 ohne Vergleich)."""
+    if not index.hat_eintraege(user_id, quellen=["einstiegsfrage"]):
+        return [-1.0] * len(fragen)
+    vektoren = await llm.embed(fragen, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIM, timeout=10)
+    return index.max_aehnlichkeit(user_id, vektoren, quellen=["einstiegsfrage"])
+
+
+async def neuartige_frage(index, llm, user_id: str, frage: str, weitere: Callable[[int], Awaitable[List[str]]]) -> str:
+    """Gibt `frage` zurück, solange sie neu genug ist; sonst den neuartigsten von weiteren Kandidaten.
+
+    `weitere(n)` erzeugt n neue Kandidaten (nur wenn die erste Frage zu ähnlich ist).
+    """
+    metrics.incr("entry_question.novelty.checked")
+    aehnlichkeit = (await aehnlichkeiten(index, llm, user_id, [frage]))[0]
+    if aehnlichkeit <= ENTRY_QUESTION_NOVELTY_THRESHOLD:
+        return frage
+    metrics.incr("entry_question.novelty.regenerated")
+    kandidaten = [k for k in await weitere(ENTRY_QUESTION_CANDIDATES) if k]
+    if not kandidaten:
+        return frage
+    werte = await aehnlichkeiten(index, llm, user_id, kandidaten)
+    beste = min(range(len(kandidaten)), key=lambda i: werte[i])
+    if werte[beste] > ENTRY_QUESTION_NOVELTY_THRESHOLD:
+        metrics.incr("entry_question.novelty.still_similar")
+    return kandidaten[beste] if werte[beste] < aehnlichkeit else frage
+
+
+# Welche Daten der Prompt des jeweiligen Einstiegs-Modus verwendet (Historie, offene To-Dos/Routinen
+# und die zuletzt gestellten Fragen werden immer geladen)
+EINSTIEG_QUELLEN: Dict[str, Set[str]] = {
+    "todo_followup": set(),
+    "routine_reflexion": set(),
+    "universum": {"universum"},
+    "ziel_check": {"ziele"},
+    "provokation": {"profil", "ziele"},
+    "insight": {"insights"},
+    "rueckblick": {"rueckblicke"},
+    "normal": {"profil", "ziele", "monatsberichte", "wochenberichte"},
+}
+
+
+async def _universum_fragen(db, user_id: str) -> List[str]:
+    """Die letzten 10 Universum-Botschaften."""
+    rows = await db.fetch(db.table("conversation_history").select("ai_prompt").eq("user_id", user_id).eq("user_input", "")
+                          .eq("mode", "universum").order("timestamp", desc=True).limit(10))
+    return [r["ai_prompt"] for r in rows if r["ai_prompt"]]
+
+
+async def _rueckblicke(db, user_id: str) -> List[Dict[str, Any]]:
+    """Die letzten 8 Wochenberichte, 20 Monatsberichte und alle Jahresberichte."""
+    wochen_berichte, monats_berichte, jahres_berichte = await db.gather(
+        db.table("long_term_memory").select("thema, inhalt, timestamp").eq("user_id", user_id).eq("thema", "Wochenrückblick").order("timestamp", desc=True).limit(8),
+        db.table("long_term_memory").select("thema, inhalt, timestamp").eq("user_id", user_id).eq("thema", "Monatsrückblick").order("timestamp", desc=True).limit(20),
+        db.table("long_term_memory").select("thema, inhalt, timestamp").eq("user_id", user_id).eq("thema", "Jahresrückblick").order("timestamp", desc=True),
+    )
+    return wochen_berichte + monats_berichte + jahres_berichte
+
+
+async def lade_einstieg_quellen(db, user_id: str, quellen: Set[str]) -> Dict[str, list]:
+    """Lädt die angegebenen Quellen für die Einstiegsfrage gleichzeitig."""
+    abfragen = {
+        "universum": lambda: _universum_fragen(db, user_id),
+        "profil": lambda: db.fetch(db.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id).eq("archived", False)),
+        "ziele": lambda: db.fetch(db.table("goals").select("titel", "status").eq("user_id", user_id).limit(5)),
+        "monatsberichte": lambda: db.fetch(db.table("long_term_memory").select("thema, inhalt").eq("user_id", user_id).eq("thema", "Monatsrückblick").order("timestamp", desc=True).limit(10)),
+        "wochenberichte": lambda: db.fetch(db.table("long_term_memory").select("thema, inhalt").eq("user_id", user_id).eq("thema", "Wochenrückblick").order("timestamp", desc=True).limit(4)),
+        "insights": lambda: db.fetch(db.table("long_term_memory").select("thema, inhalt").eq("user_id", user_id).not_.in_("thema", ["Wochenrückblick", "Monatsrückblick", "Jahresrückblick"]).order("timestamp", desc=True).limit(20)),
+        "rueckblicke": lambda: _rueckblicke(db, user_id),
+    }
+    namen = sorted(quellen)
+    ergebnisse = await asyncio.gather(*[abfragen[name]() for name in namen])
+    return dict(zip(namen, ergebnisse))
+
+
+async def quellen_fuer_modus(db, user_id: str, mode: str) -> Tuple[str, Dict[str, list]]:
+    """Lädt nur die Quellen des gewählten Modus. Gibt (mode, geladen) zurück, denn ohne Daten wird
+    umgeschaltet: insight ohne Erkenntnisse -> rueckblick, rueckblick ohne Berichte -> normal."""
+    geladen = await lade_einstieg_quellen(db, user_id, EINSTIEG_QUELLEN[mode])
+    if mode == "insight" and not geladen["insights"]:
+        mode = "rueckblick"
+        geladen.update(await lade_einstieg_quellen(db, user_id, EINSTIEG_QUELLEN[mode] - geladen.keys()))
+    if mode == "rueckblick" and not geladen["rueckblicke"]:
+        mode = "normal"
+        geladen.update(await lade_einstieg_quellen(db, user_id, EINSTIEG_QUELLEN[mode] - geladen.keys()))
+    return mode, geladen
+
+
+class Einstiegsfragen:
+    def __init__(self, db, erzeugen: Callable[[str], Awaitable[Tuple[str, Optional[str]]]],
+                 idle_sekunden: float = ENTRY_QUESTION_IDLE_SECONDS, max_alter_stunden: float = ENTRY_QUESTION_MAX_AGE_HOURS):
+        self.db = db
+        self.erzeugen = erzeugen
+        self.idle_sekunden = idle_sekunden
+        self.max_alter = datetime.timedelta(hours=max_alter_stunden)
+        self._laufend: Dict[str, asyncio.Task] = {}
+        self._nochmal: Set[str] = set()
+        self._timer: Dict[str, asyncio.TimerHandle] = {}
+
+    async def vorbereiten(self, user_id: str):
+        """Erzeugt die nächste Frage und legt sie ab (ersetzt eine vorhandene)."""
+        # Stand vor der Erzeugung: Änderungen währenddessen machen die Frage sofort veraltet
+        stand = await aktueller_stand(self.db, user_id)
+        frage, mode = await self.erzeugen(user_id)
+        await self.db.execute(self.db.table(TABELLE).upsert({
+            "user_id": user_id,
+            "frage": frage,
+            "mode": mode,
+            "stand": stand,
+            "erstellt_am": datetime.datetime.utcnow().isoformat() + 'Z',
+        }, on_conflict="user_id"))
+        metrics.incr("entry_question.prepared")
+
+    async def abholen(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Gibt die vorbereitete Frage einmalig zurück, wenn sie noch frisch ist, sonst None."""
+        try:
+            vorrat, stand = await asyncio.gather(
+                self.db.fetch(self.db.table(TABELLE).select("frage, mode, stand, erstellt_am").eq("user_id", user_id).limit(1)),
+                aktueller_stand(self.db, user_id),
+            )
+        except Exception as e:
+            print(f"Fehler beim Laden der vorbereiteten Einstiegsfrage: {e}")
+            return None
+        if not vorrat:
+            metrics.incr("entry_question.missing")
+            return None
+        eintrag = vorrat[0]
+        # Verbrauchen: dieselbe Frage wird nicht zweimal gestellt
+        await self.db.execute(self.db.table(TABELLE).delete().eq("user_id", user_id))
+        erstellt = datetime.datetime.fromisoformat(eintrag["erstellt_am"].replace("Z", "+00:00")).replace(tzinfo=None)
+        if eintrag["stand"] != stand or datetime.datetime.utcnow() - erstellt > self.max_alter:
+            metrics.incr("entry_question.stale")
+            return None
+        metrics.incr("entry_question.served_prepared")
+        return eintrag
+
+    def im_hintergrund(self, user_id: str):
+        """Startet die Vorbereitung; läuft schon eine, wird danach noch einmal erzeugt."""
+        if user_id in self._laufend:
+            self._nochmal.add(user_id)
+            return
+        task = asyncio.create_task(self._lauf(user_id))
+        self._laufend[user_id] = task
+
+    async def _lauf(self, user_id: str):
+        try:
+            while True:
+                self._nochmal.discard(user_id)
+                try:
+                    await self.vorbereiten(user_id)
+                except Exception as e:
+                    print(f"Fehler beim Vorbereiten der Einstiegsfrage für User {user_id}: {e}")
+                if user_id not in self._nochmal:
+                    return
+        finally:
+            self._laufend.pop(user_id, None)
+
+    def nach_turn(self, user_id: str):
+        """Nach jedem Chat-Turn: Vorbereitung erst, wenn die Sitzung idle_sekunden lang ruht."""
+        if user_id in self._timer:
+            self._timer[user_id].cancel()
+        self._timer[user_id] = asyncio.get_running_loop().call_later(self.idle_sekunden, self._sitzung_beendet, user_id)
+
+    def _sitzung_beendet(self, user_id: str):
+        self._timer.pop(user_id, None)
+        self.im_hintergrund(user_id)
+
+    async def beenden(self, timeout: float = 10.0):
+        """Beim Herunterfahren: Timer stoppen und kurz auf laufende Vorbereitungen warten."""
+        for handle in self._timer.values():
+            handle.cancel()
+        self._timer.clear()
+        if self._laufend:
+            await asyncio.wait(list(self._laufend.values()), timeout=timeout)
@@ -0,0 +1,119 @@
+"""Idempotenz-Keys und Single-Flight für schreibende Endpunkte.
+
+Der Client schickt pro Absendevorgang einen Header "Idempotency-Key" mit
+und verwendet ihn bei Wiederholungen (Doppelklick, Retry nach langsamer
+Antwort) erneut. Läuft die Anfrage mit diesem Key noch, hängt sich das
+Duplikat an sie an; ist sie fertig, wird die gespeicherte Antwort innerhalb
+von IDEMPOTENCY_TTL_SECONDS erneut ausgeliefert. So entstehen weder doppelte
+LLM-Aufrufe noch doppelte Zeilen.
+
+Fehler werden nicht gespeichert – eine Wiederholung nach einem Fehler läuft
+neu. Eine Beanspruchung, die nie zurückgemeldet wird, verfällt nach
+IDEMPOTENCY_TTL_SECONDS. Der Speicher ist prozesslokal.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from metrics import metrics
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "2000"))
+
+
+class IdempotenzKonflikt(Exception):
+    """Derselbe Key wurde mit einer anderen Anfrage wiederverwendet."""
+
+
+def fingerabdruck(daten: Any) -> str:
+    return hashlib.sha256(json.dumps(daten, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class Idempotenz:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._laufend: Dict[str, Tuple[str, asyncio.Future, float]] = {}
+        self._fertig: "OrderedDict[str, Tuple[str, float, Any]]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _aufraeumen(self):
+        jetzt = time.monotonic()
+        for key in [k for k, (_, _, start) in self._laufend.items() if jetzt - start > self.ttl]:
+            metrics.incr("idempotency.expired")
+            self.fehlgeschlagen(key, RuntimeError("Ursprüngliche Anfrage nicht abgeschlossen"))
+        while self._fertig:
+            key, (_, zeitpunkt, _) = next(iter(self._fertig.items()))
+            if jetzt - zeitpunkt <= self.ttl and len(self._fertig) <= self.max_keys:
+                break
+            del self._fertig[key]
+
+    def beanspruchen(self, key: str, fp: str) -> Optional[Awaitable[Any]]:
+        """None: der Aufrufer führt die Anfrage aus und meldet sie mit abschliessen()/fehlgeschlagen() zurück.
+
+        Sonst ein Awaitable mit dem Ergebnis der laufenden bzw. bereits beendeten Anfrage.
+        """
+        self._aufraeumen()
+        if key in self._fertig:
+            gespeichert_fp, _, ergebnis = self._fertig[key]
+            if gespeichert_fp != fp:
+                raise IdempotenzKonflikt(key)
+            metrics.incr("idempotency.replayed")
+            return self._sofort(copy.deepcopy(ergebnis))
+        if key in self._laufend:
+            laufend_fp, future, _ = self._laufend[key]
+            if laufend_fp != fp:
+                raise IdempotenzKonflikt(key)
+            metrics.incr("idempotency.joined")
+            return asyncio.shield(future)
+        self._laufend[key] = (fp, asyncio.get_running_loop().create_future(), time.monotonic())
+        metrics.incr("idempotency.executed")
+        return None
+
+    @staticmethod
+    async def _sofort(ergebnis: Any) -> Any:
+        return ergebnis
+
+    def abschliessen(self, key: str, ergebnis: Any):
+        eintrag = self._laufend.pop(key, None)
+        if eintrag is None:
+            return  # Beanspruchung schon verfallen
+        fp, future, _ = eintrag
+        self._fertig[key] = (fp, time.monotonic(), copy.deepcopy(ergebnis))
+        if not future.done():
+            future.set_result(ergebnis)
+
+    def fehlgeschlagen(self, key: str, fehler: BaseException):
+        eintrag = self._laufend.pop(key, None)
+        if eintrag and not eintrag[1].done():
+            eintrag[1].set_exception(fehler)
+            # Ohne wartende Duplikate soll die Exception nicht als "never retrieved" gemeldet werden
+            eintrag[1].exception()
+
+    async def ausfuehren(self, key: Optional[str], fp: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Führt factory() höchstens einmal pro Key aus; ohne Key wie ein normaler Aufruf."""
+        if not key:
+            return await factory()
+        vorhanden = self.beanspruchen(key, fp)
+        if vorhanden is not None:
+            return await vorhanden
+        # Als eigener Task: bricht der erste Client ab, bekommen angehängte Duplikate trotzdem das Ergebnis
+        task = asyncio.ensure_future(factory())
+
+        def fertig(t: asyncio.Task):
+            self._tasks.discard(t)
+            if t.cancelled():
+                self.fehlgeschlagen(key, RuntimeError("Ursprüngliche Anfrage abgebrochen"))
+            elif t.exception() is not None:
+                self.fehlgeschlagen(key, t.exception())
+            else:
+                self.abschliessen(key, t.result())
+
+        self._tasks.add(task)
+        task.add_done_callback(fertig)
+        return await asyncio.shield(task)
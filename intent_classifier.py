@@ -0,0 +1,267 @@
+"""Lokaler Fast-Path für die Intent-Erkennung im Chat.
+
+Eindeutige Fälle werden ohne LLM-Aufruf entschieden: über Regeln für
+typische deutsche Formulierungen ("jeden Montag", "lösch das To-Do",
+"bis Freitag") und ein kleines lineares Modell auf Wort- und
+Zeichen-N-Grammen. Schreibende Intents (To-Do, Routine, Löschen, Archivieren)
+nimmt der Fast-Path nur, wenn Regel und Modell übereinstimmen – eine lose
+Regel allein ("jeden Tag glücklicher sein") legt nichts an. Ohne Aktionswort
+ist eine Nachricht sicherer Chat. Alles andere entscheidet das LLM.
+
+Das Modell lernt aus den Intents, die das LLM bereits vergeben hat. Diese
+landen in der Tabelle intent_labels (user_id, message, intent, quelle,
+timestamp):
+
+    python intent_classifier.py export --output intent_labels.jsonl
+    python intent_classifier.py train --input intent_labels.jsonl --output intent_model.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "intent_model.json")
+INTENT_FAST_PATH_THRESHOLD = float(os.getenv("INTENT_FAST_PATH_THRESHOLD", "0.85"))
+
+INTENTS = ["todo", "routine", "todo_update", "todo_delete", "archive_profile", "routine_datum", "chat"]
+
+_TAGE = r"(montag|dienstag|mittwoch|donnerstag|freitag|samstag|sonntag)"
+_ZEITPLAN = re.compile(
+    rf"\b(jede[nrs]?\s+(tag|woche|monat|morgen|abend|{_TAGE})|{_TAGE}s|täglich|wöchentlich|monatlich|jährlich"
+    r"|alle\s+(\d+|zwei|drei|vier|sechs)\s+(tage|wochen|monate))\b"
+)
+_ABSICHT = re.compile(r"\b(routine|erstell\w*|richte\w*|einrichten|tracken|erinner\w*|ich\s+(muss|will|möchte|sollte))\b")
+_FRIST = re.compile(rf"\bbis\s+(spätestens\s+)?(morgen|übermorgen|{_TAGE}|ende|nächste\w*|zum|\d)")
+_TODO_WORT = re.compile(r"\b(to-?dos?|aufgabe|notier\w*|erinner\w*|ich\s+muss|muss\s+ich)\b")
+_TODO_ANLEGEN = re.compile(r"\b(erstell\w*|mach\w*|leg\w*|schreib\w*|notier\w*)\b.*\bto-?do\b")
+_LOESCHEN = re.compile(r"\b(lösch\w*|entferne|entfernen|streiche|streichen|rausnehmen|raus\s+nehmen)\b")
+# Zustandsziele ("jeden Tag glücklicher sein") sind keine wiederkehrende Tätigkeit
+_ZUSTAND = re.compile(r"\b(sein|werden|bleiben)\W*$")
+# Profiländerungen ("entferne X aus meinem Profil") sind kein To-Do-Löschen
+_PROFIL = re.compile(r"\bprofil\w*\b")
+_VORBEI = re.compile(r"\b(ist|sind|war|waren)\s+((jetzt|schon|alle|bereits|endlich)\s+)*(vorbei|abgeschlossen|vergangen)\b")
+# Alles, was auf eine Aktion hindeuten könnte; ohne diese Wörter ist eine Nachricht normaler Chat
+_AKTIONSWORT = re.compile(
+    r"\b(to-?dos?|aufgabe|routine|termin\w*|erinner\w*|notier\w*|lösch\w*|entfern\w*|streich\w*|raus\w*"
+    r"|vorbei|abgeschlossen|vergangen|änder\w*|korrigier\w*|verschieb\w*|datum|relevanz|priorität"
+    r"|bis|jede[nrs]?|täglich|wöchentlich|monatlich|jährlich|alle|morgen|übermorgen|tracken|richte\w*|erstell\w*)\b"
+)
+
+
+class Vorhersage(NamedTuple):
+    intent: Optional[str]
+    konfidenz: float
+    quelle: str  # "regel", "modell" oder "keine"
+
+
+def normalisiere(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _kontext_offen(last_ai_response: str) -> bool:
+    """Rückfragen und Bestätigungen zu To-Dos/Routinen machen Korrekturen und Terminantworten möglich – dann entscheidet das LLM."""
+    t = normalisiere(last_ai_response or "")
+    return bool(t) and (t.startswith(("✅", "❌")) or "to-do" in t or "routine" in t or "welche" in t or "an welchem" in t)
+
+
+def regel_intents(text: str) -> List[str]:
+    """Alle schreibenden Intents, auf die eine Regel passt."""
+    t = normalisiere(text)
+    treffer = []
+    if _LOESCHEN.search(t) and (_TODO_WORT.search(t) or _LOESCHEN.match(t)) and not _PROFIL.search(t):
+        treffer.append("todo_delete")
+    if _ZEITPLAN.search(t) and _ABSICHT.search(t) and not _ZUSTAND.search(t):
+        treffer.append("routine")
+    if _TODO_ANLEGEN.search(t) or (_FRIST.search(t) and _TODO_WORT.search(t)):
+        treffer.append("todo")
+    if _VORBEI.search(t):
+        treffer.append("archive_profile")
+    return treffer
+
+
+def regel_intent(text: str) -> Optional[Vorhersage]:
+    """Der Regel-Intent, wenn genau eine Regel passt; mehrere Anliegen in einer Nachricht entscheidet das LLM."""
+    treffer = regel_intents(text)
+    return Vorhersage(treffer[0], 0.9, "regel") if len(treffer) == 1 else None
+
+
+def merkmale(text: str) -> List[str]:
+    """Wort-Unigramme, Wort-Bigramme und Zeichen-Trigramme (binär)."""
+    woerter = re.findall(r"\w+", normalisiere(text))
+    f = {"w:" + w for w in woerter}
+    f.update("b:" + a + "_" + b for a, b in zip(woerter, woerter[1:]))
+    for w in woerter:
+        w = f"<{w}>"
+        f.update("c:" + w[i:i + 3] for i in range(len(w) - 2))
+    return sorted(f)
+
+
+class NGramModell:
+    """Multinomiale logistische Regression über N-Gramm-Merkmale, ohne externe Abhängigkeiten."""
+
+    def __init__(self, labels: List[str], gewichte: Dict[str, Dict[str, float]], bias: Dict[str, float]):
+        self.labels = labels
+        self.gewichte = gewichte
+        self.bias = bias
+
+    def wahrscheinlichkeiten(self, text: str) -> Dict[str, float]:
+        scores = dict(self.bias)
+        for f in merkmale(text):
+            for label, w in self.gewichte.get(f, {}).items():
+                scores[label] += w
+        m = max(scores.values())
+        exp = {label: math.exp(s - m) for label, s in scores.items()}
+        summe = sum(exp.values())
+        return {label: v / summe for label, v in exp.items()}
+
+    def vorhersagen(self, text: str) -> Tuple[str, float]:
+        probs = self.wahrscheinlichkeiten(text)
+        label = max(probs, key=probs.get)
+        return label, probs[label]
+
+    @classmethod
+    def trainiere(cls, beispiele: List[Tuple[str, str]], epochen: int = 15, lernrate: float = 0.3, seed: int = 0) -> "NGramModell":
+        labels = sorted({intent for _, intent in beispiele})
+        modell = cls(labels, {}, {label: 0.0 for label in labels})
+        daten = [(merkmale(text), intent) for text, intent in beispiele]
+        rng = random.Random(seed)
+        for epoche in range(epochen):
+            rng.shuffle(daten)
+            lr = lernrate / (1 + epoche * 0.2)
+            for features, intent in daten:
+                scores = dict(modell.bias)
+                for f in features:
+                    for label, w in modell.gewichte.get(f, {}).items():
+                        scores[label] += w
+                m = max(scores.values())
+                exp = {label: math.exp(s - m) for label, s in scores.items()}
+                summe = sum(exp.values())
+                for label in labels:
+                    grad = exp[label] / summe - (1.0 if label == intent else 0.0)
+                    if abs(grad) < 1e-4:
+                        continue
+                    modell.bias[label] -= lr * grad
+                    for f in features:
+                        zeile = modell.gewichte.setdefault(f, {})
+                        zeile[label] = zeile.get(label, 0.0) - lr * grad
+        return modell
+
+    def speichere(self, path: str):
+        gewichte = {}
+        for f, zeile in self.gewichte.items():
+            zeile = {label: round(w, 4) for label, w in zeile.items() if abs(w) >= 1e-3}
+            if zeile:
+                gewichte[f] = zeile
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"labels": self.labels, "bias": self.bias, "gewichte": gewichte}, fh, ensure_ascii=False)
+
+    @classmethod
+    def lade(cls, path: str) -> "NGramModell":
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        return cls(data["labels"], data["gewichte"], data["bias"])
+
+
+class IntentClassifier:
+    def __init__(self, modell: Optional[NGramModell] = None, schwelle: float = INTENT_FAST_PATH_THRESHOLD):
+        self.modell = modell
+        self.schwelle = schwelle
+
+    @classmethod
+    def aus_datei(cls, path: str = INTENT_MODEL_PATH, schwelle: float = INTENT_FAST_PATH_THRESHOLD) -> "IntentClassifier":
+        """Lädt das trainierte Modell, falls vorhanden; sonst arbeitet der Fast-Path nur mit Regeln."""
+        modell = None
+        if os.path.exists(path):
+            try:
+                modell = NGramModell.lade(path)
+            except Exception as e:
+                print(f"Fehler beim Laden des Intent-Modells '{path}': {e}")
+        return cls(modell, schwelle)
+
+    def vorhersagen(self, text: str, last_ai_response: str = "") -> Vorhersage:
+        if _kontext_offen(last_ai_response):
+            return Vorhersage(None, 0.0, "keine")
+        treffer = regel_intents(text)
+        modell_intent, modell_konfidenz = self.modell.vorhersagen(text) if self.modell else (None, 0.0)
+        # Schreibende Intents nur, wenn Regel und Modell unabhängig voneinander dasselbe sagen
+        if len(treffer) == 1 and modell_intent == treffer[0] and modell_konfidenz >= self.schwelle:
+            return Vorhersage(modell_intent, modell_konfidenz, "regel+modell")
+        if treffer or (modell_intent not in (None, "chat") and modell_konfidenz >= self.schwelle):
+            return Vorhersage(None, 0.0, "keine")
+        if modell_intent == "chat" and modell_konfidenz >= self.schwelle:
+            return Vorhersage("chat", modell_konfidenz, "modell")
+        if not _AKTIONSWORT.search(normalisiere(text)):
+            return Vorhersage("chat", 0.9, "regel")
+        return Vorhersage(None, 0.0, "keine")
+
+    def schnell(self, text: str, last_ai_response: str = "") -> Optional[Vorhersage]:
+        """Gibt die Vorhersage nur zurück, wenn sie sicher genug für den Fast-Path ist."""
+        vorhersage = self.vorhersagen(text, last_ai_response)
+        return vorhersage if vorhersage.intent and vorhersage.konfidenz >= self.schwelle else None
+
+
+def _exportiere(output: str):
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    anzahl, start, seite = 0, 0, 1000
+    with open(output, "w", encoding="utf-8") as fh:
+        while True:
+            rows = client.table("intent_labels").select("message, intent").order("id").range(start, start + seite - 1).execute().data
+            for row in rows:
+                if row.get("message") and row.get("intent") in INTENTS:
+                    fh.write(json.dumps({"message": row["message"], "intent": row["intent"]}, ensure_ascii=False) + "\n")
+                    anzahl += 1
+            if len(rows) < seite:
+                break
+            start += seite
+    print(f"{anzahl} Beispiele nach {output} exportiert.")
+
+
+def _trainiere(input_path: str, output: str, schwelle: float):
+    with open(input_path, encoding="utf-8") as fh:
+        beispiele = [(r["message"], r["intent"]) for r in map(json.loads, fh) if r.get("message")]
+    if len(beispiele) < 10:
+        raise SystemExit(f"Zu wenige Beispiele ({len(beispiele)}) zum Trainieren.")
+
+    # Hold-out-Auswertung: Genauigkeit gesamt und auf dem Fast-Path (über der Schwelle)
+    gemischt = list(beispiele)
+    random.Random(0).shuffle(gemischt)
+    grenze = max(1, len(gemischt) // 5)
+    test, train = gemischt[:grenze], gemischt[grenze:]
+    modell = NGramModell.trainiere(train)
+    richtig = schnell = schnell_richtig = 0
+    for text, intent in test:
+        vorhersage, konfidenz = modell.vorhersagen(text)
+        richtig += vorhersage == intent
+        if konfidenz >= schwelle:
+            schnell += 1
+            schnell_richtig += vorhersage == intent
+    print(f"Hold-out: {len(test)} Beispiele, Genauigkeit {richtig / len(test):.1%}")
+    print(f"Fast-Path (Schwelle {schwelle}): Abdeckung {schnell / len(test):.1%}, Genauigkeit {schnell_richtig / schnell:.1%}" if schnell else
+          f"Fast-Path (Schwelle {schwelle}): keine Vorhersage über der Schwelle")
+
+    NGramModell.trainiere(beispiele).speichere(output)
+    print(f"Modell mit {len(beispiele)} Beispielen nach {output} gespeichert.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Training und Export für den lokalen Intent-Classifier")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+    p_export = sub.add_parser("export", help="Vom LLM gelabelte Intents aus Supabase exportieren")
+    p_export.add_argument("--output", default="intent_labels.jsonl")
+    p_train = sub.add_parser("train", help="N-Gramm-Modell trainieren und speichern")
+    p_train.add_argument("--input", default="intent_labels.jsonl")
+    p_train.add_argument("--output", default=INTENT_MODEL_PATH)
+    p_train.add_argument("--schwelle", type=float, default=INTENT_FAST_PATH_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.befehl == "export":
+        _exportiere(args.output)
+    else:
+        _trainiere(args.input, args.output, args.schwelle)
@@ -0,0 +1,102 @@
+"""Ergebnis-Cache für deterministische LLM-Aufrufe (temperature=0).
+
+Die Extraktoren (Intent, To-Do-Felder, Routinen, Archivierung, ...) liefern
+für dieselbe Eingabe am selben Tag dieselbe Antwort. Der Cache-Key ist ein
+Hash aus Modell, Prompt (Leerraum zusammengefasst), Antwortformat und Datum; kurze,
+häufige Antworten wie "ja", "lösch das" oder "Dienstag" kommen so ohne
+Netzwerkaufruf zurück.
+
+Erste Stufe ist ein begrenzter LRU-Speicher mit TTL im Prozess. Ist
+LLM_CACHE_PATH gesetzt, gibt es zusätzlich eine SQLite-Datei als zweite
+Stufe, die Neustarts übersteht.
+"""
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import metrics
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+
+
+def _normalisiere(text: str) -> str:
+    # Nur Leerraum zusammenfassen: Groß-/Kleinschreibung kann die Antwort ändern (Namen, Zitate)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(kwargs: Dict[str, Any], datum: Optional[str] = None) -> str:
+    """Hash über Modell, Nachrichten (Leerraum zusammengefasst), Antwortformat, max_tokens und Datum."""
+    teile = {
+        "model": kwargs.get("model"),
+        "messages": [(m.get("role"), _normalisiere(str(m.get("content", "")))) for m in kwargs.get("messages", [])],
+        "response_format": kwargs.get("response_format"),
+        "max_tokens": kwargs.get("max_tokens"),
+        "datum": datum or datetime.date.today().isoformat(),
+    }
+    return hashlib.sha256(json.dumps(teile, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, max_eintraege: int = LLM_CACHE_MAX_ENTRIES, ttl: int = LLM_CACHE_TTL_SECONDS, pfad: str = LLM_CACHE_PATH):
+        self.max_eintraege = max_eintraege
+        self.ttl = ttl
+        self._speicher: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()
+        if pfad:
+            self._disk = sqlite3.connect(pfad, check_same_thread=False)
+            self._disk.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, inhalt TEXT NOT NULL, erstellt REAL NOT NULL)")
+            self._disk.execute("DELETE FROM llm_cache WHERE erstellt < ?", (time.time() - ttl,))
+            self._disk.commit()
+
+    def _merke(self, key: str, erstellt: float, inhalt: str):
+        self._speicher[key] = (erstellt, inhalt)
+        self._speicher.move_to_end(key)
+        while len(self._speicher) > self.max_eintraege:
+            self._speicher.popitem(last=False)
+
+    def _lies_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        with self._disk_lock:
+            row = self._disk.execute("SELECT erstellt, inhalt FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _schreibe_disk(self, key: str, erstellt: float, inhalt: str):
+        with self._disk_lock:
+            self._disk.execute("INSERT OR REPLACE INTO llm_cache (key, inhalt, erstellt) VALUES (?, ?, ?)", (key, inhalt, erstellt))
+            self._disk.commit()
+
+    async def hole(self, key: str, tag: str) -> Optional[str]:
+        eintrag = self._speicher.get(key)
+        if eintrag and time.time() - eintrag[0] <= self.ttl:
+            self._speicher.move_to_end(key)
+            metrics.incr(f"llm_cache.{tag}.hit")
+            return eintrag[1]
+        if self._disk is not None:
+            eintrag = await asyncio.to_thread(self._lies_disk, key)
+            if eintrag and time.time() - eintrag[0] <= self.ttl:
+                self._merke(key, *eintrag)
+                metrics.incr(f"llm_cache.{tag}.hit")
+                metrics.incr(f"llm_cache.{tag}.hit_disk")
+                return eintrag[1]
+        metrics.incr(f"llm_cache.{tag}.miss")
+        return None
+
+    async def speichere(self, key: str, inhalt: str):
+        erstellt = time.time()
+        self._merke(key, erstellt, inhalt)
+        if self._disk is not None:
+            await asyncio.to_thread(self._schreibe_disk, key, erstellt, inhalt)
+
+    def schliessen(self):
+        if self._disk is not None:
+            self._disk.close()
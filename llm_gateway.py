@@ -0,0 +1,101 @@
+"""Nicht-blockierendes Gateway für alle OpenAI-Aufrufe.
+
+Alle LLM-Aufrufe der App laufen über eine gemeinsame LLMGateway-Instanz:
+ein AsyncOpenAI-Client mit geteiltem Connection-Pool, Timeouts pro Aufruf und
+einem globalen Limit für gleichzeitige Anfragen. So blockiert ein langsamer
+gpt-4o-Aufruf nicht mehr den Event-Loop und damit alle anderen Nutzer.
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from llm_cache import LLMCache, cache_key
+from metrics import metrics
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[LLMCache] = None,
+    ):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        if client is None:
+            # Ein Pool für alle Aufrufe; etwas größer als das Concurrency-Limit für Keep-Alive
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_concurrency * 2, max_keepalive_connections=max_concurrency),
+            )
+            client = AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=max_retries)
+        self._client = client
+        self._cache = cache if cache is not None else LLMCache()
+
+    @staticmethod
+    def _erfasse_usage(tag: str, usage: Any):
+        """Zählt Prompt-, gecachte und Completion-Tokens pro Aufruf-Tag (llm.<tag>.* in /metrics)."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        metrics.incr(f"llm.{tag}.calls")
+        metrics.incr(f"llm.{tag}.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        metrics.incr(f"llm.{tag}.cached_tokens", getattr(details, "cached_tokens", 0) or 0)
+        metrics.incr(f"llm.{tag}.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+    async def complete(self, *, timeout: Optional[float] = None, tag: Optional[str] = None, cache: bool = False, **kwargs: Any):
+        """Entspricht client.chat.completions.create(...), aber awaitable und begrenzt.
+
+        Mit cache=True (nur bei temperature=0) wird eine gleiche Anfrage vom selben Tag aus dem
+        Ergebnis-Cache beantwortet; die Antwort hat dann nur choices[0].message.content.
+        """
+        tag = tag or kwargs.get("model", "unbekannt")
+        key = cache_key(kwargs) if cache and kwargs.get("temperature") == 0 and kwargs.get("n", 1) == 1 else None
+        if key is not None:
+            inhalt = await self._cache.hole(key, tag)
+            if inhalt is not None:
+                return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=inhalt), finish_reason="stop")], usage=None)
+        async with self._semaphore:
+            response = await self._client.chat.completions.create(timeout=timeout or self.timeout, **kwargs)
+        self._erfasse_usage(tag, getattr(response, "usage", None))
+        if key is not None and response.choices and getattr(response.choices[0], "finish_reason", "stop") == "stop" and response.choices[0].message.content:
+            await self._cache.speichere(key, response.choices[0].message.content)
+        return response
+
+    async def stream(self, *, timeout: Optional[float] = None, tag: Optional[str] = None, **kwargs: Any) -> AsyncIterator[str]:
+        """Streamt die Antwort (stream=True) und liefert die Text-Deltas, sobald sie ankommen.
+
+        Der Concurrency-Slot bleibt belegt, bis der Stream vollständig gelesen oder abgebrochen ist.
+        """
+        async with self._semaphore:
+            stream = await self._client.chat.completions.create(
+                stream=True, stream_options={"include_usage": True}, timeout=timeout or self.timeout, **kwargs
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None) is not None:
+                    self._erfasse_usage(tag or kwargs.get("model", "unbekannt"), chunk.usage)
+
+    async def embed(self, texts: List[str], *, model: str, dimensions: Optional[int] = None, timeout: Optional[float] = None) -> List[List[float]]:
+        """Embeddings für mehrere Texte in einem Aufruf, in Eingabereihenfolge."""
+        extra = {"dimensions": dimensions} if dimensions else {}
+        async with self._semaphore:
+            response = await self._client.embeddings.create(model=model, input=texts, timeout=timeout or self.timeout, **extra)
+        self._erfasse_usage("embedding", getattr(response, "usage", None))
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    async def aclose(self):
+        await self._client.close()
+        self._cache.schliessen()
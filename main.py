@@ -1,19 +1,41 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi import HTTPException
-from openai import OpenAI
+from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import Header, HTTPException
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from typing import Optional, Dict, Any, List, Union, Literal
+from supabase import create_client
+from typing import Optional, Dict, Any, List, Tuple, Union, Literal
 import os
+import asyncio
 import datetime
 import random
 import json
 import re
 import calendar
 
+from chat_context import lade_chat_kontext
+from llm_gateway import LLMGateway
+from data_access import Database
+from post_processing import PostProcessor
+from turn_analysis import TurnAnalysis, analysiere_turn
+from intent_classifier import INTENTS, IntentClassifier
+from metrics import metrics
+from speculation import Spekulation
+from prompts import CHAT_ANWEISUNGEN, EINSTIEG_ANWEISUNGEN
+from vector_index import EMBEDDING_DIM, EMBEDDING_MODEL, VektorIndex, berichte_nachindexieren, frage_eintrag, gedaechtnis_eintrag, indexiere, nachindexieren, profil_eintrag, profil_key
+from token_budget import CHAT_CONTEXT_TOKEN_BUDGET, START_CONTEXT_TOKEN_BUDGET, Abschnitt, TokenBudget
+from rolling_summary import RollingSummary
+from idempotency import Idempotenz, IdempotenzKonflikt, fingerabdruck
+from entry_questions import ENTRY_QUESTION_PROMPT_RECENT, Einstiegsfragen, neuartige_frage, quellen_fuer_modus
+from profile_context import ProfilCache, relevante_attribute
+from profile_writes import ProfilAenderungen
+from profile_extraction import ProfilExtraktion
+from digests import Digests, periode_von
+from report_scheduler import BerichtScheduler, aktive_nutzer
+from reports import Berichte
+from streaming import ChatStreams
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -23,24 +45,90 @@ SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 if not OPENAI_API_KEY or not SUPABASE_URL or not SUPABASE_KEY:
     raise RuntimeError("Fehlende Umgebungsvariablen – bitte .env prüfen (OPENAI_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_KEY)")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+llm = LLMGateway(api_key=OPENAI_API_KEY)
+db = Database(create_client(SUPABASE_URL, SUPABASE_KEY))
+post_processor = PostProcessor()
+intent_classifier = IntentClassifier.aus_datei()
+rolling_summary = RollingSummary(db, llm)
+idempotenz = Idempotenz()
+chat_streams = ChatStreams(idempotenz, "Entschuldige, es gab ein Problem beim Verarbeiten deiner Anfrage. Bitte versuche es später noch einmal.")
+profil_cache = ProfilCache(db)
+digests = Digests(db, llm)
+profil_extraktion = ProfilExtraktion(lambda user_id, austausche: extrahiere_und_speichere_profil_details(user_id, austausche))
+# Vorbereitete Einstiegsfragen (_erzeuge_einstiegsfrage ist weiter unten definiert)
+einstiegsfragen = Einstiegsfragen(db, lambda user_id: _erzeuge_einstiegsfrage(user_id))
+# Neue Berichte werden sofort indexiert (_indexiere_im_hintergrund ist weiter unten definiert)
+berichte = Berichte(db, llm, digests, lambda user_id, zeilen: _indexiere_im_hintergrund(user_id, [gedaechtnis_eintrag(user_id, row) for row in zeilen]))
+# Fällige Berichte im Hintergrund erzeugen
+bericht_scheduler = BerichtScheduler(db, berichte.erzeugen, lambda: aktive_nutzer(db))
+
+# Anteil der Fast-Path-Treffer, die zusätzlich vom LLM geprüft werden (Messung der Abweichungsrate)
+INTENT_SHADOW_RATE = float(os.getenv("INTENT_SHADOW_RATE", "0.1"))
+vektor_index = VektorIndex()
+# Anzahl relevanter Gedächtnis-/Berichts- bzw. Profil-Einträge für den Chat-Kontext
+VECTOR_TOP_K = int(os.getenv("VECTOR_TOP_K", "8"))
+VECTOR_TOP_K_PROFIL = int(os.getenv("VECTOR_TOP_K_PROFIL", "15"))
+
+# Chat-Antwort schon während der Intent-Analyse spekulativ erzeugen
+SPECULATIVE_CHAT = os.getenv("SPECULATIVE_CHAT", "0") == "1"
+# Berichte in diesem Prozess im Hintergrund erzeugen (bei mehreren Instanzen reicht einer)
+REPORT_SCHEDULER = os.getenv("REPORT_SCHEDULER", "1") == "1"
+# Berichte anderer Prozesse (report_batch.py) in diesem Abstand nachindexieren, Rückschau in Tagen
+REPORT_INDEX_INTERVAL_SECONDS = float(os.getenv("REPORT_INDEX_INTERVAL_SECONDS", "600"))
+REPORT_INDEX_LOOKBACK_DAYS = int(os.getenv("REPORT_INDEX_LOOKBACK_DAYS", "8"))
 
 async def _save_conversation_entry(user_id: str, user_input: Optional[str], ai_response: Optional[str], ai_prompt: Optional[str]):
     """Speichert einen neuen Eintrag in der Konversationshistorie."""
     try:
-        supabase.table("conversation_history").insert({
+        await db.execute(db.table("conversation_history").insert({
             "user_id": user_id,
             "user_input": user_input,
             "ai_response": ai_response,
             "ai_prompt": ai_prompt,
             "timestamp": datetime.datetime.utcnow().isoformat() + 'Z'
-        }).execute()
+        }))
     except Exception as e:
         print(f"Fehler beim Speichern der Konversationshistorie: {e}")
 
+def _indexiere_im_hintergrund(user_id: str, eintraege: list):
+    """Embeddings für neue Gedächtnis-, Berichts- oder Profil-Einträge im Hintergrund berechnen und indexieren."""
+    if eintraege:
+        post_processor.submit(user_id, "vektor_index", indexiere(vektor_index, llm, eintraege))
+
+async def _berichte_nachindexieren():
+    """Indexiert regelmäßig Berichte, die ein anderer Prozess (report_batch.py) ohne Vektor-Index gespeichert hat."""
+    while True:
+        try:
+            seit = (datetime.datetime.utcnow() - datetime.timedelta(days=REPORT_INDEX_LOOKBACK_DAYS)).isoformat() + 'Z'
+            await berichte_nachindexieren(vektor_index, llm, db, seit)
+        except Exception as e:
+            print(f"Fehler beim Nachindexieren neuer Berichte: {e}")
+        await asyncio.sleep(REPORT_INDEX_INTERVAL_SECONDS)
+
+_hintergrund_tasks = []
+
 app = FastAPI()
 
+@app.on_event("startup")
+async def _start_background():
+    if REPORT_SCHEDULER:
+        bericht_scheduler.starten()
+    _hintergrund_tasks.append(asyncio.create_task(_berichte_nachindexieren()))
+
+@app.on_event("shutdown")
+async def _close_clients():
+    for task in _hintergrund_tasks:
+        task.cancel()
+    await asyncio.gather(*_hintergrund_tasks, return_exceptions=True)
+    await bericht_scheduler.beenden()
+    # Laufende Stream-Antworten zuerst: sie planen noch Nacharbeiten ein
+    await chat_streams.beenden()
+    await profil_extraktion.beenden()
+    await post_processor.drain()
+    await einstiegsfragen.beenden()
+    await llm.aclose()
+    db.close()
+
 # CORS aktivieren
 app.add_middleware(
     CORSMiddleware,
@@ -109,20 +197,23 @@ class TodoEdit(BaseModel):
     category: Optional[str] = None
     
 # Funktion zur Extraktion und Speicherung von erweiterten Profildetails im EAV-Modell
-async def extrahiere_und_speichere_profil_details(user_id: str, user_input: str, ai_response: str, ai_prompt: str):
+async def extrahiere_und_speichere_profil_details(user_id: str, austausche: List[Dict[str, str]]):
+    """Extrahiert Profildetails aus mehreren gesammelten Austauschen (siehe profile_extraction.py)."""
     
-    # Bestehendes dynamisches Profil aus der 'profile'-Tabelle abrufen
-    # Die 'profile'-Tabelle ist jetzt unsere EAV-Tabelle
-    current_dynamic_profile_response = supabase.table("profile") \
-        .select("attribute_name, attribute_value") \
-        .eq("user_id", user_id) \
-        .eq("archived", False) \
-        .execute().data
-    
-    existing_dynamic_profile: Dict[str, str] = {
-        item["attribute_name"]: item["attribute_value"] 
-        for item in current_dynamic_profile_response
-    }
+    # Bestehendes dynamisches Profil (EAV-Tabelle 'profile'); aus dem Cache, solange sich nichts geändert hat
+    existing_dynamic_profile = await profil_cache.laden(user_id)
+    # Im Prompt nur die zu den Austauschen passenden Einträge plus die Liste aller Schlüssel
+    texte = [t for a in austausche for t in (a["ai_prompt"], a["user_input"], a["ai_response"])]
+    relevant_profile = relevante_attribute(existing_dynamic_profile, texte)
+
+    verlauf = []
+    letzte_frage = ""
+    for nr, a in enumerate(austausche, 1):
+        if a["ai_prompt"] and a["ai_prompt"] != letzte_frage:
+            verlauf.append(f'AI-Einstiegsfrage: "{a["ai_prompt"]}"')
+            letzte_frage = a["ai_prompt"]
+        verlauf.append(f'{nr}. User-Eingabe: "{a["user_input"]}"\n       AI-Antwort: "{a["ai_response"]}"')
+    verlauf_text = "\n    ".join(verlauf)
     
     system_prompt = f"""
     Du bist ein spezialisierter Assistent, der wichtige persönliche Informationen über den Benutzer aus Gesprächen extrahiert.
@@ -133,7 +224,7 @@ async def extrahiere_und_speichere_profil_details(user_id: str, user_input: str,
     - Alle Werte als Text formatieren
 
     KERNREGEL — IMMER ZUERST PRÜFEN:
-    Schau in das bestehende Profil. Gibt es bereits einen Eintrag der zum neuen Inhalt passt?
+    Schau in das bestehende Profil (relevante Einträge und Liste aller Schlüssel). Gibt es bereits einen Eintrag der zum neuen Inhalt passt?
     - JA → ergänze, aktualisiere oder korrigiere den bestehenden Eintrag. KEIN neuer Eintrag.
     - NEIN → erstelle EINEN neuen Eintrag für dieses Thema. Nie mehrere für dasselbe.
 
@@ -161,18 +252,17 @@ async def extrahiere_und_speichere_profil_details(user_id: str, user_input: str,
     """
 
     user_prompt = f"""
-    Kontext der aktuellen Unterhaltung:
-    AI-Einstiegsfrage: "{ai_prompt}"
-    User-Eingabe: "{user_input}"
-    AI-Antwort: "{ai_response}"
+    Kontext der aktuellen Unterhaltung ({len(austausche)} Austausch(e), chronologisch):
+    {verlauf_text}
     
-    Bereits bekanntes Profil: {json.dumps(existing_dynamic_profile, ensure_ascii=False)}
+    Bereits bekanntes Profil (relevante Einträge): {json.dumps(relevant_profile, ensure_ascii=False)}
+    Alle vorhandenen Schlüssel: {", ".join(sorted(existing_dynamic_profile)) or "keine"}
     
     Gib NUR die Einträge zurück die neu sind oder sich geändert haben. Nicht das gesamte Profil — nur die Differenz.
     """
 
     try:
-        response = client.chat.completions.create(
+        response = await llm.complete(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -187,87 +277,39 @@ async def extrahiere_und_speichere_profil_details(user_id: str, user_input: str,
 
         # Temporäre Kategorien ausschließen
         EXCLUDED_CATEGORIES = ['Aktuelles_Datum']
-        now = datetime.datetime.utcnow().isoformat() + 'Z'
-
-        to_upsert = []
-        to_delete = []
+        aenderungen = ProfilAenderungen(user_id)
 
         for key, value in new_extracted_profile.items():
             if key in EXCLUDED_CATEGORIES:
                 continue
             if isinstance(value, str) and "abgeschlossen" in value.lower():
-                to_delete.append(key)
-            else:
-                to_upsert.append({"user_id": user_id, "attribute_name": key, "attribute_value": value, "last_updated": now})
-
-        if to_upsert:
-            supabase.table("profile").upsert(to_upsert).execute()
-
-        for key in to_delete:
-            result = supabase.table("profile").update({"archived": True}).eq("user_id", user_id).eq("attribute_name", key).execute()
-            if not result.data:
-                # Kein exakter Key-Match — suche nach verwandten Einträgen via Keyword
+                # Ohne exakten Key-Match werden verwandte Einträge über das Keyword gefunden
                 keyword = key.replace("Termin_", "").replace("Prozess_", "").replace("_", " ")
-                related = supabase.table("profile").select("attribute_name").eq("user_id", user_id).eq("archived", False).ilike("attribute_value", f"%{keyword}%").execute().data
-                for entry in related:
-                    supabase.table("profile").update({"archived": True}).eq("user_id", user_id).eq("attribute_name", entry["attribute_name"]).execute()
+                aenderungen.archivieren(key, ersatz_stichwort=keyword)
+            else:
+                aenderungen.setzen(key, value)
 
+        # Alle Änderungen des Turns gebündelt: Upsert und Suche gleichzeitig, danach ein Update
+        gesetzt, archiviert = await aenderungen.anwenden(db, profil_cache)
+        _indexiere_im_hintergrund(user_id, [profil_eintrag(user_id, name, str(wert)) for name, wert in gesetzt.items()])
+        vektor_index.entfernen(profil_key(user_id, name) for name in archiviert)
 
     except json.JSONDecodeError as e:
         print(f"FEHLER beim Parsen der JSON-Antwort von GPT in extrahiere_und_speichere_profil_details: {e}")
         print(f"GPT-Antwort (Roh): {extracted_data_str}")
     except Exception as e:
         print(f"FEHLER bei der Profil-Extraktion oder Speicherung in extrahiere_und_speichere_profil_details: {e}")
-
-# Zusammenfassung um Token zu sparen (mit gpt-4o-mini)
-def summarize_text_with_gpt(text_to_summarize: str, summary_length: int = 200, prompt_context: str = "wichtige Punkte und Muster"):
-    if not text_to_summarize.strip():
-        return "" # Nichts zusammenfassen, wenn der Text leer ist
-
-    summary_prompt = f"""
-    Fasse den folgenden Text prägnant zusammen und konzentriere dich auf die {prompt_context}.
-    Beschränke die Zusammenfassung auf maximal {summary_length} Wörter.
-
-    Text:
-    {text_to_summarize}
-    """
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Du bist ein hilfreicher Assistent, der lange Texte zusammenfassen kann."},
-                {"role": "user", "content": summary_prompt}
-            ],
-            max_tokens=summary_length * 2,
-            temperature=0.3
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Fehler beim Zusammenfassen mit GPT: {e}")
-        return "Eine Zusammenfassung konnte nicht erstellt werden."
+        # Unklar, was geschrieben wurde – beim nächsten Mal neu lesen
+        profil_cache.verwerfen(user_id)
 
 #Abrufen der letzten 8 unbeantworteten Einstiegsfragen
 async def get_recent_entry_questions(user_id: str):
-    recent_prompts = supabase.table("conversation_history") \
+    recent_prompts = await db.execute(db.table("conversation_history") \
         .select("ai_prompt") \
         .eq("user_id", user_id) \
         .eq("user_input", "") \
         .order("timestamp", desc=True) \
-        .limit(20) \
-        .execute()
-
-    questions = [q["ai_prompt"] for q in recent_prompts.data if q["ai_prompt"]]
-    return questions
-
-async def get_recent_universum_questions(user_id: str):
-    recent_prompts = supabase.table("conversation_history") \
-        .select("ai_prompt") \
-        .eq("user_id", user_id) \
-        .eq("user_input", "") \
-        .eq("mode", "universum") \
-        .order("timestamp", desc=True) \
-        .limit(10) \
-        .execute()
+        .limit(20))
 
     questions = [q["ai_prompt"] for q in recent_prompts.data if q["ai_prompt"]]
     return questions
@@ -335,7 +377,7 @@ def calculate_next_due_date(recurrence_type: str, recurrence_day: int = None, la
     
     return None
 
-def create_recurring_todo_instance(original_todo, user_id: str):
+async def create_recurring_todo_instance(original_todo, user_id: str):
     """Erstellt eine neue Instanz eines wiederkehrenden To-Dos"""
     next_due = get_next_due_date(
         original_todo.get('recurrence_type', 'daily'),
@@ -344,7 +386,7 @@ def create_recurring_todo_instance(original_todo, user_id: str):
     )
 
     if next_due:
-        existing = supabase.table("todos").select("id").eq("user_id", user_id).eq("title", original_todo['title']).eq("is_recurring", True).eq("due_date", next_due).not_.in_("status", ["completed", "archived"]).execute().data
+        existing = await db.fetch(db.table("todos").select("id").eq("user_id", user_id).eq("title", original_todo['title']).eq("is_recurring", True).eq("due_date", next_due).not_.in_("status", ["completed", "archived"]))
         if existing:
             return None
 
@@ -369,7 +411,7 @@ def create_recurring_todo_instance(original_todo, user_id: str):
         }
 
         try:
-            result = supabase.table("todos").insert(new_todo).execute()
+            result = await db.execute(db.table("todos").insert(new_todo))
             return result.data[0] if result.data else None
         except Exception as e:
             print(f"Fehler beim Erstellen der wiederkehrenden To-Do Instanz: {e}")
@@ -378,15 +420,14 @@ def create_recurring_todo_instance(original_todo, user_id: str):
     return None
 
 # Einstiegsfrage bei neuer Interaktion
-@app.get("/start_interaction/{user_id}")
-async def start_interaction(user_id: str):
+async def _erzeuge_einstiegsfrage(user_id: str) -> Tuple[str, Optional[str]]:
+    """Erzeugt eine neue Einstiegsfrage (ohne sie zu speichern). Gibt (frage, mode) zurück."""
     # Letzte 30 Nachrichten abrufen
-    recent_interactions_data = supabase.table("conversation_history") \
+    recent_interactions_data = await db.fetch(db.table("conversation_history") \
         .select("user_input, ai_response, ai_prompt") \
         .eq("user_id", user_id) \
         .order("timestamp", desc=True) \
-        .limit(30) \
-        .execute().data
+        .limit(30))
     
     messages = [] # <--- Initialisierung der messages Liste
     # Nachrichten extrahieren
@@ -407,402 +448,330 @@ async def start_interaction(user_id: str):
 
     # Wenn keine Nachrichten vorhanden sind (erste Interaktion)
     if not messages:
-        frage_text = "Was möchtest du heute angehen? Gibt es ein neues Thema, über das du sprechen möchtest?"
-        
-        # Speichern als ai_prompt
-        try:
-            supabase.table("conversation_history").insert({
-                "user_id": user_id,
-                "user_input": "",
-                "ai_response": "",
-                "ai_prompt": frage_text,
-                "timestamp": datetime.datetime.utcnow().isoformat() + 'Z'
-            }).execute()
-        except Exception as e:
-            print(f"Fehler beim Speichern der initialen Einstiegsfrage als AI-Prompt: {e}")
-            return {"frage": frage_text}
-        
-        return {"frage": frage_text}
-
-    else:
-        # Letzte 8 Einstiegsfragen abrufen
-        recent_ai_prompts_to_avoid_raw = await get_recent_entry_questions(user_id)
-        recent_ai_prompts_to_avoid = [
-            str(p) for p in recent_ai_prompts_to_avoid_raw
-            if p is not None and str(p).strip() != ""
-        ]
-
-        # Letzte Universum-Botschaften separat abrufen
-        recent_universum_raw = await get_recent_universum_questions(user_id)
-        recent_universum_to_avoid = [
-            str(p) for p in recent_universum_raw
-            if p is not None and str(p).strip() != ""
-        ]
-
-        user_profile_data_raw = supabase.table("profile") \
-            .select("attribute_name, attribute_value") \
+        return "Was möchtest du heute angehen? Gibt es ein neues Thema, über das du sprechen möchtest?", None
+
+    # Phase 1 – günstige Signale für die Modus-Wahl: alle offenen To-Dos und Routinen in einer Abfrage,
+    # dazu die zuletzt gestellten Einstiegsfragen (fast jeder Modus vermeidet sie)
+    today_date = datetime.datetime.now().strftime("%Y-%m-%d")
+    offene_todos, recent_ai_prompts_to_avoid_raw = await asyncio.gather(
+        db.fetch(db.table("todos") \
+            .select("title, is_recurring, status, due_date, priority, missed_count, missed_dates, recurrence_type, recurrence_weekday, last_checked_date") \
             .eq("user_id", user_id) \
-            .eq("archived", False) \
-            .execute().data
-        
-        user_profile_context = ""
-        if user_profile_data_raw:
-            user_profile_context = "\nAktuelles Benutzerprofil:\n" + "\n".join([
-                f"- {item['attribute_name']}: {item['attribute_value']}"
-                for item in user_profile_data_raw
-            ])
+            .not_.in_("status", ["completed", "archived"])),
+        get_recent_entry_questions(user_id),
+    )
+    all_user_routines = [t for t in offene_todos if t.get("is_recurring")]
+    overdue_todos_data = sorted(
+        [t for t in offene_todos
+         if not t.get("is_recurring") and t.get("due_date") and t["due_date"] < today_date and t.get("status") != "skipped"],
+        key=lambda t: t["due_date"],
+    )[:5]
+
+    # Nur die letzten paar Fragen im Prompt; gegen ältere Wiederholungen hilft die Neuheitsprüfung
+    recent_ai_prompts_to_avoid = [
+        str(p) for p in recent_ai_prompts_to_avoid_raw
+        if p is not None and str(p).strip() != ""
+    ][:ENTRY_QUESTION_PROMPT_RECENT]
+
+    # Routinen überprüfen
+    today = datetime.datetime.now().strftime("%A")
+    _today_weekday = today.lower()
+    unfulfilled_routines = [
+        r for r in all_user_routines
+        if (r.get('recurrence_type') == 'daily' or (r.get('recurrence_weekday') or '').lower() == _today_weekday)
+        and r.get('last_checked_date') != today_date
+    ]
+
+    # Routinen, die mindestens 3-mal nicht erfüllt wurden
+    five_weeks_ago = (datetime.datetime.now() - datetime.timedelta(weeks=5)).strftime("%Y-%m-%d")
+    routine_texts = []
+    for r in unfulfilled_routines:
+        missed_dates = r.get("missed_dates") or []
+        recent_missed = [d for d in missed_dates if d >= five_weeks_ago]
+        if len(recent_missed) >= 3 and r.get("title") is not None:
+            routine_texts.append(str(r.get("title", '')))
+    routine_context_today = ", ".join(routine_texts)
+
+    overdue_todos_context = "\n".join([
+        f"- {t['title']} (fällig seit {t['due_date']}, Priorität: {t['priority']})"
+        for t in overdue_todos_data
+    ]) if overdue_todos_data else ""
+
+    # Übersicht der Routinen (wie bisher höchstens 10)
+    routines_overview_context = ""
+    if all_user_routines:
+        routines_overview_context = "\nÜbersicht aller Routinen:\n" + "\n".join([
+            f"- {str(r.get('title', ''))} ({str(r.get('recurrence_weekday', ''))}, Erledigt: {'Ja' if r.get('last_checked_date') == today_date else 'Nein'}, Verpasst: {str(r.get('missed_count', 0))})"
+            for r in all_user_routines[:10]
+        ])
+    else:
+        routines_overview_context = "\nBisher keine Routinen erfasst."
+
+    # Priority-Flags
+    has_overdue_todos = len(overdue_todos_data) > 0
+    has_struggling_routines = len(routine_texts) > 0
+    has_priority_items = has_overdue_todos or has_struggling_routines
+
+    # Modus-Auswahl: Priority-Items zuerst, dann Zufall
+    roll = random.random()
+
+    if has_priority_items and roll < 0.65:
+        # 65% Wahrscheinlichkeit dass Priority-Items angesprochen werden
+        if has_overdue_todos and has_struggling_routines:
+            mode = random.choice(["todo_followup", "routine_reflexion"])
+        elif has_overdue_todos:
+            mode = "todo_followup"
         else:
-            user_profile_context = "\nBisher keine Profilinformationen erfasst."
-        
-        # Letzte 10 Monatsrückblicke und letzte 4 Wochenrückblicke
-        monthly_reports = supabase.table("long_term_memory") \
-            .select("thema, inhalt") \
-            .eq("user_id", user_id) \
-            .eq("thema", "Monatsrückblick") \
-            .order("timestamp", desc=True) \
-            .limit(10) \
-            .execute().data
-        
-        weekly_reports = supabase.table("long_term_memory") \
-            .select("thema, inhalt") \
-            .eq("user_id", user_id) \
-            .eq("thema", "Wochenrückblick") \
-            .order("timestamp", desc=True) \
-            .limit(4) \
-            .execute().data
-        
-        # Kombiniere die Berichte für den Kontext
-        all_recent_reports = monthly_reports + weekly_reports
-        
-        reports_context = "\n".join([
-            f"{str(r.get('thema', ''))}: {str(r.get('inhalt', ''))}" 
-            for r in all_recent_reports
+            mode = "routine_reflexion"
+    else:
+        # Normaler Zufalls-Modus
+        roll2 = random.random()
+        if roll2 < 0.05:
+            mode = "universum"
+        elif roll2 < 0.15:
+            mode = "insight"
+        elif roll2 < 0.30:
+            mode = "rueckblick"
+        elif roll2 < 0.45:
+            mode = "ziel_check"
+        elif roll2 < 0.60:
+            mode = "routine_reflexion"
+        elif roll2 < 0.75:
+            mode = "provokation"
+        else:
+            mode = "normal"
+
+    # Phase 2 – nur die Daten laden, die der Prompt des gewählten Modus verwendet (mit Fallbacks)
+    mode, geladen = await quellen_fuer_modus(db, user_id, mode)
+
+    recent_universum_to_avoid = [
+        str(p) for p in geladen.get("universum", [])
+        if p is not None and str(p).strip() != ""
+    ][:ENTRY_QUESTION_PROMPT_RECENT]
+
+    user_profile_context = ""
+    if geladen.get("profil"):
+        user_profile_context = "\nAktuelles Benutzerprofil:\n" + "\n".join([
+            f"- {item['attribute_name']}: {item['attribute_value']}"
+            for item in geladen["profil"]
         ])
+    else:
+        user_profile_context = "\nBisher keine Profilinformationen erfasst."
 
-        if not reports_context.strip():
-            reports_context = "Bisher keine Berichte verfügbar."
-            
-        # Laden der Ziele aus der 'goals'-Tabelle
-        user_goals = supabase.table("goals") \
-            .select("titel", "status") \
-            .eq("user_id", user_id) \
-            .limit(5) \
-            .execute().data            
- 
-        goals_context = ""
-        if user_goals:
-            goals_context = "\nAktuelle Ziele:\n" + "\n".join([
-                f"- {str(g.get('titel', ''))} (Status: {str(g.get('status', ''))})" 
-                for g in user_goals
-            ])
-        else:
-            goals_context = "\nBisher keine Ziele erfasst."
+    # Kombiniere die Berichte für den Kontext
+    all_recent_reports = geladen.get("monatsberichte", []) + geladen.get("wochenberichte", [])
 
-        # Laden aller Routinen aus todos (is_recurring=True)
-        _routines_ctx_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        all_user_routines = supabase.table("todos") \
-            .select("title, recurrence_weekday, last_checked_date, missed_count") \
-            .eq("user_id", user_id) \
-            .eq("is_recurring", True) \
-            .not_.in_("status", ["completed", "archived"]) \
-            .limit(10) \
-            .execute().data
-
-        routines_overview_context = ""
-        if all_user_routines:
-            routines_overview_context = "\nÜbersicht aller Routinen:\n" + "\n".join([
-                f"- {str(r.get('title', ''))} ({str(r.get('recurrence_weekday', ''))}, Erledigt: {'Ja' if r.get('last_checked_date') == _routines_ctx_date else 'Nein'}, Verpasst: {str(r.get('missed_count', 0))})"
-                for r in all_user_routines
-            ])
-        else:
-            routines_overview_context = "\nBisher keine Routinen erfasst."
-
-        # Routinen überprüfen
-        today = datetime.datetime.now().strftime("%A")
-        today_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        _today_weekday = today.lower()
-        _all_recurring = supabase.table("todos") \
-            .select("title, missed_count, missed_dates, recurrence_type, recurrence_weekday, last_checked_date") \
-            .eq("user_id", user_id) \
-            .eq("is_recurring", True) \
-            .not_.in_("status", ["completed", "archived"]) \
-            .execute().data
-        unfulfilled_routines = [
-            r for r in _all_recurring
-            if (r.get('recurrence_type') == 'daily' or (r.get('recurrence_weekday') or '').lower() == _today_weekday)
-            and r.get('last_checked_date') != today_date
-        ]
-
-        # Routinen, die mindestens 3-mal nicht erfüllt wurden
-        five_weeks_ago = (datetime.datetime.now() - datetime.timedelta(weeks=5)).strftime("%Y-%m-%d")
-        routine_texts = []
-        for r in unfulfilled_routines:
-            missed_dates = r.get("missed_dates") or []
-            recent_missed = [d for d in missed_dates if d >= five_weeks_ago]
-            if len(recent_missed) >= 3 and r.get("title") is not None:
-                routine_texts.append(str(r.get("title", '')))
-        routine_context_today = ", ".join(routine_texts)
-
-        # Überfällige To-Dos laden
-        overdue_todos_data = supabase.table("todos") \
-            .select("title, due_date, priority") \
-            .eq("user_id", user_id) \
-            .eq("is_recurring", False) \
-            .lt("due_date", today_date) \
-            .not_.in_("status", ["completed", "archived", "skipped"]) \
-            .order("due_date", desc=False) \
-            .limit(5) \
-            .execute().data
-        overdue_todos_context = "\n".join([
-            f"- {t['title']} (fällig seit {t['due_date']}, Priorität: {t['priority']})"
-            for t in overdue_todos_data
-        ]) if overdue_todos_data else ""
-
-        # Priority-Flags
-        has_overdue_todos = len(overdue_todos_data) > 0
-        has_struggling_routines = len(routine_texts) > 0
-        has_priority_items = has_overdue_todos or has_struggling_routines
-
-        # Modus-Auswahl: Priority-Items zuerst, dann Zufall
-        roll = random.random()
-
-        if has_priority_items and roll < 0.65:
-            # 65% Wahrscheinlichkeit dass Priority-Items angesprochen werden
-            if has_overdue_todos and has_struggling_routines:
-                mode = random.choice(["todo_followup", "routine_reflexion"])
-            elif has_overdue_todos:
-                mode = "todo_followup"
-            else:
-                mode = "routine_reflexion"
-        else:
-            # Normaler Zufalls-Modus
-            roll2 = random.random()
-            if roll2 < 0.05:
-                mode = "universum"
-            elif roll2 < 0.15:
-                mode = "insight"
-            elif roll2 < 0.30:
-                mode = "rueckblick"
-            elif roll2 < 0.45:
-                mode = "ziel_check"
-            elif roll2 < 0.60:
-                mode = "routine_reflexion"
-            elif roll2 < 0.75:
-                mode = "provokation"
-            else:
-                mode = "normal"
-
-
-        # Kontext für GPT aufbauen
-        today_date_str = datetime.datetime.now().strftime('%d. %B %Y')
-        context_for_gpt = "\nUser-Historie (letzte 30 Nachrichten):\n" + "\n".join(messages)
-        if recent_ai_prompts_to_avoid:
-            context_for_gpt += "\nKürzlich gestellte Fragen des Beraters:\n" + ", ".join(recent_ai_prompts_to_avoid)
-        context_for_gpt += user_profile_context
-        context_for_gpt += "\nAktuelle Berichte:\n" + reports_context
-        context_for_gpt += goals_context
-        context_for_gpt += routines_overview_context
-        if routine_context_today:
-            context_for_gpt += f"\nHeute oft verpasste Routinen: {routine_context_today}"
-        context_for_gpt += f"\n\nWICHTIG — Heute ist {today_date_str}. Bevor du ein Ereignis, Termin oder Vorhaben ansprichst: prüfe ob das genannte Datum vor dem heutigen Datum liegt. Wenn ja, frage NICHT nach Vorbereitung oder Plänen — sprich es höchstens als vergangene Erfahrung an."
-
-        if mode == "todo_followup":
-            prompt = f"""
-            Du bist ein direkter persönlicher Coach. Der Nutzer hat überfällige To-Dos:
-            {overdue_todos_context}
-
-            Sprich EINES davon direkt an — frag knapp und konkret warum es noch nicht erledigt ist und was jetzt den nächsten Schritt blockiert.
-            Maximal 1-2 Sätze. VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-            {", ".join(recent_ai_prompts_to_avoid)}
-            """
-
-        elif mode == "universum":
-            prompt = f"""
-            Du bist hypothetisch die Simulation oder das Universum und möchtest dem Nutzer heute einen konkreten Hinweis geben.
-            Tue so, als ob du tatsächlich Kontakt zum Universum oder zur Simulation hättest und etwas Wichtiges über seinen heutigen Tag weißt.
-            Vermeide diese früheren Universum-Botschaften: {", ".join(recent_universum_to_avoid)}
-            Sei sehr konkret und weise auf eine bestimmte Aktion, Einstellung oder ein Ereignis hin. Bleibe dabei einfühlsam und motivierend.
-            """
-
-        elif mode == "insight":
-            insights = supabase.table("long_term_memory") \
-                .select("thema, inhalt") \
-                .eq("user_id", user_id) \
-                .not_.in_("thema", ["Wochenrückblick", "Monatsrückblick", "Jahresrückblick"]) \
-                .order("timestamp", desc=True) \
-                .limit(20) \
-                .execute().data
-
-            if insights:
-                insight = random.choice(insights)
-                prompt = f"""
-                Du bist ein persönlicher Mentor. Der Nutzer hat folgende Erkenntnis einmal festgehalten:
-                Thema: "{insight['thema']}"
-                Inhalt: "{insight['inhalt']}"
-                
-                Greife diese Erkenntnis heute auf. Frag nach, wie es damit steht, ob sie sich bestätigt hat oder ob sich etwas verändert hat.
-                Maximal 1-2 Sätze. VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-                {", ".join(recent_ai_prompts_to_avoid)}
-                """
-            else:
-                mode = "rueckblick"  # Fallback wenn keine Insights vorhanden
-
-        elif mode == "rueckblick":
-            # Lade die letzten 8 Wochenberichte, 20 Monatsberichte und alle Jahresberichte
-            wochen_berichte = supabase.table("long_term_memory") \
-                .select("thema, inhalt, timestamp") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Wochenrückblick") \
-                .order("timestamp", desc=True) \
-                .limit(8) \
-                .execute().data
-
-            monats_berichte = supabase.table("long_term_memory") \
-                .select("thema, inhalt, timestamp") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Monatsrückblick") \
-                .order("timestamp", desc=True) \
-                .limit(20) \
-                .execute().data
-
-            jahres_berichte = supabase.table("long_term_memory") \
-                .select("thema, inhalt, timestamp") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Jahresrückblick") \
-                .order("timestamp", desc=True) \
-                .execute().data
-
-            alle_rueckblicke = wochen_berichte + monats_berichte + jahres_berichte
-
-            if alle_rueckblicke:
-                gewählter_bericht = random.choice(alle_rueckblicke)
-                bericht_datum = gewählter_bericht.get('timestamp', '')[:10] if gewählter_bericht.get('timestamp') else 'unbekannt'
-                prompt = f"""
-                Du bist ein persönlicher Mentor. Hier ist ein früherer Rückblick des Nutzers vom {bericht_datum}:
-                Typ: "{gewählter_bericht['thema']}"
-                Inhalt: "{gewählter_bericht['inhalt']}"
-
-                Heute ist {today_date_str}. Prüfe: Enthält der Rückblick ein Ereignis oder Vorhaben mit einem konkreten Datum, das bereits vergangen ist (z.B. ein Wettkampf, Termin, Abgabe)? Falls ja, frage NICHT nach Vorbereitung, aktuellem Stand oder Plänen dazu — es ist vorbei. Wähle dann stattdessen ein anderes Thema aus dem Rückblick.
-                Falls du ein geeignetes Thema findest, stelle eine kurze direkte Frage. Wähle EINEN dieser Typen:
-                - Wie läuft X gerade?
-                - Hast du X inzwischen gemacht?
-                - Bist du wirklich zufrieden mit X?
-                - Was war bei X anders als erwartet?
-                Maximal 1 Satz. VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-                {", ".join(recent_ai_prompts_to_avoid)}
-                """
-            else:
-                mode = "normal"  # Fallback wenn keine Berichte vorhanden
+    reports_context = "\n".join([
+        f"{str(r.get('thema', ''))}: {str(r.get('inhalt', ''))}"
+        for r in all_recent_reports
+    ])
 
-        elif mode == "ziel_check":
-            prompt = f"""
-            Du bist ein persönlicher Mentor. Der Nutzer hat folgende offene Ziele:
-            {goals_context}
-            
-            Wähle EIN konkretes Ziel aus und frage direkt nach dem aktuellen Stand — kurz und präzise, maximal 1 Satz.
-            VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-            {", ".join(recent_ai_prompts_to_avoid)}
-            """
-
-        elif mode == "routine_reflexion":
-            prompt = f"""
-            Du bist ein persönlicher Mentor. Hier ist eine Übersicht der Routinen des Nutzers:
-            {routines_overview_context}
-
-            Greife EINE Routine auf und stelle eine konkrete Frage dazu. Wenn "Verpasst" einen Wert >= 3 hat, frage nach dem Grund. Wenn "Verpasst" 1-2 ist, sprich es NICHT als "oft verpasst" an — frage stattdessen wie es läuft. Wenn alle gut laufen, frage was die Routine so leicht macht.
-            Maximal 1 Satz. VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-            {", ".join(recent_ai_prompts_to_avoid)}
-            """
-
-        elif mode == "provokation":
-            prompt = f"""
-            Du bist ein direkter, provokanter Mentor. Stelle dem Nutzer eine unbequeme, herausfordernde These oder Frage 
-            basierend auf dem was du über ihn weißt. Ziel ist produktive Selbstreflexion, nicht Beleidigung.
-            Maximal 1 Satz. VERBOTEN — diese Themen wurden kürzlich bereits angesprochen, wähle etwas völlig anderes:
-            {", ".join(recent_ai_prompts_to_avoid)}
-            
-            Was du über den Nutzer weißt:
-            {user_profile_context}
-            {goals_context}
-            {routines_overview_context}
-            """
-
-        else:  # normal
-            prompt = f"""
-            Du bist ein kreativer, neugieriger Gesprächspartner. Deine Aufgabe: Stelle GENAU EINE kurze Frage — kein "und", kein Komma zwischen zwei Fragen, keine Mehrfachfragen.
-
-            REGELN:
-            1. Schaue zuerst auf das Benutzerprofil und die Historie — was weißt du bereits? Frag nach etwas, das du noch NICHT weißt.
-            2. Diese Fragen wurden bereits gestellt — stelle sie NIEMALS nochmal oder ähnlich:
-            {chr(10).join(f"- {q}" for q in recent_ai_prompts_to_avoid)}
-            3. Verbiete dir selbst folgende Themen komplett: Lieblingsessen, Lieblingsmusik, Lieblingsfilm, Lieblingsbuch, Urlaubsziele, Lottogewinn.
-            4. Sei konkret und persönlich, nicht allgemein. Nicht "Wie gehst du mit Stress um?" sondern z.B. "Was machst du als erstes, wenn ein Arbeitstag richtig schiefläuft?"
-            5. Variiere den Fragetyp: manchmal eine Meinungsfrage, manchmal eine Statusfrage, manchmal eine hypothetische Frage, manchmal eine direkte Konfrontation.
-            6. Selten verwenden (max. 1 von 10 Fragen): "Gab es einen Moment...", "Gab es ein Erlebnis...", "Wann hast du das letzte Mal..."
-            7. Die Frage soll maximal 1 Satz lang sein. EIN Fragezeichen, nicht mehrere.
-            
-            Benutzerprofil (was du bereits weißt):
-            {user_profile_context}
-            
-            Bisherige Gesprächsthemen:
-            {context_for_gpt}
-            """
+    if not reports_context.strip():
+        reports_context = "Bisher keine Berichte verfügbar."
+
+    goals_context = ""
+    if geladen.get("ziele"):
+        goals_context = "\nAktuelle Ziele:\n" + "\n".join([
+            f"- {str(g.get('titel', ''))} (Status: {str(g.get('status', ''))})"
+            for g in geladen["ziele"]
+        ])
+    else:
+        goals_context = "\nBisher keine Ziele erfasst."
+
+
+    # Kontext-Abschnitte auf das Token-Budget bringen (Historie ist neueste zuerst)
+    gekuerzt = TokenBudget(START_CONTEXT_TOKEN_BUDGET).verteile([
+        Abschnitt("historie", "\n".join(messages), prioritaet=80, min_tokens=400),
+        Abschnitt("profil", user_profile_context, prioritaet=100, min_tokens=400),
+        Abschnitt("ziele", goals_context, prioritaet=70, min_tokens=100),
+        Abschnitt("routinen", routines_overview_context, prioritaet=60, min_tokens=150),
+        Abschnitt("berichte", reports_context, prioritaet=30, min_tokens=300),
+    ], protokoll=f"start_interaction user={user_id}")
+    user_profile_context = gekuerzt["profil"]
+    goals_context = gekuerzt["ziele"]
+    routines_overview_context = gekuerzt["routinen"]
+    reports_context = gekuerzt["berichte"]
+
+    # Kontext für GPT aufbauen
+    today_date_str = datetime.datetime.now().strftime('%d. %B %Y')
+    context_for_gpt = "\nUser-Historie (letzte 30 Nachrichten):\n" + gekuerzt["historie"]
+    if recent_ai_prompts_to_avoid:
+        context_for_gpt += "\nKürzlich gestellte Fragen des Beraters:\n" + ", ".join(recent_ai_prompts_to_avoid)
+    context_for_gpt += user_profile_context
+    context_for_gpt += "\nAktuelle Berichte:\n" + reports_context
+    context_for_gpt += goals_context
+    context_for_gpt += routines_overview_context
+    if routine_context_today:
+        context_for_gpt += f"\nHeute oft verpasste Routinen: {routine_context_today}"
+
+    # Statische Anweisungen je Modus als System-Nachricht (cachebar), Datum und Nutzerdaten als Nachricht
+    heute_text = f"Heute ist {today_date_str}."
+    kuerzlich = "\n\nKürzlich angesprochen:\n" + ", ".join(recent_ai_prompts_to_avoid) if recent_ai_prompts_to_avoid else ""
+    daten = ""
+
+    if mode == "todo_followup":
+        daten = f"{heute_text}\n\nÜberfällige To-Dos:\n{overdue_todos_context}{kuerzlich}"
+
+    elif mode == "universum":
+        daten = f"{heute_text}\n\nFrühere Universum-Botschaften:\n{', '.join(recent_universum_to_avoid)}"
+
+    elif mode == "ziel_check":
+        daten = f"{heute_text}\n{goals_context}{kuerzlich}"
+
+    elif mode == "routine_reflexion":
+        daten = f"{heute_text}\n{routines_overview_context}{kuerzlich}"
+
+    elif mode == "provokation":
+        daten = f"{heute_text}\n\nWas du über den Nutzer weißt:\n{user_profile_context}\n{goals_context}\n{routines_overview_context}{kuerzlich}"
+
+    if mode == "insight":
+        insight = random.choice(geladen["insights"])
+        daten = f"""{heute_text}\n\nThema: "{insight['thema']}"\nInhalt: "{insight['inhalt']}"{kuerzlich}"""
+
+    if mode == "rueckblick":
+        gewählter_bericht = random.choice(geladen["rueckblicke"])
+        bericht_datum = gewählter_bericht.get('timestamp', '')[:10] if gewählter_bericht.get('timestamp') else 'unbekannt'
+        daten = f"""{heute_text}\n\nRückblick vom {bericht_datum}:\nTyp: "{gewählter_bericht['thema']}"\nInhalt: "{gewählter_bericht['inhalt']}"{kuerzlich}"""
+
+    if mode == "normal":
+        bereits_gestellt = "\n".join(f"- {q}" for q in recent_ai_prompts_to_avoid)
+        daten = f"""{heute_text}
+
+Bereits gestellte Fragen:
+{bereits_gestellt}
+
+Benutzerprofil (was du bereits weißt):
+{user_profile_context}
+
+Bisherige Gesprächsthemen:
+{context_for_gpt}"""
+
+    api_temperature = 1.3 if mode == "universum" else 0.9
+    anfrage = dict(
+        model="gpt-4o",
+        messages=[
+            {"role": "system", "content": EINSTIEG_ANWEISUNGEN[mode]},
+            {"role": "user", "content": daten}
+        ],
+        max_tokens=250,
+        temperature=api_temperature,
+        tag="start_interaction"
+    )
+    response = await llm.complete(**anfrage)
+    frage = response.choices[0].message.content.strip()
+    if not frage:
+        return "Was möchtest du heute erreichen oder klären?", mode
 
-        # Fallback-Prompt falls mode auf "normal" zurückgefallen ist
-        if mode == "normal" and 'prompt' not in locals():
-            prompt = f"""
-            Du bist ein kreativer, neugieriger Gesprächspartner. Stelle EINE kurze, persönliche Frage.
-            Vermeide: {", ".join(recent_ai_prompts_to_avoid)}
-            Benutzerprofil: {user_profile_context}
-            """
+    async def weitere_kandidaten(n: int) -> List[str]:
+        antwort = await llm.complete(**anfrage, n=n)
+        return [c.message.content.strip() for c in antwort.choices]
 
+    # Zu ähnlich zu einer früheren Frage: mehrere Kandidaten erzeugen und den neuartigsten nehmen
+    try:
+        frage = await neuartige_frage(vektor_index, llm, user_id, frage, weitere_kandidaten)
+    except Exception as e:
+        print(f"Fehler bei der Neuheitsprüfung der Einstiegsfrage: {e}")
+    return frage, mode
 
-        try:
-            api_temperature = 1.3 if mode == "universum" else 0.9
-            response = client.chat.completions.create(
-                model="gpt-4o",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=250,
-                temperature=api_temperature
-            )
-
-            frage = response.choices[0].message.content.strip()
-
-            if not frage.strip():
-                frage = "Was möchtest du heute erreichen oder klären?"
-
-            try:
-                supabase.table("conversation_history").insert({
-                    "user_id": user_id,
-                    "user_input": "",
-                    "ai_response": "",
-                    "ai_prompt": frage,
-                    "mode": mode,
-                    "timestamp": datetime.datetime.utcnow().isoformat()
-                }).execute()
-            except Exception as e:
-                print(f"Fehler beim Speichern der Einstiegsfrage: {e}")
-
-            return {"frage": frage}
 
+@app.get("/start_interaction/{user_id}")
+async def start_interaction(user_id: str):
+    """Liefert die vorbereitete Einstiegsfrage sofort aus; nur ohne frische Vorratsfrage wird sie jetzt erzeugt."""
+    vorrat = await einstiegsfragen.abholen(user_id)
+    if vorrat:
+        frage, mode = vorrat["frage"], vorrat.get("mode")
+    else:
+        try:
+            frage, mode = await _erzeuge_einstiegsfrage(user_id)
         except Exception as e:
             print(f"Fehler bei der GPT-Anfrage: {e}")
             return {"frage": "Es gab ein Problem beim Generieren der Einstiegsfrage. Was möchtest du heute besprechen?"}
-            
-# Chat-Funktion
-@app.post("/chat/{user_id}")
-async def chat(user_id: str, chat_input: ChatInput):
-    user_message = chat_input.message
 
-    # Kontext für Intent-Erkennung laden
-    recent_history = supabase.table("conversation_history").select("ai_response").eq("user_id", user_id).order("timestamp", desc=True).limit(2).execute().data
+    try:
+        await db.execute(db.table("conversation_history").insert({
+            "user_id": user_id,
+            "user_input": "",
+            "ai_response": "",
+            "ai_prompt": frage,
+            "mode": mode,
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z'
+        }))
+    except Exception as e:
+        print(f"Fehler beim Speichern der Einstiegsfrage: {e}")
+    _indexiere_im_hintergrund(user_id, [frage_eintrag(user_id, frage)])
+
+    # Die nächste Frage schon jetzt vorbereiten (kennt die eben gestellte und vermeidet sie)
+    einstiegsfragen.im_hintergrund(user_id)
+    return {"frage": frage}
+
+# Intent-Verarbeitung für den Chat
+async def _bearbeite_intent(user_id: str, user_message: str, spekulation: Optional[Spekulation] = None):
+    """Analysiert die Nachricht und führt To-Do-/Routinen-/Archiv-Aktionen direkt aus.
+
+    Gibt (antwort, analyse) zurück; antwort ist None wenn es normaler Chat ist,
+    analyse ist None wenn die strukturierte Analyse fehlgeschlagen ist.
+    Eine übergebene Spekulation wird gestartet, sobald der LLM-Aufruf nötig ist.
+    """
+    # Kontext für die Analyse laden
+    recent_history = await db.fetch(db.table("conversation_history").select("ai_response").eq("user_id", user_id).order("timestamp", desc=True).limit(2))
+    last_ai = (recent_history[0].get("ai_response") or "") if recent_history else ""
+
+    # Eindeutige Fälle lokal entscheiden, ohne LLM-Aufruf
+    vorhersage = intent_classifier.schnell(user_message, last_ai)
+    if vorhersage:
+        metrics.incr("intent.fast_path.hit")
+        metrics.incr(f"intent.fast_path.{vorhersage.quelle}")
+        if random.random() < INTENT_SHADOW_RATE:
+            post_processor.submit(user_id, "intent_shadow", _pruefe_fast_path(user_id, user_message, last_ai, vorhersage.intent))
+        aktion = await _fuehre_intent_aus(user_id, user_message, vorhersage.intent, None, last_ai)
+        return aktion, None
+    metrics.incr("intent.fast_path.miss")
+    if spekulation:
+        spekulation.starten()
+
+    # Ein Aufruf für Intent, Commitment und Felder; bei Fehler auf die einfache Intent-Erkennung zurückfallen
+    try:
+        analyse = await analysiere_turn(llm, user_message, last_ai)
+    except Exception as e:
+        print(f"Fehler bei der Turn-Analyse: {e}")
+        analyse = None
+    intent = analyse.intent if analyse else await detect_intent(user_message, recent_history)
+    if intent in INTENTS:
+        post_processor.submit(user_id, "intent_label", _speichere_intent_label(user_id, user_message, intent, "llm"))
+
+    aktion = await _fuehre_intent_aus(user_id, user_message, intent, analyse, last_ai)
+    return aktion, analyse
 
-    intent = detect_intent(user_message, recent_history)
 
+async def _speichere_intent_label(user_id: str, user_message: str, intent: str, quelle: str):
+    """Speichert ein LLM-Label als Trainingsbeispiel für den lokalen Intent-Classifier."""
+    await db.execute(db.table("intent_labels").insert({
+        "user_id": user_id,
+        "message": user_message,
+        "intent": intent,
+        "quelle": quelle,
+        "timestamp": datetime.datetime.utcnow().isoformat() + 'Z'
+    }))
+
+
+async def _pruefe_fast_path(user_id: str, user_message: str, last_ai: str, fast_intent: str):
+    """Stichprobe: lässt das LLM eine Fast-Path-Entscheidung nachträglich bewerten."""
+    analyse = await analysiere_turn(llm, user_message, last_ai)
+    if analyse is None:
+        return
+    metrics.incr("intent.shadow.checked")
+    if analyse.intent != fast_intent:
+        metrics.incr("intent.shadow.disagree")
+        print(f"Fast-Path-Abweichung: '{user_message}' → lokal {fast_intent}, LLM {analyse.intent}")
+    await _speichere_intent_label(user_id, user_message, analyse.intent, "shadow")
+
+
+async def _fuehre_intent_aus(user_id: str, user_message: str, intent: str, analyse: Optional[TurnAnalysis], last_ai: str) -> Optional[Dict[str, Any]]:
     if intent in ["routine", "routine_datum"]:
         try:
-            if intent == "routine_datum":
-                last_ai = recent_history[0].get("ai_response", "") if recent_history else ""
+            if analyse and analyse.routine:
+                info = analyse.routine.model_dump()
+            elif intent == "routine_datum":
                 info = await parse_routine_clarification(user_message, last_ai)
             else:
                 info = await extract_routine_info(user_message)
@@ -879,8 +848,8 @@ async def chat(user_id: str, chat_input: ChatInput):
             return {"response": "❌ Fehler beim Erstellen der Routine. Bitte versuche es erneut.", "created_routine": False}
     elif intent == "todo":
         try:
-            last_ai = recent_history[0].get("ai_response", "") if recent_history else ""
-            title, priority, due_date = await create_todo_from_chat(user_id, user_message, last_ai)
+            felder = analyse.todo.model_dump() if analyse and analyse.todo else None
+            title, priority, due_date = await create_todo_from_chat(user_id, user_message, last_ai, felder)
             priority_text = {'high': 'Hoch', 'medium': 'Medium', 'low': 'Niedrig'}.get(priority, 'Medium')
             
             response = f"✅ Ich habe ein neues To-Do '{title}' erstellt mit Relevanz {priority_text}"
@@ -906,12 +875,11 @@ async def chat(user_id: str, chat_input: ChatInput):
             return {"response": "❌ Fehler beim Archivieren.", "created_todo": False}
     elif intent == "todo_delete":
         try:
-            last_ai = recent_history[0].get("ai_response", "") if recent_history else ""
             result = await delete_todo_from_chat(user_id, user_message, last_ai)
             if result is None:
                 return {"response": "Ich konnte kein passendes To-Do zum Löschen finden.", "created_todo": False}
             if result == "__unclear__":
-                todos = supabase.table("todos").select("title").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(10).execute().data
+                todos = await db.fetch(db.table("todos").select("title").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(10))
                 todo_list = "\n".join([f"- {t['title']}" for t in todos])
                 question = f"Welches To-Do soll gelöscht werden?\n{todo_list}"
                 await _save_conversation_entry(user_id, user_message, question, "")
@@ -922,7 +890,6 @@ async def chat(user_id: str, chat_input: ChatInput):
             return {"response": "❌ Fehler beim Löschen des To-Dos.", "created_todo": False}
     elif intent == "todo_update":
         try:
-            last_ai = recent_history[0].get("ai_response", "") if recent_history else ""
             title, changes = await update_latest_todo(user_id, user_message, last_ai)
             if not title:
                 return {"response": "Ich konnte kein offenes To-Do zum Ändern finden.", "created_todo": False}
@@ -943,235 +910,130 @@ async def chat(user_id: str, chat_input: ChatInput):
         except Exception as e:
             print(f"Fehler beim Aktualisieren des To-Dos: {e}")
             return {"response": "❌ Fehler beim Aktualisieren des To-Dos.", "created_todo": False}
-    try:
-        # Konversationshistorie der letzten 10 Nachrichten abrufen
-        try:
-            history_response = supabase.table("conversation_history") \
-                .select("user_input, ai_response, ai_prompt") \
-                .eq("user_id", user_id) \
-                .order("timestamp", desc=True) \
-                .limit(10) \
-                .execute()
-            gespraechs_historie = history_response.data
-            gespraechs_historie.reverse() # Älteste zuerst
-        except Exception as e:
-            print(f"Fehler beim Abrufen der Konversationshistorie: {e}")
-            gespraechs_historie = [] # Setze Historie auf leer im Fehlerfall
+    return None
 
-        # Laden des Wochenberichts
-        wochenbericht_text = "Kein Wochenbericht verfügbar."
-        try:
-            latest_weekly_report = supabase.table("long_term_memory") \
-                .select("inhalt, timestamp") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Wochenrückblick") \
-                .order("timestamp", desc=True) \
-                .limit(1) \
-                .execute()
-            if latest_weekly_report.data:
-                wr = latest_weekly_report.data[0]
-                wr_date = wr['timestamp'][:10] if wr.get('timestamp') else 'unbekannt'
-                wochenbericht_text = f"[Erstellt am {wr_date}]\n{wr['inhalt']}"
-        except Exception as e:
-            print(f"Fehler beim Abrufen des Wochenberichts: {e}")
 
-        # Laden des Monatsberichts
-        monatsbericht_text = "Kein Monatsbericht verfügbar."
-        try:
-            latest_monthly_report = supabase.table("long_term_memory") \
-                .select("inhalt, timestamp") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Monatsrückblick") \
-                .order("timestamp", desc=True) \
-                .limit(1) \
-                .execute()
-            if latest_monthly_report.data:
-                mr = latest_monthly_report.data[0]
-                mr_date = mr['timestamp'][:10] if mr.get('timestamp') else 'unbekannt'
-                monatsbericht_text = f"[Erstellt am {mr_date}]\n{mr['inhalt']}"
-        except Exception as e:
-            print(f"Fehler beim Abrufen des Monatsberichts: {e}")
+_nachindexierung_laeuft = set()
 
-        # Aktuelle Ziele abrufen
-        ziele_text = "Keine offenen Ziele."
-        try:
-            open_goals_response = supabase.table("goals") \
-                .select("titel", "status", "deadline") \
-                .eq("user_id", user_id) \
-                .eq("status", "offen") \
-                .execute()
-            open_goals = open_goals_response.data
-            if open_goals:
-                ziele_text = "Aktuelle offene Ziele:\n" + "\n".join([f"- {g['titel']} (Deadline: {g['deadline']})" for g in open_goals])
-        except Exception as e:
-            print(f"Fehler beim Abrufen der Ziele: {e}")
+def _nachindexieren_im_hintergrund(user_id: str):
+    """Startet die Nachindexierung eines Nutzers (höchstens einmal gleichzeitig)."""
+    if user_id in _nachindexierung_laeuft:
+        return
+    _nachindexierung_laeuft.add(user_id)
 
-        # Laden der dynamischen Profildaten aus der 'profile'-Tabelle (EAV-Modell)
-        profile_text_for_prompt = "Keine spezifischen Profilinformationen erfasst."
-        upcoming_events_text = "Keine bevorstehenden Termine oder laufenden Prozesse."
+    async def lauf():
         try:
-            profile_attributes_data = supabase.table("profile") \
-                .select("attribute_name, attribute_value") \
-                .eq("user_id", user_id) \
-                .eq("archived", False) \
-                .execute().data
-            
-            if profile_attributes_data:
-                user_profile_details = {item["attribute_name"]: item["attribute_value"] for item in profile_attributes_data}
-                profile_text_for_prompt = "Aktuelles Benutzerprofil:\n" + "\n".join([f"- {name}: {value}" for name, value in user_profile_details.items()])
-                upcoming = [
-                    f"- {name}: {value}"
-                    for name, value in user_profile_details.items()
-                    if name.startswith(("Termin_", "Prozess_")) and "abgeschlossen" not in value.lower()
-                ]
-                upcoming_events_text = "\n".join(upcoming) if upcoming else "Keine bevorstehenden Termine oder laufenden Prozesse."
-        except Exception as e:
-            print(f"Fehler beim Laden des Profils: {e}")
+            await nachindexieren(vektor_index, llm, db, user_id)
+        finally:
+            _nachindexierung_laeuft.discard(user_id)
 
-        # Routinen laden
-        routines_text = "Keine Routinen definiert." # Standardwert
-        try:
-            today_weekday = datetime.datetime.now().strftime("%A")
-            _chat_date = datetime.datetime.now().strftime("%Y-%m-%d")
-            routines_response = supabase.table("todos").select("title, last_checked_date, recurrence_weekday, missed_count").eq("user_id", user_id).eq("is_recurring", True).not_.in_("status", ["completed", "archived"]).execute()
-            routines = routines_response.data
-            if routines:
-                routines_text = "Aktuelle Routinen:\n" + "\n".join([f"- {r['title']} (Tag: {r['recurrence_weekday']}, Erledigt: {'Ja' if r.get('last_checked_date') == _chat_date else 'Nein'}, Verpasst: {str(r.get('missed_count', 0))})" for r in routines])
-        except Exception as e:
-            print(f"Fehler beim Abrufen der Routinen: {e}")
-       
-        # To-Dos laden
-        todos_text = "Keine To-Dos definiert."
-        try:
-            today_date = datetime.datetime.now().strftime("%Y-%m-%d")
-            open_todos = supabase.table("todos").select("title, priority, due_date, category, status").eq("user_id", user_id).eq("is_recurring", False).in_("status", ["open", "in_progress"]).limit(10).execute().data
-            overdue_todos = supabase.table("todos").select("title, priority, due_date, category").eq("user_id", user_id).eq("is_recurring", False).lt("due_date", today_date).not_.in_("status", ["completed", "archived", "skipped"]).execute().data
-            
-            if open_todos or overdue_todos:
-                todos_parts = []
-                if open_todos:
-                    todos_parts.append("Offene To-Dos:\n" + "\n".join([f"- {t['title']} (Priorität: {t['priority']}, Fällig: {t.get('due_date', 'Kein Datum')}, Kategorie: {t['category']})" for t in open_todos]))
-                if overdue_todos:
-                    todos_parts.append("Überfällige To-Dos:\n" + "\n".join([f"- {t['title']} (Fällig seit: {t['due_date']}, Priorität: {t['priority']})" for t in overdue_todos]))
-                todos_text = "\n\n".join(todos_parts)
-        except Exception as e:
-            print(f"Fehler beim Abrufen der To-Dos: {e}")
-        
-        # Langzeitgedächtnis laden
-        memory_text = "Keine spezifischen Langzeit-Erkenntnisse gespeichert." # Standardwert
-        try:
-            memory = supabase.table("long_term_memory").select("thema, inhalt, timestamp").eq("user_id", user_id).order("timestamp", desc=True).limit(10).execute().data
-            if memory:
-                memory_text = "\n".join([f"[Aufgezeichnet: {m['timestamp'][:10] if m.get('timestamp') else 'unbekannt'}] {m['thema']}: {m['inhalt']}" for m in memory])
-        except Exception as e:
-            print(f"Fehler beim Abrufen des Langzeitgedächtnisses: {e}")
-
-        # Konversationshistorie für den System-Prompt formatieren
-        history_messages = []
-        for h in reversed(gespraechs_historie):
-            if h.get('user_input'):
-                history_messages.append(f"User: {h['user_input']}")
-            if h.get('ai_response'):
-                history_messages.append(f"Berater: {h['ai_response']}")
-            if h.get('ai_prompt'):
-                history_messages.append(f"Berater: {h['ai_prompt']}")
-
-        history_text = "\n".join(history_messages) if history_messages else "Bisher keine frühere Konversationshistorie."
-        
-        # Systemnachricht zusammenstellen
-        system_message = f"""
-        Du bist ein persönlicher, anspruchsvoller und konstruktiver Mentor und Therapeut. Dein Ziel ist es, dem Nutzer realistisch, prägnant und umsetzbar zu helfen.
+    post_processor.submit(user_id, "vektor_nachindexierung", lauf())
 
-        WICHTIGE INFORMATIONEN:
-        - Heutiges Datum: {datetime.datetime.now().strftime('%d. %B %Y')}
-        - Aktueller Wochentag: {datetime.datetime.now().strftime('%A')}
+async def _relevante_eintraege(user_id: str, user_message: str) -> Optional[Dict[str, str]]:
+    """Sucht im Vektor-Index die zur Nachricht passenden Gedächtnis-/Berichts- und Profil-Einträge.
 
-        Nutze folgende Informationen für direkt handlungsorientierte Ratschläge:
+    Gibt None zurück, wenn der Nutzer (noch) nicht vollständig indexiert ist oder das Embedding
+    fehlschlägt – dann bleibt es bei den neuesten Einträgen bzw. dem vollständigen Profil. Ein nur
+    teilweise indexierter Nutzer (nach Deploy oder gelöschter Platte) wird im Hintergrund nachindexiert.
+    """
+    if not vektor_index.vollstaendig(user_id):
+        _nachindexieren_im_hintergrund(user_id)
+        return None
+    try:
+        vektor = (await llm.embed([user_message], model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIM, timeout=5))[0]
+    except Exception as e:
+        print(f"Fehler beim Embedding der Chat-Nachricht: {e}")
+        return None
+    gedaechtnis = vektor_index.suche(user_id, vektor, VECTOR_TOP_K, quellen=["gedaechtnis", "bericht"])
+    profil = vektor_index.suche(user_id, vektor, VECTOR_TOP_K_PROFIL, quellen=["profil"])
+    return {
+        "gedaechtnis": "\n".join(t["text"] for t in gedaechtnis),
+        "profil": "Aktuelles Benutzerprofil (relevante Einträge):\n" + "\n".join(f"- {t['text']}" for t in profil) if profil else "",
+    }
 
-        Nutzerprofil:
-        {profile_text_for_prompt}
 
-        Bevorstehende Termine & laufende Prozesse:
-        {upcoming_events_text}
+async def _baue_chat_nachrichten(user_id: str, user_message: str):
+    """Baut System- und Nutzer-Nachricht für die Chat-Antwort. Gibt (messages, gespraechs_historie) zurück."""
+    # Kontext parallel laden (Historie, Berichte, Ziele, Profil, Routinen, To-Dos, Gedächtnis)
+    kontext, relevant = await asyncio.gather(lade_chat_kontext(db, user_id), _relevante_eintraege(user_id, user_message))
+    if relevant and relevant["gedaechtnis"]:
+        kontext["memory_text"] = relevant["gedaechtnis"]
+    if relevant and relevant["profil"]:
+        kontext["profile_text_for_prompt"] = relevant["profil"]
+
+    # Abschnitte auf das Token-Budget bringen; Berichte und Gedächtnis werden zuerst gekürzt
+    gekuerzt = TokenBudget(CHAT_CONTEXT_TOKEN_BUDGET).verteile([
+        Abschnitt("historie", kontext["history_text"], prioritaet=100, min_tokens=300),
+        Abschnitt("profil", kontext["profile_text_for_prompt"], prioritaet=90, min_tokens=300),
+        Abschnitt("termine", kontext["upcoming_events_text"], prioritaet=85, min_tokens=100),
+        Abschnitt("todos", kontext["todos_text"], prioritaet=70, min_tokens=150),
+        Abschnitt("routinen", kontext["routines_text"], prioritaet=65, min_tokens=150),
+        Abschnitt("ziele", kontext["ziele_text"], prioritaet=60, min_tokens=100),
+        Abschnitt("zusammenfassung", kontext["zusammenfassung_text"], prioritaet=50, min_tokens=150),
+        Abschnitt("gedaechtnis", kontext["memory_text"], prioritaet=40, min_tokens=100),
+        Abschnitt("wochenbericht", kontext["wochenbericht_text"], prioritaet=30),
+        Abschnitt("monatsbericht", kontext["monatsbericht_text"], prioritaet=20),
+    ], protokoll=f"chat user={user_id}")
+    history_text = gekuerzt["historie"]
+    wochenbericht_text = gekuerzt["wochenbericht"]
+    monatsbericht_text = gekuerzt["monatsbericht"]
+    ziele_text = gekuerzt["ziele"]
+    profile_text_for_prompt = gekuerzt["profil"]
+    upcoming_events_text = gekuerzt["termine"]
+    routines_text = gekuerzt["routinen"]
+    todos_text = gekuerzt["todos"]
+    memory_text = gekuerzt["gedaechtnis"]
+    zusammenfassung_text = gekuerzt["zusammenfassung"]
+
+    # Statische Anweisungen zuerst (cachebarer Präfix), danach Datum und Nutzerdaten
+    heute = datetime.datetime.now()
+    kontext_nachricht = f"""Heutiges Datum: {heute.strftime('%d. %B %Y')}
+Aktueller Wochentag: {heute.strftime('%A')}
 
-        Deine heutigen Routinen:
-        {routines_text}
+Nutzerprofil:
+{profile_text_for_prompt}
 
-        Deine aktuellen To-Dos:
-        {todos_text}
+Bevorstehende Termine & laufende Prozesse:
+{upcoming_events_text}
 
-        Langzeitgedächtnis / Wichtige Erkenntnisse:
-        {memory_text}
+Deine heutigen Routinen:
+{routines_text}
 
-        Letzter Wochenbericht (historisch, kein aktueller Stand):
-        {wochenbericht_text}
+Deine aktuellen To-Dos:
+{todos_text}
 
-        Letzter Monatsbericht (historisch, kein aktueller Stand):
-        {monatsbericht_text}
-        
-        Aktuelle Ziele:
-        {ziele_text}
-
-        Konversationshistorie (letzte 5 Nachrichten):
-        {history_text}
-
-        WICHTIG zum Profil: Einträge die "abgeschlossen" enthalten sind VERGANGENE Ereignisse. Frage NICHT danach als wären sie noch bevorstehend oder in Vorbereitung. Nutze sie nur als Hintergrundwissen über den Nutzer.
-        Bevor du ein Ereignis, Termin oder Vorhaben ansprichst: prüfe im Profil ob es bereits abgeschlossen ist oder ob das genannte Datum vor dem heutigen Datum ({datetime.datetime.now().strftime('%d. %B %Y')}) liegt. Wenn ja, frage NICHT nach Vorbereitung oder Plänen — sprich es höchstens als vergangene Erfahrung an.
-        WICHTIG zum Langzeitgedächtnis: Das Langzeitgedächtnis ist reines Hintergrundwissen — bringe NIEMALS von dir aus Themen daraus ins Gespräch. Sprich etwas aus dem Langzeitgedächtnis NUR an, wenn der Nutzer dieses Thema explizit selbst erwähnt. Jeder Eintrag hat ein Aufzeichnungsdatum in eckigen Klammern. Ereignisse mit einem konkreten Datum das bereits vergangen ist (z.B. ein Wettkampf, Termin oder Abgabe) sind abgeschlossen — frage NIEMALS danach als wären sie noch aktuell, bevorstehend oder in Vorbereitung. Auch als "vergangene Erfahrung" nur ansprechen wenn der Nutzer das Thema selbst öffnet.
-        Erfinde KEINE Daten, Namen oder Details die nicht explizit in den bereitgestellten Infos stehen. Wenn du dir bei einem Detail unsicher bist, lass es weg statt es zu erfinden.
-        Analysiere die aktuelle Nachricht im Kontext ALLER Infos. Erkenne Inkonsistenzen oder mangelnden Fortschritt.
-        Wenn der Nutzer überrascht über Deine Nachricht scheint, frage direkt nach, ob Du etwas bestimmtes falsch einschätzt und korrigiere Deine Infos, falls der Nutzer auf Fehler hinweist.
-        Kein allgemeines Lob. Fokussiere dich auf konkrete Ansatzpunkte.
-        Stelle konkrete Fragen oder weise auf Reflexionen hin. Mache NUR in etwa 5% der Fälle einen konkreten Vorschlag für nächste Schritte. In 15% der Fälle erzähle einen sarkastischen Witz im Zusammenhang mit der Antwort und lache Dich kaputt. In den anderen 85% der Fälle: akzeptiere die Antwort, hake nach oder gib eine kurze Einschätzung — ohne Empfehlungen.
-        WICHTIG: Schlage keine zeitintensiven neuen Aktivitäten oder grundlegenden Verhaltensänderungen vor, die nicht mit dem bekannten Alltag des Nutzers vereinbar sind. Berücksichtige dabei besonders die Kategorie "Alltag_Einschraenkungen" aus dem Nutzerprofil.
-
-        GESPRÄCHSFÜHRUNG:
-        - Wenn der Nutzer ein Thema klar abschließt ("war einfach Pech", "nichts zu ändern", "passt so", "bespreche ich woanders") — akzeptiere das SOFORT, mach ggf. einen kurzen trockenen Kommentar, und wechsle das Thema aktiv. Frag NICHT nochmal nach dem gleichen Punkt.
-        - Stell nie zweimal hintereinander die gleiche Art von Frage ("was planst du als nächstes?", "wie bereitest du dich vor?"). Wenn die erste keine Resonanz fand, lass es.
-        - Wenn der Nutzer eine Empfehlung ablehnt, wiederhole sie nicht in anderer Form.
-        - Variiere den Ton: manchmal einfach kurz bestätigen ohne Frage, manchmal einen anderen Lebensbereich ansprechen, manchmal schweigen lassen.
-        - Erkenne Ironie, Humor und Selbstreferenz — reagiere darauf witzig oder trocken, nicht mit generischer Begeisterung.
-        - Verbiete dir selbst: "lass es mich wissen", "ich bin für dich da", "klingt spannend!", passive Einladungen. Entweder konkret nachfragen oder gar nicht.
-        - Keine Emojis.
-        - Wenn der Nutzer etwas relativiert, korrigiert oder ein Thema als erledigt/nicht relevant signalisiert: vollständig akzeptieren und KEINE Folgefrage stellen. Thema ist damit beendet.
-        - Schlage KEINE To-Dos für berufliche Themen vor (Meetings, Arbeitsprojekte, Kundentermine, Präsentationen). Nur private Themen: Gesundheit, Sport, persönliche Ziele, soziale Kontakte.
-
-        Antworte maximal 3 Sätze. Deine Antworten sollen knapp, direkt, motivierend oder kritisch sein.
-        Die aktuelle Nutzer-Nachricht ist eine direkte Antwort auf die letzte Berater-Frage in der Konversationshistorie oben.
-        """
-
-        # Chat-Interaktion mit OpenAI
-        completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=500,
-            temperature=0.7
-        )
-        ai_response_content = completion.choices[0].message.content.strip()
+Langzeitgedächtnis / Wichtige Erkenntnisse:
+{memory_text}
 
-        # Nachricht in Historie speichern
-        await _save_conversation_entry(user_id, user_message, ai_response_content, "")
-        
-        # Die letzte ai_prompt aus der Historie holen
-        last_ai_prompt = ""
-        if gespraechs_historie:
-            last_entry = gespraechs_historie[-1]
-            last_ai_prompt = last_entry.get('ai_prompt', '')
-
-        if len(user_message.split()) >= 5:
-            await extrahiere_und_speichere_profil_details(user_id, user_message, ai_response_content, last_ai_prompt)
-
-        # Commitment-Check: nur wenn Nachricht substanziell genug
-        todo_suggestion = None
-        if len(user_message.split()) >= 6:
-            try:
-                today_str = datetime.datetime.now().strftime("%Y-%m-%d")
-                commitment_check = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[{"role": "user", "content": f"""Heute ist {today_str}.
+Letzter Wochenbericht (historisch, kein aktueller Stand):
+{wochenbericht_text}
+
+Letzter Monatsbericht (historisch, kein aktueller Stand):
+{monatsbericht_text}
+
+Aktuelle Ziele:
+{ziele_text}
+
+Zusammenfassung der Gespräche der letzten Wochen:
+{zusammenfassung_text}
+
+Konversationshistorie (letzte 5 Nachrichten):
+{history_text}"""
+
+    messages = [
+        {"role": "system", "content": CHAT_ANWEISUNGEN},
+        {"role": "system", "content": kontext_nachricht},
+        {"role": "user", "content": user_message}
+    ]
+    return messages, kontext["gespraechs_historie"]
+
+
+async def _pruefe_commitment(user_id: str, user_message: str):
+    """Commitment-Check; legt einen gefundenen To-Do-Vorschlag für den Poll-Endpunkt ab."""
+    today_str = datetime.datetime.now().strftime("%Y-%m-%d")
+    commitment_check = await llm.complete(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": f"""Heute ist {today_str}.
 
 Analysiere diese Nachricht auf ein konkretes, wichtiges Commitment:
 "{user_message}"
@@ -1185,52 +1047,253 @@ Ein Commitment ist NUR relevant wenn ALLE Kriterien erfüllt sind:
 Antworte NUR mit JSON:
 {{"commitment": false}} — wenn kein echtes Commitment
 {{"commitment": true, "titel": "kurzer Aktions-Titel", "due_date": "YYYY-MM-DD oder null", "priority": "high/medium/low"}}"""}],
-                    response_format={"type": "json_object"},
-                    temperature=0
-                )
-                result = json.loads(commitment_check.choices[0].message.content)
-                if result.get("commitment"):
-                    todo_suggestion = {
-                        "titel": result.get("titel"),
-                        "due_date": result.get("due_date"),
-                        "priority": result.get("priority", "medium")
-                    }
-            except Exception:
-                pass
-
-        return {"response": ai_response_content, "created_todo": False, "created_routine": False, "todo_suggestion": todo_suggestion}
+        response_format={"type": "json_object"},
+        temperature=0,
+        cache=True,
+        tag="commitment",
+        timeout=15
+    )
+    result = json.loads(commitment_check.choices[0].message.content)
+    if result.get("commitment"):
+        post_processor.set_suggestion(user_id, {
+            "titel": result.get("titel"),
+            "due_date": result.get("due_date"),
+            "priority": result.get("priority", "medium")
+        })
+
+
+def _todo_vorschlag(user_message: str, analyse: Optional[TurnAnalysis]) -> Optional[Dict[str, Any]]:
+    """To-Do-Vorschlag aus der Turn-Analyse, nur für substanzielle Nachrichten."""
+    if analyse is None or analyse.commitment is None or len(user_message.split()) < 6:
+        return None
+    return analyse.commitment.model_dump()
+
+
+async def _nach_antwort(user_id: str, user_message: str, ai_response_content: str, gespraechs_historie: list, analyse: Optional[TurnAnalysis]) -> bool:
+    """Speichert die Antwort und plant die Profil-Extraktion im Hintergrund ein.
+
+    Der Commitment-Check läuft nur noch im Hintergrund, wenn keine Turn-Analyse vorliegt.
+    Gibt zurück, ob noch ein To-Do-Vorschlag aussteht (abholbar über /chat/{user_id}/todo_suggestion).
+    """
+    # Nachricht in Historie speichern
+    await _save_conversation_entry(user_id, user_message, ai_response_content, "")
+
+    # Die letzte ai_prompt aus der Historie holen
+    last_ai_prompt = ""
+    if gespraechs_historie:
+        last_entry = gespraechs_historie[-1]
+        last_ai_prompt = last_entry.get('ai_prompt', '')
+
+    post_processor.submit(user_id, "zusammenfassung", rolling_summary.nach_turn(user_id))
+    einstiegsfragen.nach_turn(user_id)
+
+    # Profil-Extraktion gesammelt über mehrere Turns (lokaler Filter statt Mindestlänge)
+    profil_extraktion.nach_turn(user_id, user_message, ai_response_content, last_ai_prompt)
+
+    # Commitment-Check: nur wenn Nachricht substanziell genug und nicht schon analysiert
+    if analyse is None and len(user_message.split()) >= 6:
+        post_processor.submit(user_id, "commitment_check", _pruefe_commitment(user_id, user_message))
+        return True
+    return False
+
+
+async def _chat_antwort(user_id: str, user_message: str):
+    """Lädt den Kontext und erzeugt die gpt-4o-Antwort. Gibt (antwort, gespraechs_historie) zurück."""
+    messages, gespraechs_historie = await _baue_chat_nachrichten(user_id, user_message)
+
+    # Chat-Interaktion mit OpenAI
+    completion = await llm.complete(
+        model="gpt-4o",
+        messages=messages,
+        max_tokens=500,
+        temperature=0.7,
+        tag="chat"
+    )
+    return completion.choices[0].message.content.strip(), gespraechs_historie
+
+
+async def _spekulativer_stream(user_id: str, user_message: str, puffer: asyncio.Queue):
+    """Streamt die Antwort in einen Puffer (None markiert das Ende). Gibt die Gesprächshistorie zurück."""
+    try:
+        messages, gespraechs_historie = await _baue_chat_nachrichten(user_id, user_message)
+        async for token in llm.stream(model="gpt-4o", messages=messages, max_tokens=500, temperature=0.7, tag="chat"):
+            puffer.put_nowait(token)
+        return gespraechs_historie
+    finally:
+        puffer.put_nowait(None)
+
+
+async def _intent_mit_spekulation(user_id: str, user_message: str, spekulation: Optional[Spekulation]):
+    """Wie _bearbeite_intent, verwirft aber die Spekulation, wenn es kein normaler Chat ist."""
+    try:
+        aktion, analyse = await _bearbeite_intent(user_id, user_message, spekulation)
+    except BaseException:
+        if spekulation:
+            spekulation.abbrechen()
+        raise
+    if aktion is not None and spekulation:
+        spekulation.verwerfen()
+    return aktion, analyse
+
+
+async def _idempotent(bereich: str, idempotency_key: Optional[str], daten: Any, factory):
+    """Führt factory() pro Idempotency-Key nur einmal aus (Duplikate warten bzw. bekommen die gespeicherte Antwort)."""
+    key = f"{bereich}:{idempotency_key}" if idempotency_key else None
+    try:
+        return await idempotenz.ausfuehren(key, fingerabdruck(daten), factory)
+    except IdempotenzKonflikt:
+        raise HTTPException(status_code=422, detail="Idempotency-Key wurde bereits für eine andere Anfrage verwendet.")
+
+
+# Chat-Funktion
+@app.post("/chat/{user_id}")
+async def chat(user_id: str, chat_input: ChatInput, idempotency_key: Optional[str] = Header(None)):
+    return await _idempotent(f"chat:{user_id}", idempotency_key, chat_input.model_dump(), lambda: _chat(user_id, chat_input.message))
+
+
+async def _chat(user_id: str, user_message: str):
+    spekulation = Spekulation("chat", lambda: _chat_antwort(user_id, user_message)) if SPECULATIVE_CHAT else None
+    aktion, analyse = await _intent_mit_spekulation(user_id, user_message, spekulation)
+    if aktion is not None:
+        return aktion
+
+    try:
+        if spekulation and spekulation.gestartet:
+            ai_response_content, gespraechs_historie = await spekulation.nutzen()
+        else:
+            ai_response_content, gespraechs_historie = await _chat_antwort(user_id, user_message)
+
+        suggestion_pending = await _nach_antwort(user_id, user_message, ai_response_content, gespraechs_historie, analyse)
+
+        return {"response": ai_response_content, "created_todo": False, "created_routine": False, "todo_suggestion": _todo_vorschlag(user_message, analyse), "todo_suggestion_pending": suggestion_pending}
 
     except Exception as e:
         print(f"Fehler in der Chat-Funktion: {e}")
         raise HTTPException(status_code=500, detail="Entschuldige, es gab ein Problem beim Verarbeiten deiner Anfrage. Bitte versuche es später noch einmal.")
 
-def detect_intent(user_message: str, recent_history: list) -> str:
+# Chat-Funktion mit Token-Streaming (Server-Sent Events)
+@app.post("/chat/{user_id}/stream")
+async def chat_stream(user_id: str, chat_input: ChatInput, idempotency_key: Optional[str] = Header(None)):
+    """Wie /chat, streamt die Antwort aber tokenweise als SSE (Events siehe streaming.py).
+
+    Die Antwort entsteht in einem eigenen Task: auch nach einem Client-Abbruch wird der Turn
+    gespeichert. Ein Duplikat mit demselben Idempotency-Key bekommt nur das done-Event.
+    """
+    key = f"chat:{user_id}:{idempotency_key}" if idempotency_key else None
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if key:
+        try:
+            vorhanden = idempotenz.beanspruchen(key, fingerabdruck(chat_input.model_dump()))
+        except IdempotenzKonflikt:
+            raise HTTPException(status_code=422, detail="Idempotency-Key wurde bereits für eine andere Anfrage verwendet.")
+        if vorhanden is not None:
+            return StreamingResponse(chat_streams.duplikat(vorhanden), media_type="text/event-stream", headers=headers)
+    events = chat_streams.starten(key, lambda senden: _chat_stream_antwort(user_id, chat_input.message, senden))
+    return StreamingResponse(events, media_type="text/event-stream", headers=headers)
+
+
+async def _chat_stream_antwort(user_id: str, user_message: str, senden) -> Dict[str, Any]:
+    """Wie _chat, gibt die Tokens aber über senden() weiter. Liefert die Nutzlast des done-Events."""
+    puffer: asyncio.Queue = asyncio.Queue()
+    spekulation = Spekulation("chat_stream", lambda: _spekulativer_stream(user_id, user_message, puffer)) if SPECULATIVE_CHAT else None
+    try:
+        aktion, analyse = await _intent_mit_spekulation(user_id, user_message, spekulation)
+        if aktion is not None:
+            return aktion
+
+        teile = []
+        if spekulation and spekulation.gestartet:
+            # Bereits gepufferte Tokens sofort ausliefern, danach live weiterlesen
+            spekulation.bestaetigen()
+            while (token := await puffer.get()) is not None:
+                teile.append(token)
+                senden(token)
+            gespraechs_historie = await spekulation.nutzen()
+        else:
+            messages, gespraechs_historie = await _baue_chat_nachrichten(user_id, user_message)
+            async for token in llm.stream(model="gpt-4o", messages=messages, max_tokens=500, temperature=0.7, tag="chat"):
+                teile.append(token)
+                senden(token)
+        ai_response_content = "".join(teile).strip()
+
+        # Historie erst nach vollständigem Stream schreiben
+        suggestion_pending = await _nach_antwort(user_id, user_message, ai_response_content, gespraechs_historie, analyse)
+        return {"response": ai_response_content, "created_todo": False, "created_routine": False, "todo_suggestion": _todo_vorschlag(user_message, analyse), "todo_suggestion_pending": suggestion_pending}
+    finally:
+        # Bei einem Fehler die laufende Spekulation nicht weiterlaufen lassen
+        if spekulation:
+            spekulation.abbrechen()
+
+# Betriebsmetriken
+@app.get("/metrics")
+async def get_metrics():
+    counters = metrics.snapshot()
+    # Anteil gecachter Prompt-Tokens pro LLM-Aufruf-Tag
+    cache_raten = {
+        f"{name[:-len('.prompt_tokens')]}.cached_share": metrics.rate(name[:-len('.prompt_tokens')] + ".cached_tokens", name)
+        for name in counters if name.startswith("llm.") and name.endswith(".prompt_tokens")
+    }
+    # Trefferquote des Ergebnis-Caches pro Extraktor
+    llm_cache_raten = {
+        f"{name[:-len('.miss')]}.hit_rate": metrics.rate(name[:-len('.miss')] + ".hit", name[:-len('.miss')] + ".hit", name)
+        for name in counters if name.startswith("llm_cache.") and name.endswith(".miss")
+    }
+    return {
+        "counters": counters,
+        "rates": {
+            **cache_raten,
+            **llm_cache_raten,
+            "intent_fast_path_hit_rate": metrics.rate("intent.fast_path.hit", "intent.fast_path.hit", "intent.fast_path.miss"),
+            "intent_fast_path_disagreement_rate": metrics.rate("intent.shadow.disagree", "intent.shadow.checked"),
+            "speculation_chat_waste_rate": metrics.rate("speculation.chat.wasted", "speculation.chat.used", "speculation.chat.wasted"),
+            "speculation_chat_stream_waste_rate": metrics.rate("speculation.chat_stream.wasted", "speculation.chat_stream.used", "speculation.chat_stream.wasted"),
+            "idempotency_join_rate": metrics.rate("idempotency.joined", "idempotency.executed", "idempotency.joined", "idempotency.replayed"),
+            "idempotency_replay_rate": metrics.rate("idempotency.replayed", "idempotency.executed", "idempotency.joined", "idempotency.replayed"),
+            "entry_question_prepared_rate": metrics.rate("entry_question.served_prepared", "entry_question.served_prepared", "entry_question.stale", "entry_question.missing"),
+            "entry_question_novelty_regenerate_rate": metrics.rate("entry_question.novelty.regenerated", "entry_question.novelty.checked"),
+            "profile_cache_hit_rate": metrics.rate("profile_cache.hit", "profile_cache.hit", "profile_cache.miss"),
+            "profile_extraction_calls_per_turn": metrics.rate("profile_extraction.batches", "profile_extraction.turns"),
+        },
+    }
+
+# To-Do-Vorschlag aus der Hintergrund-Nacharbeit abholen
+@app.get("/chat/{user_id}/todo_suggestion")
+async def get_todo_suggestion(user_id: str):
+    suggestion = post_processor.pop_suggestion(user_id)
+    return {"todo_suggestion": suggestion, "pending": suggestion is None and post_processor.is_pending(user_id, "commitment_check")}
+
+async def detect_intent(user_message: str, recent_history: list) -> str:
     """Erkennt ob die Nachricht ein Todo, eine Routine oder normaler Chat ist."""
     context = ""
     if recent_history:
         last = recent_history[-1]
         if last.get("ai_response"):
             context = f"Letzte KI-Antwort: {last['ai_response']}\n"
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"{context}Neue Nachricht: '{user_message}'\nIst das eine Anfrage zum Erstellen eines einmaligen To-Dos (z.B. 'bis Freitag erledigen'), eine Bitte oder Absicht eine wiederkehrende Routine anzulegen (NUR wenn der Nutzer eine Verpflichtung oder Absicht mit konkretem Zeitplan ausdrückt: 'ich muss jeden X', 'ich will jeden X', 'erstelle', 'richte ein', 'als Routine', 'tracken' — NICHT wenn er nur beschreibt was er bereits regelmäßig tut, z.B. 'ich mache sonntags X'), eine Korrektur oder Änderung eines bestehenden To-Dos — NUR wenn in der letzten KI-Antwort ein To-Do besprochen wurde, NICHT wenn über Routinen oder andere Themen gesprochen wurde (z.B. 'nein, bitte korrigieren', 'Datum ändern', 'Relevanz hoch', 'doch am Dienstag'), ein Löschen oder Entfernen eines bestehenden To-Dos (z.B. 'lösch das To-Do', 'bitte entfernen', 'rausnehmen'), eine Meldung dass bestimmte Ereignisse/Vorhaben/Reisen/Aktivitäten bereits vergangen oder abgeschlossen sind (z.B. 'X ist vorbei', 'X war letztes Jahr', 'X ist abgeschlossen', 'X sind alle vergangen'), eine Antwort auf eine Terminauswahl für eine Routine, oder normaler Chat? Antworte nur mit: todo, routine, todo_update, todo_delete, archive_profile, routine_datum oder chat"}],
         temperature=0,
-        max_tokens=15
+        cache=True,
+        tag="intent",
+        max_tokens=15,
+        timeout=10
     )
     return response.choices[0].message.content.strip().lower()
 
 async def update_latest_todo(user_id: str, user_message: str, last_ai_response: str):
-    todos = supabase.table("todos").select("id, title, due_date, priority").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(5).execute().data
+    todos = await db.fetch(db.table("todos").select("id, title, due_date, priority").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(5))
     if not todos:
         return None, {}
     today = datetime.datetime.now().strftime("%Y-%m-%d")
     todos_info = [f"ID {t['id']}: '{t['title']}' (Datum: {t['due_date']}, Priorität: {t['priority']})" for t in todos]
     todos_text = "\n".join(todos_info)
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"Heute ist {today}. Letzte KI-Antwort: '{last_ai_response}'. Nutzer sagt: '{user_message}'.\nOffene To-Dos:\n{todos_text}\nWelches To-Do ist inhaltlich gemeint? Wichtig: Suche nach dem Thema des To-Dos, NICHT nach Wörtern die zufällig im Titel vorkommen. Beispiel: 'Den Friseurtermin korrigieren' meint das To-Do 'Friseurtermin', nicht 'Termin korrigieren'. Falls kein To-Do eindeutig passt, gib todo_id als null zurück. Was soll geändert werden? Antworte nur mit JSON: {{\"todo_id\": <ID oder null>, \"title\": null, \"due_date\": null, \"priority\": null}} — nur geänderte Felder befüllen, unveränderliche als null."}],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        cache=True,
+        tag="todo_update"
     )
     result = json.loads(response.choices[0].message.content)
     todo_id = result.get("todo_id")
@@ -1248,35 +1311,38 @@ async def update_latest_todo(user_id: str, user_message: str, last_ai_response:
     if result.get("priority") in ["low", "medium", "high"]:
         update_data["priority"] = result["priority"]
     if update_data:
-        supabase.table("todos").update(update_data).eq("id", todo["id"]).execute()
+        await db.execute(db.table("todos").update(update_data).eq("id", todo["id"]))
     return todo["title"], update_data
 
 async def archive_profile_entries(user_id: str, user_message: str):
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"Nachricht: '{user_message}'\nWelche konkreten Ereignisse, Reisen, Vorhaben oder Aktivitäten werden als vergangen/abgeschlossen bezeichnet? Gib eine Liste von kurzen Keywords zurück (z.B. ['Kolumbien', 'Halbmarathon', 'Sambia']). Antworte NUR mit JSON: {{\"keywords\": [...]}}"}],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        cache=True,
+        tag="archivierung"
     )
     keywords = json.loads(response.choices[0].message.content).get("keywords", [])
-    archived_names = []
+    aenderungen = ProfilAenderungen(user_id)
     for keyword in keywords:
-        matches = supabase.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id).eq("archived", False).or_(f"attribute_value.ilike.%{keyword}%,attribute_name.ilike.%{keyword}%").execute().data
-        for entry in matches:
-            supabase.table("profile").update({"archived": True}).eq("user_id", user_id).eq("attribute_name", entry["attribute_name"]).execute()
-            archived_names.append(entry["attribute_name"])
+        aenderungen.archivieren_passend(keyword)
+    _, archived_names = await aenderungen.anwenden(db, profil_cache)
+    vektor_index.entfernen(profil_key(user_id, name) for name in archived_names)
     return archived_names
 
 async def delete_todo_from_chat(user_id: str, user_message: str, last_ai_response: str):
-    todos = supabase.table("todos").select("id, title").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(10).execute().data
+    todos = await db.fetch(db.table("todos").select("id, title").eq("user_id", user_id).eq("is_recurring", False).eq("status", "open").order("id", desc=True).limit(10))
     if not todos:
         return None
     todos_text = "\n".join([f"ID {t['id']}: '{t['title']}'" for t in todos])
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"Letzte KI-Antwort: '{last_ai_response}'. Nutzer sagt: '{user_message}'.\nOffene To-Dos:\n{todos_text}\nWelches To-Do soll gelöscht werden? Suche nach dem Thema, nicht nach zufälligen Wörtern. Falls kein To-Do eindeutig passt, gib todo_id als null zurück. Antworte nur mit JSON: {{\"todo_id\": <ID oder null>}}"}],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        cache=True,
+        tag="todo_loeschen"
     )
     result = json.loads(response.choices[0].message.content)
     todo_id = result.get("todo_id")
@@ -1285,27 +1351,16 @@ async def delete_todo_from_chat(user_id: str, user_message: str, last_ai_respons
     todo = next((t for t in todos if t["id"] == todo_id), None)
     if todo is None:
         return None
-    supabase.table("todos").delete().eq("id", todo["id"]).eq("user_id", user_id).execute()
+    await db.execute(db.table("todos").delete().eq("id", todo["id"]).eq("user_id", user_id))
     return todo["title"]
 
-async def create_todo_from_chat(user_id: str, message: str, last_ai_response: str = ""):
-    """Erstellt To-Do aus Chat-Message via GPT"""
-    today = datetime.datetime.now().strftime("%Y-%m-%d")
-    context = f"Vorheriger Gesprächskontext: '{last_ai_response}'\n" if last_ai_response else ""
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{
-            "role": "user",
-            "content": f"Heute ist {today}. {context}Nutzer-Nachricht: '{message}'. Falls die Nachricht auf den Kontext verweist (z.B. 'dazu', 'das', 'es'), nutze den Kontext um das eigentliche Thema zu verstehen. Extrahiere: Aufgabentitel als Nomen oder kurze Nomen-Phrase, maximal 4 Wörter, KEIN ganzer Satz (Beispiel: 'Arzttermin buchen' statt 'ich muss einen Arzt anrufen'), korrektes Deutsch mit Großschreibung und Umlauten. Außerdem: Fälligkeitsdatum (YYYY-MM-DD oder null) und Priorität (low/medium/high). Antworte nur mit JSON: {{\"title\": \"...\", \"due_date\": \"...\", \"priority\": \"...\"}}"
-        }],
-        response_format={"type": "json_object"},
-        temperature=0
-    )
-    data = json.loads(response.choices[0].message.content)
-    title = data.get("title", "Neue Aufgabe")
+async def create_todo_from_chat(user_id: str, message: str, last_ai_response: str = "", felder: Optional[dict] = None):
+    """Erstellt To-Do aus Chat-Message; die Felder kommen aus der Turn-Analyse oder werden per GPT extrahiert"""
+    data = felder if felder is not None else await _extrahiere_todo_felder(message, last_ai_response)
+    title = data.get("title") or "Neue Aufgabe"
     due_date_raw = data.get("due_date")
     due_date = due_date_raw if (due_date_raw and re.match(r'^\d{4}-\d{2}-\d{2}$', str(due_date_raw))) else None
-    priority = data.get("priority", "medium")
+    priority = data.get("priority") or "medium"
     
     todo_data = {
         "user_id": user_id,
@@ -1322,10 +1377,26 @@ async def create_todo_from_chat(user_id: str, message: str, last_ai_response: st
         "parent_todo_id": None
     }
     
-    result = supabase.table("todos").insert(todo_data).execute()
+    result = await db.execute(db.table("todos").insert(todo_data))
     
     return title, priority, due_date
 
+async def _extrahiere_todo_felder(message: str, last_ai_response: str = "") -> dict:
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    context = f"Vorheriger Gesprächskontext: '{last_ai_response}'\n" if last_ai_response else ""
+    response = await llm.complete(
+        model="gpt-4o-mini",
+        messages=[{
+            "role": "user",
+            "content": f"Heute ist {today}. {context}Nutzer-Nachricht: '{message}'. Falls die Nachricht auf den Kontext verweist (z.B. 'dazu', 'das', 'es'), nutze den Kontext um das eigentliche Thema zu verstehen. Extrahiere: Aufgabentitel als Nomen oder kurze Nomen-Phrase, maximal 4 Wörter, KEIN ganzer Satz (Beispiel: 'Arzttermin buchen' statt 'ich muss einen Arzt anrufen'), korrektes Deutsch mit Großschreibung und Umlauten. Außerdem: Fälligkeitsdatum (YYYY-MM-DD oder null) und Priorität (low/medium/high). Antworte nur mit JSON: {{\"title\": \"...\", \"due_date\": \"...\", \"priority\": \"...\"}}"
+        }],
+        response_format={"type": "json_object"},
+        temperature=0,
+        cache=True,
+        tag="todo_felder"
+    )
+    return json.loads(response.choices[0].message.content)
+
 FREQUENCY_TEXT = {
     'daily': 'täglich', 'weekly': 'wöchentlich', 'monthly': 'monatlich',
     'biweekly': 'alle zwei Wochen', 'triweekly': 'alle drei Wochen', 'fourweekly': 'alle vier Wochen',
@@ -1344,11 +1415,13 @@ def get_next_weekday(weekday_name: str) -> datetime.date:
 
 async def extract_routine_info(message: str) -> dict:
     today = datetime.datetime.now().strftime("%Y-%m-%d")
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"Heute ist {today}. Extrahiere aus dieser Nachricht:\n1. Aufgabentitel: Nomen oder kurze Phrase, max. 4 Wörter, kein ganzer Satz, korrektes Deutsch (Beispiel: 'Sport machen' statt 'ich will Sport machen').\n2. Intervall: Gib ENTWEDER 'interval_days' (Anzahl Tage) ODER 'interval_months' (Anzahl Monate) an – nie beides. Beispiele: täglich→1Tag, wöchentlich→7Tage, alle 2 Wochen→14Tage, monatlich→1Monat, alle 3 Monate→3Monate, halbjährlich→6Monate, alle 5 Monate→5Monate, jährlich→12Monate.\n3. Optional: 'weekday' (monday-sunday) wenn ein Wochentag genannt wird; 'day_of_month' (Zahl 1-31 oder 'last') wenn ein Monatstag genannt wird.\nNachricht: '{message}'\nAntworte nur mit JSON: {{\"task\":\"...\",\"interval_days\":null,\"interval_months\":null,\"weekday\":null,\"day_of_month\":null}}"}],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        cache=True,
+        tag="routine"
     )
     return json.loads(response.choices[0].message.content)
 
@@ -1371,7 +1444,7 @@ async def insert_routine(user_id: str, task: str, frequency: str, day: str, next
         "last_checked_date": None,
         "created_at": datetime.datetime.utcnow().isoformat() + 'Z',
     }
-    supabase.table("todos").insert(todo_data).execute()
+    await db.execute(db.table("todos").insert(todo_data))
 
 def add_months(dt: datetime.datetime, months: int) -> datetime.datetime:
     month = dt.month + months
@@ -1427,424 +1500,28 @@ def get_frequency_text(frequency: str) -> str:
 
 async def parse_routine_clarification(user_message: str, last_ai_response: str) -> dict:
     today = datetime.datetime.now().strftime("%Y-%m-%d")
-    response = client.chat.completions.create(
+    response = await llm.complete(
         model="gpt-4o-mini",
         messages=[{"role": "user", "content": f"Heute ist {today}. Die KI hat gefragt: '{last_ai_response}'. Der Nutzer hat geantwortet: '{user_message}'. Extrahiere die vollständige Routine: Aufgabentitel, interval_days oder interval_months, weekday (monday-sunday oder null), day_of_month (Zahl oder 'last' oder null), chosen_date (YYYY-MM-DD wenn der Nutzer ein konkretes Datum gewählt hat, sonst null). Antworte mit JSON: {{\"task\":\"...\",\"interval_days\":null,\"interval_months\":null,\"weekday\":null,\"day_of_month\":null,\"chosen_date\":null}}"}],
         response_format={"type": "json_object"},
-        temperature=0
+        temperature=0,
+        cache=True,
+        tag="routine_klaerung"
     )
     return json.loads(response.choices[0].message.content)
 
 # Automatischer Wochen-, Monats- und Jahresbericht
 @app.get("/bericht/automatisch")
 async def automatischer_bericht(user_id: str = "1"):
-    heute_utc = datetime.datetime.utcnow()
-    wochentag_utc = heute_utc.weekday()
-
-    bericht_typ = None
-    bericht_inhalt = None
-
-    # Jahresbericht: beim ersten Öffnen im neuen Jahr, falls noch keiner für dieses Jahr existiert
-    first_of_this_year = heute_utc.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    existing_yearly = supabase.table("long_term_memory") \
-        .select("id") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Jahresrückblick") \
-        .gte("timestamp", first_of_this_year.isoformat() + 'Z') \
-        .execute().data
-
-    if not existing_yearly and heute_utc.month > 1:
-        bericht_typ = "Jahresrückblick"
-        bericht_inhalt = await generiere_jahresbericht(user_id)
-
-    else:
-        # Quartalsbericht: beim ersten Öffnen eines neuen Quartals (Jan, Apr, Jul, Okt)
-        quartal_monate = [1, 4, 7, 10]
-        if heute_utc.month in quartal_monate:
-            first_of_quarter = heute_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            existing_quarterly = supabase.table("long_term_memory") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .eq("thema", "Quartalsbericht") \
-                .gte("timestamp", first_of_quarter.isoformat() + 'Z') \
-                .execute().data
-            if not existing_quarterly and heute_utc.day > 1:
-                bericht_typ = "Quartalsbericht"
-                bericht_inhalt = await generiere_quartalsbericht(user_id)
-
-    if bericht_typ is None:
-        # Monatsbericht: beim ersten Öffnen im neuen Monat, falls noch keiner für diesen Monat existiert
-        first_of_this_month = heute_utc.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        existing_monthly = supabase.table("long_term_memory") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .eq("thema", "Monatsrückblick") \
-            .gte("timestamp", first_of_this_month.isoformat() + 'Z') \
-            .execute().data
-
-        if not existing_monthly and heute_utc.day > 1:
-            bericht_typ = "Monatsrückblick"
-            bericht_inhalt = await generiere_rueckblick("Monats", 30, user_id)
-            try:
-                supabase.table("conversation_history") \
-                    .delete() \
-                    .eq("user_id", user_id) \
-                    .lt("timestamp", first_of_this_month.isoformat() + 'Z') \
-                    .execute()
-            except Exception as e:
-                print(f"Fehler beim Cleanup der Konversationshistorie: {e}")
-
-    if bericht_typ is None:
-        # Letzten Sonntag ermitteln (oder heute, falls Sonntag)
-        days_since_sunday = (heute_utc.weekday() + 1) % 7
-        last_sunday = (heute_utc - datetime.timedelta(days=days_since_sunday)).replace(hour=0, minute=0, second=0, microsecond=0)
-        monday_of_last_week = (last_sunday - datetime.timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
-        existing_weekly = supabase.table("long_term_memory") \
-            .select("id") \
-            .eq("user_id", user_id) \
-            .eq("thema", "Wochenrückblick") \
-            .gte("timestamp", last_sunday.isoformat() + 'Z') \
-            .execute().data
-        if not existing_weekly:
-            bericht_typ = "Wochenrückblick"
-            bericht_inhalt = await generiere_rueckblick("Wochen", 7, user_id, seit=monday_of_last_week.isoformat() + 'Z')
-
-    if bericht_typ is None:
+    # Berichte erzeugt der Scheduler im Hintergrund; hier wird nur der fertige abgeholt
+    bericht = await bericht_scheduler.abholen(user_id)
+    if bericht is None:
         return {"typ": None, "inhalt": "Heute wird kein Bericht generiert."}
-    return {"typ": bericht_typ, "inhalt": bericht_inhalt}
-
-async def generiere_quartalsbericht(user_id: str):
-    heute = datetime.datetime.now()
-    quartal = (heute.month - 1) // 3 + 1
-    quartal_name = f"Q{quartal} {heute.year}"
-
-    monatsberichte = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Monatsrückblick") \
-        .order("timestamp", desc=True) \
-        .limit(3) \
-        .execute().data
-
-    monatsberichte_text = "\n\n".join([
-        f"Monatsbericht ({m['timestamp'][:7]}):\n{m['inhalt']}" for m in reversed(monatsberichte)
-    ]) if monatsberichte else "Keine Monatsberichte vorhanden."
-
-    profil_data = supabase.table("profile") \
-        .select("attribute_name, attribute_value") \
-        .eq("user_id", user_id) \
-        .execute().data
-    profil_text = "\n".join([f"- {p['attribute_name']}: {p['attribute_value']}" for p in profil_data]) if profil_data else "Keine Profildaten."
-
-    frueherer_quartale_res = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Quartalsbericht") \
-        .order("timestamp", desc=True) \
-        .limit(4) \
-        .execute().data
-    frueherer_quartale_text = "\n\n".join([
-        f"Quartalsbericht ({q['timestamp'][:7]}):\n{q['inhalt']}" for q in reversed(frueherer_quartale_res)
-    ]) if frueherer_quartale_res else "Keine früheren Quartalsberichte vorhanden."
-
-    letzter_jahresbericht_res = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Jahresrückblick") \
-        .order("timestamp", desc=True) \
-        .limit(1) \
-        .execute().data
-    letzter_jahresbericht_text = f"Letzter Jahresbericht ({letzter_jahresbericht_res[0]['timestamp'][:7]}):\n{letzter_jahresbericht_res[0]['inhalt']}" \
-        if letzter_jahresbericht_res else "Kein Jahresbericht vorhanden."
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": f"""Du bist ein persönlicher Coach. Erstelle einen Quartalsbericht für {quartal_name} basierend auf den letzten 3 Monatsberichten.
-Der Bericht hat ZWEI klar getrennte Teile:
-
-TEIL 1 — WOHLWOLLEND: Übertrieben lobendes, warmherziges Lob. Feiere jeden Fortschritt als riesige Leistung. Positiv, motivierend, fast schon übertrieben anerkennend.
-
-TEIL 2 — PROVOKATIV: Direkte, unverblümte Ansagen was sich ändern MUSS. Kein Weichspülen. Klare Sprache wie "So geht das nicht weiter", "Reiß dich zusammen", "Das ist keine Ausrede". Konkrete Verhaltensänderungen benennen.
-
-Vergleiche dabei auch mit den früheren Quartalsberichten und dem Jahresbericht — hat sich etwas verbessert, oder wiederholen sich dieselben Muster? Passt das Quartal zur Jahresrichtung?"""},
-            {"role": "user", "content": f"""Quartal: {quartal_name}
-
-Monatsberichte:
-{monatsberichte_text}
-
-Frühere Quartalsberichte (Entwicklung über die Zeit):
-{frueherer_quartale_text}
-
-Übergeordneter Kontext:
-{letzter_jahresbericht_text}
-
-Benutzerprofil:
-{profil_text}"""}
-        ],
-        max_tokens=900,
-        temperature=0.8
-    )
-
-    bericht = response.choices[0].message.content
-
-    supabase.table("long_term_memory").insert({
-        "thema": "Quartalsbericht",
-        "inhalt": bericht,
-        "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
-        "user_id": user_id
-    }).execute()
-
-    return bericht
-
-async def generiere_jahresbericht(user_id: str):
-    heute = datetime.datetime.now()
-    jahr = heute.year
-
-    # Letzte 12 Monatsberichte als Hauptquelle
-    monatsberichte = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Monatsrückblick") \
-        .order("timestamp", desc=False) \
-        .limit(12) \
-        .execute().data
-
-    if monatsberichte:
-        monatsberichte_text = "\n\n".join([f"Monatsbericht ({m['timestamp'][:7]}):\n{m['inhalt']}" for m in monatsberichte])
-    else:
-        monatsberichte_text = "Keine Monatsberichte vorhanden."
-
-    profil_data = supabase.table("profile") \
-        .select("attribute_name, attribute_value") \
-        .eq("user_id", user_id) \
-        .execute().data
-    profil_text = "\n".join([f"- {p['attribute_name']}: {p['attribute_value']}" for p in profil_data]) if profil_data else "Keine Profildaten."
-
-    all_ziele = supabase.table("goals").select("titel, status").eq("user_id", user_id).execute().data
-    ziele_text = "\n".join([f"- {z['titel']} ({z['status']})" for z in all_ziele]) if all_ziele else "Keine Ziele."
-
-    frueherer_jahresberichte = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", "Jahresrückblick") \
-        .order("timestamp", desc=True) \
-        .limit(3) \
-        .execute().data
-    vorheriger_bericht = "\n\n".join([
-        f"Jahresbericht ({j['timestamp'][:7]}):\n{j['inhalt']}" for j in reversed(frueherer_jahresberichte)
-    ]) if frueherer_jahresberichte else "Kein früherer Jahresbericht."
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": f"""Du bist ein persönlicher Coach. Erstelle einen ausführlichen Jahresrückblick für {jahr} basierend auf den Monatsberichten des gesamten Jahres.
-Der Bericht hat ZWEI klar getrennte Teile und erzählt eine Geschichte — keine Stichpunkte, sondern fließender, lebendiger Prosa-Text.
-
-TEIL 1 — WOHLWOLLEND: Erzähle das Jahr als eine bewegende Geschichte voller Wachstum und Leistung. Feiere jeden Fortschritt als riesige Leistung. Geh Monat für Monat durch das Jahr und male ein warmherziges, lobendes Bild der Reise. Übertrieben anerkennend, motivierend, fast schon euphorisch — aber basierend auf dem was wirklich passiert ist.
-
-TEIL 2 — PROVOKATIV: Direkte, unverblümte Ansagen was sich über das Jahr nicht verändert hat und sich dringend ändern MUSS. Kein Weichspülen. Klare Sprache wie "So geht das nicht weiter", "Reiß dich zusammen", "Das ist keine Ausrede". Benenne wiederkehrende Muster schonungslos. Konkrete Verhaltensänderungen für das nächste Jahr.
-
-Vergleiche auch mit früheren Jahresberichten — was hat sich über die Jahre verändert, was bleibt hartnäckig gleich?
-
-ABSCHLUSS: Beende den Bericht auf einer positiven, vorwärtsgewandten Note — eine ermutigende Vision für das kommende Jahr, die Lust macht weiterzumachen."""},
-            {"role": "user", "content": f"""Jahr: {jahr}
-
-Monatsberichte des Jahres:
-{monatsberichte_text}
-
-Ziele:
-{ziele_text}
-
-Benutzerprofil:
-{profil_text}
-
-Frühere Jahresberichte (Entwicklung über die Jahre):
-{vorheriger_bericht}"""}
-        ],
-        max_tokens=1500,
-        temperature=0.8
-    )
-
-    bericht = response.choices[0].message.content
-
-    supabase.table("long_term_memory").insert({
-        "thema": "Jahresrückblick",
-        "inhalt": bericht,
-        "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
-        "user_id": user_id
-    }).execute()
-
     return bericht
 
-# Wochen- und Monatsberichte generieren (mit Summarisierung)
-async def generiere_rueckblick(zeitraum: str, tage: int, user_id: str, seit: str = None):
-    if seit is None:
-        seit = (datetime.datetime.utcnow() - datetime.timedelta(days=tage)).isoformat() + 'Z'
-
-    # Rufe die gesamte Konversationshistorie für den Zeitraum ab
-    all_gespraeche = supabase.table("conversation_history").select("user_input, ai_response, ai_prompt, timestamp").gte("timestamp", seit).eq("user_id", user_id).order("timestamp", desc=False).execute().data
-    all_ziele = supabase.table("goals").select("titel", "status", "created_at").gte("created_at", seit).eq("user_id", user_id).order("created_at", desc=False).execute().data
-
-    profil_data = supabase.table("profile") \
-        .select("attribute_name, attribute_value") \
-        .eq("user_id", user_id) \
-        .execute().data
-    
-    profil_text = ""
-    if profil_data:
-        profil_text = "\n".join([f"- {item['attribute_name']}: {item['attribute_value']}" for item in profil_data])
-    else:
-        profil_text = "Keine Profildaten vorhanden."
-
-    # Alle Gespräche des Zeitraums für den Prompt nutzen
-    gespraeche_text_for_prompt = ""
-    if all_gespraeche:
-        formatted_gespraeche = []
-        for g in all_gespraeche:
-            if g.get('user_input'):
-                formatted_gespraeche.append(f"User: {g['user_input']}")
-            if g.get('ai_response'):
-                formatted_gespraeche.append(f"Berater: {g['ai_response']}")
-            if g.get('ai_prompt'):
-                formatted_gespraeche.append(f"Einstiegsfrage: {g['ai_prompt']}")
-        gespraeche_text_for_prompt += "\n".join(formatted_gespraeche)
-        if len(gespraeche_text_for_prompt) > 3000:
-            gespraeche_text_for_prompt = summarize_text_with_gpt(
-                gespraeche_text_for_prompt,
-                summary_length=400,
-                prompt_context="besprochene Themen, Fortschritte, Herausforderungen und Muster. Wichtig: erhalte explizit wenn der Nutzer ein Thema als vergangen eingeordnet hat (z.B. 'das war vor Jahren') oder den Berater korrigiert hat, weil dieser ein nicht mehr aktuelles Thema angesprochen hat"
-            )
-    else:
-        gespraeche_text_for_prompt = "Es gab keine relevanten Gespräche in diesem Zeitraum."
-
-    # Ziele können oft kompakter sein. Wenn sie aber auch zu lang werden, hier auch summarisieren.
-    ziele_text = "\n".join([f"{z['titel']} ({z['status']})" for z in all_ziele[-20:]]) # max. die letzten 20 Ziele
-
-    _report_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    all_routines_res = supabase.table("todos") \
-        .select("title, recurrence_weekday, last_checked_date, missed_count") \
-        .eq("user_id", user_id) \
-        .eq("is_recurring", True) \
-        .not_.in_("status", ["completed", "archived"]) \
-        .execute().data
-
-    routinen_text = ""
-    if all_routines_res:
-        routinen_text = "\n".join([f"- {r['title']} (Tag: {r['recurrence_weekday']}, Heute erledigt: {'Ja' if r.get('last_checked_date') == _report_date else 'Nein'}, Verpasst: {r.get('missed_count', 0)})" for r in all_routines_res])
-    else:
-        routinen_text = "Keine Routinen vorhanden."
-        
-    latest_reports_res = supabase.table("long_term_memory") \
-        .select("inhalt, timestamp") \
-        .eq("user_id", user_id) \
-        .eq("thema", f"{zeitraum}rückblick") \
-        .order("timestamp", desc=True) \
-        .limit(4) \
-        .execute().data
-
-    if latest_reports_res:
-        previous_report_content = "\n\n".join([
-            f"Bericht vom {r['timestamp'][:10]}:\n{r['inhalt']}" for r in reversed(latest_reports_res)
-        ])
-    else:
-        previous_report_content = "Kein früherer Bericht dieses Typs vorhanden."
-
-    # Übergeordneter Kontext: eine Ebene höher
-    uebergeordnet_text = ""
-    if zeitraum == "Wochen":
-        letzter_monat = supabase.table("long_term_memory").select("inhalt, timestamp") \
-            .eq("user_id", user_id).eq("thema", "Monatsrückblick") \
-            .order("timestamp", desc=True).limit(1).execute().data
-        letzter_quartal = supabase.table("long_term_memory").select("inhalt, timestamp") \
-            .eq("user_id", user_id).eq("thema", "Quartalsbericht") \
-            .order("timestamp", desc=True).limit(1).execute().data
-        if letzter_monat:
-            uebergeordnet_text += f"Letzter Monatsbericht ({letzter_monat[0]['timestamp'][:7]}):\n{letzter_monat[0]['inhalt']}"
-        if letzter_quartal:
-            uebergeordnet_text += f"\n\nLetzter Quartalsbericht ({letzter_quartal[0]['timestamp'][:7]}):\n{letzter_quartal[0]['inhalt']}"
-    elif zeitraum == "Monats":
-        letzter_quartal = supabase.table("long_term_memory").select("inhalt, timestamp") \
-            .eq("user_id", user_id).eq("thema", "Quartalsbericht") \
-            .order("timestamp", desc=True).limit(1).execute().data
-        if letzter_quartal:
-            uebergeordnet_text = f"Letzter Quartalsbericht ({letzter_quartal[0]['timestamp'][:7]}):\n{letzter_quartal[0]['inhalt']}"
-
-    heute = datetime.datetime.now()
-    if zeitraum == "Monats":
-        zeitraum_label = heute.strftime('%B %Y')
-    else:
-        montag = (heute - datetime.timedelta(days=heute.weekday())).strftime('%d.%m.')
-        zeitraum_label = f"Woche {montag} – {heute.strftime('%d.%m.%Y')}"
-
-    system = f"""
-    Du bist ein persönlicher Chronist. Schreibe einen knappen, nüchternen Rückblick — was war, nicht was fehlt.
-    Wenn wenig besprochen wurde, schreibe wenig — lieber 3 Sätze als aufgebauschte Stichpunkte.
-    Maximal 150 Wörter. Struktur:
-    - 2-4 Stichpunkte zu besprochenen Themen/Aktivitäten (neutral beschreibend)
-    - 1 Satz: was gerade im Fokus steht
-    - 1 kurzer, konkreter Hinweis oder Beobachtung am Ende — kein allgemeiner Ratschlag, sondern etwas Spezifisches aus dieser Woche
-    Keine Problemdiagnosen, keine Listen von "nächsten Schritten".
-    Nutze den übergeordneten Kontext nur um einzuordnen ob aktuelle Themen zur größeren Richtung passen — kein Urteil.
-
-    WICHTIG — Zeitliche Einordnung (Heute: {heute.strftime('%d. %B %Y')}):
-    - Ereignisse und Termine die vor dem heutigen Datum lagen, sind VERGANGEN — schreibe sie im Präteritum
-    - Profil-Einträge mit "abgeschlossen" sind Vergangenheit — nicht als aktuell oder bevorstehend behandeln
-    - Nur was noch in der Zukunft liegt oder gerade läuft, als aktuell formulieren
-    - Wenn in den Gesprächen steht "ich habe Sorge wegen X" aber X-Datum liegt vor heute → X ist bereits passiert, formuliere entsprechend
-
-    WICHTIG — Nutzer vs. Berater:
-    - Unterscheide wer ein Thema eingebracht hat: "User:" oder "Berater:/Einstiegsfrage:"
-    - Wenn der Berater ein Thema angesprochen hat und der Nutzer daraufhin klargestellt hat, dass es nicht aktuell ist oder in der Vergangenheit liegt, halte die Einordnung des Nutzers fest — nicht die Darstellung des Beraters
-    - Beispiel: statt "Es wurde über X gesprochen" → "Nutzer stellte klar, dass X abgeschlossen ist und kein aktuelles Thema darstellt"
-    """
-    uebergeordnet_abschnitt = f"\n\n    Übergeordneter Kontext (höhere Berichtsebene):\n    {uebergeordnet_text}" if uebergeordnet_text else ""
-    user = f"""
-    Zeitraum: {zeitraum_label}
-
-    Gespräche:
-    {gespraeche_text_for_prompt}
-
-    Ziele (Status):
-    {ziele_text}
-
-    Routinen:
-    {routinen_text}
-
-    Frühere Berichte gleichen Typs (Entwicklung über die Zeit):
-    {previous_report_content}{uebergeordnet_abschnitt}
-
-    Benutzerprofil-Details:
-    {profil_text}
-
-    Fasse dich kurz — maximal 200 Wörter, keine langen Ausführungen.
-    """
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        max_tokens=400,
-        temperature=0.7
-    )
-
-    bericht = response.choices[0].message.content
-
-    # Bericht speichern
-    supabase.table("long_term_memory").insert({
-        "thema": f"{zeitraum}rückblick",
-        "inhalt": bericht,
-        "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
-        "user_id": user_id # user_id auch hier speichern!
-    }).execute()
-
-    return bericht
-    
 # Endpunkt zum Abrufen des neuesten gespeicherten Berichts
 @app.get("/bericht/abrufen/{report_type_name}")
-def get_stored_report(report_type_name: str, user_id: str = "1"):
+async def get_stored_report(report_type_name: str, user_id: str = "1"):
     try:
         # Hier wird der "thema"-String genau so gesucht, wie er gespeichert wird
         # (z.B. "Wochenrückblick" oder "Monatsrückblick", ohne 's')
@@ -1853,13 +1530,12 @@ def get_stored_report(report_type_name: str, user_id: str = "1"):
         if report_type_name not in ["Wochenrückblick", "Monatsrückblick", "Quartalsbericht", "Jahresrückblick"]:
             raise HTTPException(status_code=400, detail="Ungültiger Berichtstyp angefragt.")
 
-        report_data = supabase.table("long_term_memory") \
+        report_data = await db.fetch(db.table("long_term_memory") \
             .select("inhalt") \
             .eq("user_id", user_id) \
             .eq("thema", report_type_name) \
             .order("timestamp", desc=True) \
-            .limit(1) \
-            .execute().data
+            .limit(1))
         
         if report_data:
             return {"inhalt": report_data[0]["inhalt"]}
@@ -1873,7 +1549,7 @@ def get_stored_report(report_type_name: str, user_id: str = "1"):
 
 # Routinen abrufen
 @app.get("/routines/{user_id}")
-def get_routines(user_id: str):
+async def get_routines(user_id: str):
     today = datetime.datetime.now().strftime("%A").lower()
     current_date = datetime.datetime.now().strftime("%Y-%m-%d")
     yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%A").lower()
@@ -1895,12 +1571,11 @@ def get_routines(user_id: str):
         }
 
     try:
-        all_user_routines = supabase.table("todos") \
+        all_user_routines = await db.fetch(db.table("todos") \
             .select("id, title, recurrence_weekday, last_checked_date, status, missed_count, missed_dates, recurrence_type, recurrence_day, due_date") \
             .eq("user_id", user_id) \
             .eq("is_recurring", True) \
-            .not_.in_("status", ["completed", "archived"]) \
-            .execute().data
+            .not_.in_("status", ["completed", "archived"]))
 
         today_routines = []
         yesterday_routines = []
@@ -1911,7 +1586,7 @@ def get_routines(user_id: str):
 
             # Skipped-Reset: wenn skip von einem früheren Tag ist, zurücksetzen
             if routine.get('status') == 'skipped' and routine.get('last_checked_date') != current_date:
-                supabase.table("todos").update({"status": "open"}).eq("id", routine['id']).execute()
+                await db.execute(db.table("todos").update({"status": "open"}).eq("id", routine['id']))
                 routine['status'] = 'open'
 
             if frequency == 'daily':
@@ -1948,7 +1623,7 @@ def get_routines(user_id: str):
         for routine in today_routines:
             last_checked = routine.get('last_checked_date')
             if last_checked and last_checked < current_date:
-                supabase.table("todos").update({"last_checked_date": current_date}).eq("id", routine['id']).execute()
+                await db.execute(db.table("todos").update({"last_checked_date": current_date}).eq("id", routine['id']))
                 routine['last_checked_date'] = current_date
             all_routines.append(make_routine_response(routine, current_date, 'heute'))
 
@@ -1962,23 +1637,22 @@ def get_routines(user_id: str):
                     missed_dates = routine.get('missed_dates') or []
                     if yesterday_date not in missed_dates:
                         missed_dates.append(yesterday_date)
-                        supabase.table("todos").update({"missed_dates": missed_dates}).eq("id", routine['id']).execute()
+                        await db.execute(db.table("todos").update({"missed_dates": missed_dates}).eq("id", routine['id']))
 
         all_routines.sort(key=lambda x: x['date'], reverse=True)
         return {"routines": all_routines}
 
     except Exception as e:
         print(f"Fehler beim Abrufen der Routinen: {e}")
-        fallback = supabase.table("todos") \
+        fallback = await db.fetch(db.table("todos") \
             .select("id, title, recurrence_weekday, last_checked_date, status, missed_count, missed_dates, recurrence_type") \
             .eq("user_id", user_id) \
             .eq("is_recurring", True) \
-            .not_.in_("status", ["completed", "archived"]) \
-            .execute().data
+            .not_.in_("status", ["completed", "archived"]))
         return {"routines": [make_routine_response(r, current_date, 'heute') for r in fallback]}
         
 @app.post("/routines/update")
-def update_routine_status(update: RoutineUpdate):
+async def update_routine_status(update: RoutineUpdate):
     routine_id = str(update.id)
     user_id = str(update.user_id)
 
@@ -1986,7 +1660,7 @@ def update_routine_status(update: RoutineUpdate):
         current_date = datetime.datetime.now().strftime("%Y-%m-%d")
         yesterday_date = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d")
 
-        routine_data = supabase.table("todos").select("recurrence_weekday, recurrence_type, recurrence_day").eq("id", routine_id).eq("user_id", user_id).execute().data
+        routine_data = await db.fetch(db.table("todos").select("recurrence_weekday, recurrence_type, recurrence_day").eq("id", routine_id).eq("user_id", user_id))
 
         if not routine_data:
             return {"status": "error", "message": "Routine nicht gefunden"}
@@ -2030,7 +1704,7 @@ def update_routine_status(update: RoutineUpdate):
                 elif frequency in days_map:
                     update_data["due_date"] = (datetime.datetime.now() + datetime.timedelta(days=days_map[frequency])).strftime("%Y-%m-%d")
 
-        supabase.table("todos").update(update_data).eq("id", routine_id).eq("user_id", user_id).execute()
+        await db.execute(db.table("todos").update(update_data).eq("id", routine_id).eq("user_id", user_id))
         return {"status": "success"}
 
     except Exception as e:
@@ -2038,29 +1712,29 @@ def update_routine_status(update: RoutineUpdate):
         
 # Ziele abrufen
 @app.get("/goals/{user_id}") # user_id im Pfad hinzufügen
-def get_goals(user_id: str):
+async def get_goals(user_id: str):
     try:
-        goals = supabase.table("goals").select("*").eq("user_id", user_id).execute().data
+        goals = await db.fetch(db.table("goals").select("*").eq("user_id", user_id))
         return {"goals": goals}
     except Exception as e:
         print(f"Fehler beim Abrufen der Ziele: {e}")
         return {"goals": []}
 
 @app.post("/goals/{user_id}")
-def create_goal(goal: Goal, user_id: str):
+async def create_goal(goal: Goal, user_id: str):
     try:
         goal_data = goal.model_dump()
         goal_data["user_id"] = user_id 
-        supabase.table("goals").insert(goal_data).execute()
+        await db.execute(db.table("goals").insert(goal_data))
         return {"status": "success", "message": "Ziel erfolgreich gespeichert."}
     except Exception as e:
         print(f"Fehler beim Speichern des Ziels: {e}")
         return {"status": "error", "message": str(e)}
 
 @app.post("/goals/update/{user_id}")
-def update_goal_status(update: GoalUpdate, user_id: str):
+async def update_goal_status(update: GoalUpdate, user_id: str):
     try:
-        supabase.table("goals").update({"status": update.status}).eq("id", update.id).eq("user_id", user_id).execute()
+        await db.execute(db.table("goals").update({"status": update.status}).eq("id", update.id).eq("user_id", user_id))
         return {"status": "success"}
     except Exception as e:
         print(f"Fehler beim Aktualisieren des Ziels: {e}")
@@ -2068,14 +1742,15 @@ def update_goal_status(update: GoalUpdate, user_id: str):
 
 # Memory-Endpoint
 @app.post("/memory/{user_id}")
-def create_memory(memory_input: MemoryInput, user_id: str):
+async def create_memory(memory_input: MemoryInput, user_id: str):
     try:
-        supabase.table("long_term_memory").insert({
+        result = await db.execute(db.table("long_term_memory").insert({
             "user_id": user_id,
             "thema": memory_input.thema,
             "inhalt": memory_input.inhalt,
             "timestamp": datetime.datetime.utcnow().isoformat()
-        }).execute()
+        }))
+        _indexiere_im_hintergrund(user_id, [gedaechtnis_eintrag(user_id, row) for row in result.data or []])
         return {"status": "success", "message": "Erinnerung erfolgreich gespeichert."}
     except Exception as e:
         print(f"Fehler beim Speichern der Erinnerung: {e}")
@@ -2083,48 +1758,34 @@ def create_memory(memory_input: MemoryInput, user_id: str):
 
 # Profil-Endpoint
 @app.post("/profile/{user_id}")
-def create_profile(profile_data: ProfileData, user_id: str):
+async def create_profile(profile_data: ProfileData, user_id: str):
     try:
-        
+        aenderungen = ProfilAenderungen(user_id)
         for attribute, value in profile_data.model_dump(exclude_unset=True).items():
             if value is None:
                 continue # Überspringe Attribute, die nicht gesetzt sind oder None sind
-
-            # Prüfen, ob das Attribut für diesen Benutzer bereits existiert
-            existing_entry = supabase.table("profile") \
-                .select("id") \
-                .eq("user_id", user_id) \
-                .eq("attribute_name", attribute) \
-                .execute().data
-            
-            if existing_entry:
-                # Aktualisiere den Wert des bestehenden Attributs
-                supabase.table("profile") \
-                    .update({"attribute_value": value}) \
-                    .eq("id", existing_entry[0]["id"]) \
-                    .execute()
-            else:
-                # Füge neues Attribut hinzu
-                supabase.table("profile") \
-                    .insert({"user_id": user_id, "attribute_name": attribute, "attribute_value": value}) \
-                    .execute()
+            aenderungen.setzen(attribute, value)
+        # Ein Upsert für alle Attribute statt SELECT + UPDATE/INSERT pro Attribut
+        gesetzt, _ = await aenderungen.anwenden(db, profil_cache)
+        _indexiere_im_hintergrund(user_id, [profil_eintrag(user_id, name, str(wert)) for name, wert in gesetzt.items()])
         return {"status": "success", "message": "Profil erfolgreich verarbeitet."}
     except Exception as e:
+        profil_cache.verwerfen(user_id)
         print(f"Fehler beim Speichern des Profils: {e}")
         return {"status": "error", "message": str(e)}
 
 @app.get("/todos/{user_id}")
-def get_todos(user_id: str, status: str = None, category: str = None):
+async def get_todos(user_id: str, status: str = None, category: str = None):
     """Alle To-Dos eines Users abrufen mit optionalen Filtern"""
     try:
-        query = supabase.table("todos").select("*").eq("user_id", user_id)
+        query = db.table("todos").select("*").eq("user_id", user_id)
 
         if status:
             query = query.eq("status", status)
         if category:
             query = query.eq("category", category)
 
-        todos = query.order("created_at", desc=True).execute().data
+        todos = await db.fetch(query.order("created_at", desc=True))
 
         grouped_todos = {
             "open": [],
@@ -2169,36 +1830,40 @@ def get_todos(user_id: str, status: str = None, category: str = None):
         return {"todos": {"open": [], "in_progress": [], "completed": [], "overdue": []}, "total": 0}
 
 @app.post("/todos/{user_id}")
-def create_todo(todo_input: TodoInput, user_id: str):
+async def create_todo(todo_input: TodoInput, user_id: str, idempotency_key: Optional[str] = Header(None)):
     """Neues To-Do erstellen"""
     try:
-        todo_data = todo_input.model_dump()
-        todo_data["user_id"] = user_id
-        todo_data["status"] = "open"
-        todo_data["completed"] = False
-        todo_data["created_at"] = datetime.datetime.utcnow().isoformat() + 'Z'
-        
-        # Für wiederkehrende To-Dos: Wenn kein due_date gesetzt, berechne das erste
-        if todo_input.is_recurring and todo_input.recurrence_type and not todo_input.due_date:
-            next_due = calculate_next_due_date(todo_input.recurrence_type, todo_input.recurrence_day)
-            todo_data["due_date"] = next_due
-        
-        result = supabase.table("todos").insert(todo_data).execute()
-        return {"status": "success", "message": "To-Do erfolgreich erstellt", "todo": result.data[0] if result.data else None}
-        
+        return await _idempotent(f"todo:{user_id}", idempotency_key, todo_input.model_dump(), lambda: _erstelle_todo(todo_input, user_id))
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Fehler beim Erstellen des To-Dos: {e}")
         return {"status": "error", "message": str(e)}
 
+async def _erstelle_todo(todo_input: TodoInput, user_id: str):
+    todo_data = todo_input.model_dump()
+    todo_data["user_id"] = user_id
+    todo_data["status"] = "open"
+    todo_data["completed"] = False
+    todo_data["created_at"] = datetime.datetime.utcnow().isoformat() + 'Z'
+
+    # Für wiederkehrende To-Dos: Wenn kein due_date gesetzt, berechne das erste
+    if todo_input.is_recurring and todo_input.recurrence_type and not todo_input.due_date:
+        next_due = calculate_next_due_date(todo_input.recurrence_type, todo_input.recurrence_day)
+        todo_data["due_date"] = next_due
+
+    result = await db.execute(db.table("todos").insert(todo_data))
+    return {"status": "success", "message": "To-Do erfolgreich erstellt", "todo": result.data[0] if result.data else None}
+
 @app.post("/todos/update/{user_id}")
-def update_todo_completion(update: TodoUpdate, user_id: str):
+async def update_todo_completion(update: TodoUpdate, user_id: str):
     """To-Do als erledigt/unerledigt markieren"""
     todo_id = str(update.id)
     user_id = str(update.user_id)
     
     try:
         # Hole To-Do Daten um zu prüfen ob es wiederkehrend ist
-        todo_data = supabase.table("todos").select("*").eq("id", todo_id).eq("user_id", user_id).execute().data
+        todo_data = await db.fetch(db.table("todos").select("*").eq("id", todo_id).eq("user_id", user_id))
         
         if not todo_data:
             return {"status": "error", "message": "To-Do nicht gefunden"}
@@ -2210,10 +1875,10 @@ def update_todo_completion(update: TodoUpdate, user_id: str):
             "status": "completed" if update.completed else "open",
             "completed_at": datetime.datetime.utcnow().isoformat() + 'Z' if update.completed else None
         }
-        supabase.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id).execute()
+        await db.execute(db.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id))
 
         if update.completed and todo.get('is_recurring'):
-            create_recurring_todo_instance(todo, user_id)
+            await create_recurring_todo_instance(todo, user_id)
         
         return {"status": "success"}
         
@@ -2222,7 +1887,7 @@ def update_todo_completion(update: TodoUpdate, user_id: str):
         return {"status": "error", "message": str(e)}
 
 @app.post("/todos/status/{user_id}")
-def update_todo_status(update: TodoStatusUpdate, user_id: str):
+async def update_todo_status(update: TodoStatusUpdate, user_id: str):
     """To-Do Status ändern (open, in_progress, completed, archived)"""
     todo_id = str(update.id)
     
@@ -2236,7 +1901,7 @@ def update_todo_status(update: TodoStatusUpdate, user_id: str):
             update_data["completed"] = False
             update_data["completed_at"] = None
         
-        supabase.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id).execute()
+        await db.execute(db.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id))
         return {"status": "success"}
         
     except Exception as e:
@@ -2244,38 +1909,38 @@ def update_todo_status(update: TodoStatusUpdate, user_id: str):
         return {"status": "error", "message": str(e)}
 
 @app.post("/todos/skip/{user_id}")
-def skip_todo(user_id: str, body: dict):
+async def skip_todo(user_id: str, body: dict):
     try:
         todo_id = str(body["id"])
         if body.get("unskip"):
-            supabase.table("todos").update({"status": "open", "completed": False}).eq("id", todo_id).eq("user_id", user_id).execute()
+            await db.execute(db.table("todos").update({"status": "open", "completed": False}).eq("id", todo_id).eq("user_id", user_id))
         else:
-            supabase.table("todos").update({"status": "skipped", "completed": False}).eq("id", todo_id).eq("user_id", user_id).execute()
+            await db.execute(db.table("todos").update({"status": "skipped", "completed": False}).eq("id", todo_id).eq("user_id", user_id))
         return {"status": "success"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @app.post("/routines/skip")
-def skip_routine(body: dict):
+async def skip_routine(body: dict):
     try:
         current_date = datetime.datetime.now().strftime("%Y-%m-%d")
         if body.get("unskip"):
-            supabase.table("todos").update({"status": "open"}).eq("id", str(body["id"])).eq("user_id", str(body["user_id"])).execute()
+            await db.execute(db.table("todos").update({"status": "open"}).eq("id", str(body["id"])).eq("user_id", str(body["user_id"])))
         else:
-            supabase.table("todos").update({"status": "skipped", "last_checked_date": current_date}).eq("id", str(body["id"])).eq("user_id", str(body["user_id"])).execute()
+            await db.execute(db.table("todos").update({"status": "skipped", "last_checked_date": current_date}).eq("id", str(body["id"])).eq("user_id", str(body["user_id"])))
         return {"status": "success"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 @app.put("/todos/{todo_id}/{user_id}")
-def edit_todo(todo_id: str, user_id: str, todo_edit: TodoEdit):
+async def edit_todo(todo_id: str, user_id: str, todo_edit: TodoEdit):
     """To-Do bearbeiten"""
     try:
         update_data = {k: v for k, v in todo_edit.model_dump(exclude_unset=True).items() if v is not None and k != 'id'}
         
         if update_data:
             update_data["updated_at"] = datetime.datetime.utcnow().isoformat() + 'Z'
-            supabase.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id).execute()
+            await db.execute(db.table("todos").update(update_data).eq("id", todo_id).eq("user_id", user_id))
         
         return {"status": "success", "message": "To-Do erfolgreich aktualisiert"}
         
@@ -2284,10 +1949,10 @@ def edit_todo(todo_id: str, user_id: str, todo_edit: TodoEdit):
         return {"status": "error", "message": str(e)}
 
 @app.delete("/todos/{todo_id}/{user_id}")
-def delete_todo(todo_id: str, user_id: str):
+async def delete_todo(todo_id: str, user_id: str):
     """To-Do löschen"""
     try:
-        supabase.table("todos").delete().eq("id", todo_id).eq("user_id", user_id).execute()
+        await db.execute(db.table("todos").delete().eq("id", todo_id).eq("user_id", user_id))
         return {"status": "success", "message": "To-Do erfolgreich gelöscht"}
         
     except Exception as e:
@@ -2295,10 +1960,10 @@ def delete_todo(todo_id: str, user_id: str):
         return {"status": "error", "message": str(e)}
 
 @app.get("/todos/categories/{user_id}")
-def get_todo_categories(user_id: str):
+async def get_todo_categories(user_id: str):
     """Alle verwendeten Kategorien eines Users abrufen"""
     try:
-        categories = supabase.table("todos").select("category").eq("user_id", user_id).execute().data
+        categories = await db.fetch(db.table("todos").select("category").eq("user_id", user_id))
         unique_categories = list(set([cat['category'] for cat in categories if cat['category']]))
         return {"categories": unique_categories}
         
@@ -2307,10 +1972,10 @@ def get_todo_categories(user_id: str):
         return {"categories": ["allgemein"]}
 
 @app.get("/todos/stats/{user_id}")
-def get_todo_stats(user_id: str):
+async def get_todo_stats(user_id: str):
     """To-Do Statistiken für Dashboard"""
     try:
-        all_todos = supabase.table("todos").select("status, priority, due_date, completed").eq("user_id", user_id).execute().data
+        all_todos = await db.fetch(db.table("todos").select("status, priority, due_date, completed").eq("user_id", user_id))
         
         today = datetime.datetime.now().strftime("%Y-%m-%d")
         
@@ -2333,15 +1998,15 @@ def get_todo_stats(user_id: str):
 # 4. Automatisches Archivieren alter To-Dos:
 
 @app.post("/todos/cleanup/{user_id}")
-def cleanup_completed_todos(user_id: str, days_old: int = 30):
+async def cleanup_completed_todos(user_id: str, days_old: int = 30):
     """Archiviert abgeschlossene To-Dos die älter als X Tage sind"""
     try:
         cutoff_date = (datetime.datetime.utcnow() - datetime.timedelta(days=days_old)).isoformat() + 'Z'
 
         # Markiere alte erledigte To-Dos als archiviert
-        result = supabase.table("todos").update({
+        result = await db.execute(db.table("todos").update({
             "status": "archived"
-        }).eq("user_id", user_id).eq("status", "completed").lt("completed_at", cutoff_date).execute()
+        }).eq("user_id", user_id).eq("status", "completed").lt("completed_at", cutoff_date))
         
         archived_count = len(result.data) if result.data else 0
         return {"status": "success", "archived_count": archived_count, "message": f"{archived_count} To-Dos archiviert"}
@@ -2351,23 +2016,23 @@ def cleanup_completed_todos(user_id: str, days_old: int = 30):
         return {"status": "error", "message": str(e)}
 
 @app.get("/todos/completed/{user_id}")
-def get_completed_todos(user_id: str, limit: int = 20):
+async def get_completed_todos(user_id: str, limit: int = 20):
     """Zeigt die letzten erledigten To-Dos zur Übersicht"""
     try:
-        completed_todos = supabase.table("todos").select("title, completed_at, category, priority").eq("user_id", user_id).eq("status", "completed").order("completed_at", desc=True).limit(limit).execute().data
+        completed_todos = await db.fetch(db.table("todos").select("title, completed_at, category, priority").eq("user_id", user_id).eq("status", "completed").order("completed_at", desc=True).limit(limit))
         return {"completed_todos": completed_todos}
     except Exception as e:
         print(f"Fehler beim Abrufen erledigter To-Dos: {e}")
         return {"completed_todos": []}
 
 @app.delete("/todos/completed/{user_id}")
-def delete_old_completed_todos(user_id: str, days_old: int = 90):
+async def delete_old_completed_todos(user_id: str, days_old: int = 90):
     """Löscht sehr alte erledigte To-Dos permanent (z.B. nach 3 Monaten)"""
     try:
         cutoff_date = (datetime.datetime.now() - datetime.timedelta(days=days_old)).isoformat() + 'Z'
         
         # Lösche nur normale (nicht-wiederkehrende) To-Dos die sehr alt sind
-        result = supabase.table("todos").delete().eq("user_id", user_id).eq("status", "completed").eq("is_recurring", False).lt("completed_at", cutoff_date).execute()
+        result = await db.execute(db.table("todos").delete().eq("user_id", user_id).eq("status", "completed").eq("is_recurring", False).lt("completed_at", cutoff_date))
         
         deleted_count = len(result.data) if result.data else 0
         return {"status": "success", "deleted_count": deleted_count, "message": f"{deleted_count} alte To-Dos permanent gelöscht"}
@@ -2377,7 +2042,7 @@ def delete_old_completed_todos(user_id: str, days_old: int = 90):
         return {"status": "error", "message": str(e)}
 
 @app.delete("/cleanup/conversation/{user_id}")
-def cleanup_conversation_history(user_id: str):
+async def cleanup_conversation_history(user_id: str):
     """Löscht Konversationshistorie die älter als der 1. des aktuellen Monats ist.
     Nur aufrufen nachdem der Monatsbericht generiert wurde."""
     try:
@@ -2386,21 +2051,25 @@ def cleanup_conversation_history(user_id: str):
         )
 
         # Sicherstellen dass ein Monatsbericht für diesen Monat existiert
-        existing_monthly = supabase.table("long_term_memory") \
+        existing_monthly = await db.fetch(db.table("long_term_memory") \
             .select("id") \
             .eq("user_id", user_id) \
             .eq("thema", "Monatsrückblick") \
-            .gte("timestamp", first_of_this_month.isoformat() + 'Z') \
-            .execute().data
+            .gte("timestamp", first_of_this_month.isoformat() + 'Z'))
 
         if not existing_monthly:
             return {"status": "skipped", "message": "Kein Monatsbericht für diesen Monat gefunden — nichts gelöscht."}
 
-        result = supabase.table("conversation_history") \
+        # Quartals- und Jahresberichte lesen nur noch Digests: den Vormonat vor dem Löschen verdichten
+        vormonat = periode_von("monat", first_of_this_month.date() - datetime.timedelta(days=1))
+        await digests.perioden(user_id, "monat", [vormonat])
+        if not await digests.gespeichert(user_id, "monat", [vormonat]):
+            return {"status": "skipped", "message": f"Monats-Digest {vormonat} konnte nicht erstellt werden — nichts gelöscht."}
+
+        result = await db.execute(db.table("conversation_history") \
             .delete() \
             .eq("user_id", user_id) \
-            .lt("timestamp", first_of_this_month.isoformat() + 'Z') \
-            .execute()
+            .lt("timestamp", first_of_this_month.isoformat() + 'Z'))
 
         deleted_count = len(result.data) if result.data else 0
         return {"status": "success", "deleted_count": deleted_count, "message": f"{deleted_count} alte Einträge gelöscht."}
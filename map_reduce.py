@@ -0,0 +1,112 @@
+"""Map-Reduce-Zusammenfassung langer Zeiträume.
+
+Bisher wurde die gesamte Historie eines Zeitraums zu einem String verbunden
+und in einem einzigen Aufruf auf 400 Wörter gekürzt – bei aktiven Nutzern
+sprengt ein Monat das Kontextfenster, und Details gehen verloren. Jetzt:
+
+- zeilen_seitenweise() liest die Zeilen seitenweise (MAP_REDUCE_PAGE_SIZE),
+- abschnitte() schneidet den Strom in Abschnitte von höchstens
+  MAP_REDUCE_CHUNK_TOKENS Tokens,
+- map_reduce() fasst die Abschnitte schon während des Lesens gleichzeitig
+  zusammen (höchstens MAP_REDUCE_CONCURRENCY Aufrufe) und führt die
+  Teilzusammenfassungen danach zusammen – stufenweise, falls sie zusammen
+  nicht in einen Aufruf passen.
+
+Die Laufzeit hängt so von der Anzahl der Stufen ab, nicht von der Länge der
+Historie.
+"""
+import asyncio
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List
+
+from metrics import metrics
+from token_budget import zaehle_tokens
+
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", "3000"))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_REDUCE_PAGE_SIZE = int(os.getenv("MAP_REDUCE_PAGE_SIZE", "200"))
+
+
+async def zeilen_seitenweise(db, query: Callable[[], Any], seitengroesse: int = MAP_REDUCE_PAGE_SIZE) -> AsyncIterator[Dict]:
+    """Liefert die Zeilen einer (sortierten) Query seitenweise über .range(); query() baut die Query jeweils neu."""
+    start = 0
+    while True:
+        rows = await db.fetch(query().range(start, start + seitengroesse - 1))
+        for row in rows:
+            yield row
+        if len(rows) < seitengroesse:
+            return
+        start += seitengroesse
+
+
+async def abschnitte(zeilen: AsyncIterable[Dict], formatieren: Callable[[List[Dict]], str], max_tokens: int = MAP_REDUCE_CHUNK_TOKENS) -> AsyncIterator[str]:
+    """Fasst aufeinanderfolgende Zeilen zu Texten von höchstens max_tokens zusammen (eine zu lange Zeile bleibt allein)."""
+    puffer: List[Dict] = []
+    tokens = 0
+    async for row in zeilen:
+        t = zaehle_tokens(formatieren([row]))
+        if puffer and tokens + t > max_tokens:
+            yield formatieren(puffer)
+            puffer, tokens = [], 0
+        puffer.append(row)
+        tokens += t
+    if puffer:
+        yield formatieren(puffer)
+
+
+def _gruppen(texte: List[str], max_tokens: int) -> List[str]:
+    """Teilzusammenfassungen für die nächste Reduce-Stufe bündeln; mindestens zwei pro Gruppe, damit jede Stufe schrumpft."""
+    gruppen: List[List[str]] = []
+    tokens = 0
+    for text in texte:
+        t = zaehle_tokens(text)
+        if gruppen and (len(gruppen[-1]) < 2 or tokens + t <= max_tokens):
+            gruppen[-1].append(text)
+            tokens += t
+        else:
+            gruppen.append([text])
+            tokens = t
+    return ["\n\n".join(g) for g in gruppen]
+
+
+async def map_reduce(teile: AsyncIterable[str], zusammenfassen: Callable[[str], Awaitable[str]],
+                     zusammenfuehren: Callable[[str], Awaitable[str]], max_tokens: int = MAP_REDUCE_CHUNK_TOKENS,
+                     parallel: int = MAP_REDUCE_CONCURRENCY, direkt_bis_tokens: int = 0) -> str:
+    """Fasst alle Teile zusammen. Ein einzelner Teil bis direkt_bis_tokens wird unverändert zurückgegeben."""
+    semaphore = asyncio.Semaphore(parallel)
+
+    async def begrenzt(fn: Callable[[str], Awaitable[str]], text: str) -> str:
+        async with semaphore:
+            return await fn(text)
+
+    tasks: List[asyncio.Task] = []
+    erster = None
+    try:
+        async for teil in teile:
+            if erster is None and not tasks:
+                # Erst beim zweiten Teil steht fest, dass überhaupt zusammengefasst werden muss
+                erster = teil
+                continue
+            if erster is not None:
+                tasks.append(asyncio.create_task(begrenzt(zusammenfassen, erster)))
+                erster = None
+            tasks.append(asyncio.create_task(begrenzt(zusammenfassen, teil)))
+        if not tasks:
+            if erster is None:
+                return ""
+            if zaehle_tokens(erster) <= direkt_bis_tokens:
+                return erster
+            metrics.incr("map_reduce.chunks")
+            return await zusammenfuehren(erster)
+        metrics.incr("map_reduce.chunks", len(tasks))
+        zusammenfassungen = list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    while True:
+        gruppen = _gruppen(zusammenfassungen, max_tokens)
+        if len(gruppen) == 1:
+            return await zusammenfuehren(gruppen[0])
+        metrics.incr("map_reduce.reduce_levels")
+        zusammenfassungen = list(await asyncio.gather(*[begrenzt(zusammenfuehren, g) for g in gruppen]))
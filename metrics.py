@@ -0,0 +1,33 @@
+"""Einfache In-Process-Metriken (Zähler), abrufbar über GET /metrics.
+
+Die Zähler leben im Prozess und werden beim Neustart zurückgesetzt; sie
+dienen dazu, Optimierungen (Fast-Path, Caches, Spekulation) im Betrieb
+zu bewerten.
+"""
+import threading
+from typing import Dict, Optional
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def get(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def rate(self, numerator: str, *denominator: str) -> Optional[float]:
+        """Anteil numerator / Summe(denominator), None solange es keine Daten gibt."""
+        total = sum(self.get(n) for n in denominator)
+        return round(self.get(numerator) / total, 4) if total else None
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+
+metrics = Metrics()
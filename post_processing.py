@@ -0,0 +1,68 @@
+"""Hintergrund-Nacharbeiten für Chat-Turns.
+
+Profil-Extraktion und Commitment-Erkennung laufen erst, nachdem die Antwort an
+den Nutzer gegangen ist. Die Anzahl gleichzeitiger Nacharbeiten ist begrenzt,
+Fehler einer Aufgabe werden protokolliert und beeinflussen weder andere
+Aufgaben noch den Request. Ergebnisse für den Client (der To-Do-Vorschlag)
+werden pro Nutzer zwischengespeichert und per Poll-Endpunkt abgeholt.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional, Set, Tuple
+
+POSTPROCESS_MAX_CONCURRENCY = int(os.getenv("POSTPROCESS_MAX_CONCURRENCY", "4"))
+SUGGESTION_TTL_SECONDS = int(os.getenv("SUGGESTION_TTL_SECONDS", "600"))
+
+
+class PostProcessor:
+    def __init__(self, max_concurrency: int = POSTPROCESS_MAX_CONCURRENCY, suggestion_ttl: int = SUGGESTION_TTL_SECONDS):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        # Laufende Nacharbeiten pro (Nutzer, Aufgabe), damit ein Poll nur auf die eigene Aufgabe wartet
+        self._pending: Dict[Tuple[str, str], int] = {}
+        self._suggestions: Dict[str, Dict[str, Any]] = {}
+        self.suggestion_ttl = suggestion_ttl
+
+    def submit(self, user_id: str, name: str, coro: Awaitable[Any]) -> asyncio.Task:
+        """Plant eine Nacharbeit ein, ohne auf sie zu warten."""
+        key = (user_id, name)
+        self._pending[key] = self._pending.get(key, 0) + 1
+        task = asyncio.create_task(self._run(user_id, name, coro))
+        # Referenz halten, sonst kann der Task vorzeitig eingesammelt werden
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, user_id: str, name: str, coro: Awaitable[Any]):
+        try:
+            async with self._semaphore:
+                await coro
+        except Exception as e:
+            print(f"Fehler in der Nacharbeit '{name}' für User {user_id}: {e}")
+        finally:
+            key = (user_id, name)
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+
+    def is_pending(self, user_id: str, name: Optional[str] = None) -> bool:
+        """Läuft für den Nutzer noch eine Nacharbeit (nur die Aufgabe `name`, falls angegeben)?"""
+        if name is not None:
+            return self._pending.get((user_id, name), 0) > 0
+        return any(uid == user_id for uid, _ in self._pending)
+
+    def set_suggestion(self, user_id: str, suggestion: Dict[str, Any]):
+        self._suggestions[user_id] = {"suggestion": suggestion, "created": time.monotonic()}
+
+    def pop_suggestion(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Gibt den letzten To-Do-Vorschlag einmalig zurück (None wenn keiner oder abgelaufen)."""
+        entry = self._suggestions.pop(user_id, None)
+        if entry is None or time.monotonic() - entry["created"] > self.suggestion_ttl:
+            return None
+        return entry["suggestion"]
+
+    async def drain(self, timeout: float = 10.0):
+        """Wartet beim Herunterfahren kurz auf laufende Nacharbeiten."""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
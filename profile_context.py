@@ -0,0 +1,122 @@
+"""Profil-Kontext für die Profil-Extraktion.
+
+Bisher las jeder Chat-Turn das komplette, nicht archivierte Profil und gab es
+als JSON an gpt-4o-mini – die Kosten wuchsen mit jedem neuen Eintrag. Jetzt:
+
+- ProfilCache hält das Profil pro Nutzer im Prozess, zusammen mit einer
+  Version (Hash über alle Einträge). Schreibt die App selbst ins Profil
+  (Extraktion, Archivierung, POST /profile), wird der Cache direkt
+  nachgeführt und die Version neu berechnet; der nächste Aufruf braucht dann
+  keine Abfrage. Nach PROFILE_CACHE_TTL_SECONDS wird trotzdem neu gelesen,
+  falls ein anderer Prozess geschrieben hat.
+- relevante_attribute() wählt per Schlüssel-/Wert-Abgleich mit dem aktuellen
+  Austausch die passenden Einträge aus (höchstens
+  PROFILE_EXTRACTION_MAX_RELEVANT). Dazu kommt im Prompt nur noch die
+  Liste aller Schlüsselnamen, damit bestehende Einträge weiter aktualisiert
+  statt dupliziert werden.
+- index() liefert zum Profil einen TrigrammIndex über Schlüssel und Werte.
+  Er wird pro Profilversion einmal gebaut; jede Änderung erzeugt eine neue
+  Version und damit beim nächsten Zugriff einen neuen Index.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from metrics import metrics
+from trigram_index import TrigrammIndex
+
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_EXTRACTION_MAX_RELEVANT = int(os.getenv("PROFILE_EXTRACTION_MAX_RELEVANT", "12"))
+
+# Häufige Wörter, die sonst fast jeden Eintrag "treffen" würden
+STOPPWOERTER = {
+    "aber", "alle", "also", "auch", "dann", "dass", "deine", "dein", "dich", "dies", "diese", "dieser",
+    "doch", "eine", "einem", "einen", "einer", "etwas", "gerade", "habe", "haben", "hast", "heute",
+    "immer", "jetzt", "kann", "keine", "mache", "machen", "mehr", "mein", "meine", "mich", "noch",
+    "nicht", "oder", "schon", "sehr", "sein", "sich", "sind", "über", "viel", "wann", "warum", "weil",
+    "wenn", "werde", "wieder", "wird", "wirklich", "wollte", "wurde",
+    "abgeschlossen", "geplant",
+}
+
+
+def _staemme(text: str) -> Set[str]:
+    """Grobe Wortstämme (die ersten fünf Buchstaben), damit "Laufen"/"Lauftraining" zusammenpassen."""
+    woerter = re.findall(r"[^\W\d_]+", text.casefold())
+    return {w[:5] for w in woerter if len(w) >= 4 and w not in STOPPWOERTER}
+
+
+def profil_version(profil: Dict[str, str]) -> str:
+    roh = json.dumps(profil, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(roh.encode("utf-8")).hexdigest()[:16]
+
+
+def relevante_attribute(profil: Dict[str, str], texte: Iterable[str], max_anzahl: int = PROFILE_EXTRACTION_MAX_RELEVANT) -> Dict[str, str]:
+    """Die Einträge, deren Schlüssel oder Wert Wortstämme mit den Texten teilen (Schlüssel zählen doppelt)."""
+    gesucht = set()
+    for text in texte:
+        gesucht |= _staemme(text or "")
+    if not gesucht:
+        return {}
+    bewertet = []
+    for name, wert in profil.items():
+        punkte = 2 * len(_staemme(name.replace("_", " ")) & gesucht) + len(_staemme(str(wert)) & gesucht)
+        if punkte:
+            bewertet.append((punkte, name))
+    bewertet.sort(key=lambda p: (-p[0], p[1]))
+    return {name: profil[name] for _, name in bewertet[:max_anzahl]}
+
+
+class ProfilCache:
+    def __init__(self, db, ttl: int = PROFILE_CACHE_TTL_SECONDS):
+        self.db = db
+        self.ttl = ttl
+        self._profile: Dict[str, Tuple[Dict[str, str], str, float]] = {}
+        self._indizes: Dict[str, Tuple[str, TrigrammIndex]] = {}
+
+    async def laden(self, user_id: str) -> Dict[str, str]:
+        """Das nicht archivierte Profil als {attribute_name: attribute_value}; liest nur, wenn nötig."""
+        eintrag = self._profile.get(user_id)
+        if eintrag and time.monotonic() - eintrag[2] <= self.ttl:
+            metrics.incr("profile_cache.hit")
+            return dict(eintrag[0])
+        metrics.incr("profile_cache.miss")
+        rows = await self.db.fetch(self.db.table("profile")
+            .select("attribute_name, attribute_value")
+            .eq("user_id", user_id)
+            .eq("archived", False))
+        profil = {r["attribute_name"]: r["attribute_value"] for r in rows}
+        self._profile[user_id] = (profil, profil_version(profil), time.monotonic())
+        return dict(profil)
+
+    async def index(self, user_id: str) -> Tuple[Dict[str, str], TrigrammIndex]:
+        """Profil plus Trigramm-Index über die Felder "name" und "wert"."""
+        profil = await self.laden(user_id)
+        version = self.version(user_id)
+        vorhanden = self._indizes.get(user_id)
+        if vorhanden and vorhanden[0] == version:
+            return profil, vorhanden[1]
+        index = TrigrammIndex({name: {"name": name.replace("_", " "), "wert": str(wert)} for name, wert in profil.items()})
+        self._indizes[user_id] = (version, index)
+        return profil, index
+
+    def version(self, user_id: str) -> Optional[str]:
+        eintrag = self._profile.get(user_id)
+        return eintrag[1] if eintrag else None
+
+    def aktualisieren(self, user_id: str, geaendert: Optional[Dict[str, str]] = None, archiviert: Iterable[str] = ()):
+        """Führt eigene Schreibzugriffe nach; ohne geladenes Profil gibt es nichts zu tun."""
+        eintrag = self._profile.get(user_id)
+        if eintrag is None:
+            return
+        profil = dict(eintrag[0])
+        profil.update(geaendert or {})
+        for name in archiviert:
+            profil.pop(name, None)
+        self._profile[user_id] = (profil, profil_version(profil), eintrag[2])
+
+    def verwerfen(self, user_id: str):
+        self._profile.pop(user_id, None)
+        self._indizes.pop(user_id, None)
@@ -0,0 +1,117 @@
+"""Gesammelte Profil-Extraktion statt eines LLM-Aufrufs pro Nachricht.
+
+Bisher lief nach jeder Nachricht ab fünf Wörtern eine eigene Extraktion mit
+gpt-4o-mini, auch für "ja, klingt gut, mache ich". Jetzt werden die Turns
+pro Nutzer gesammelt und gemeinsam extrahiert:
+
+- sobald PROFILE_BATCH_TURNS Turns beisammen sind,
+- oder wenn PROFILE_BATCH_IDLE_SECONDS lang kein Turn mehr kam,
+- und beim Herunterfahren (beenden()), damit nichts verloren geht.
+
+Vorher sortiert ein lokaler Filter (hat_profil_fakten) nur eindeutige
+Füllnachrichten aus ("ja, klingt gut, mache ich", "okay danke"): Turns mit
+weniger als PROFILE_FILTER_MIN_WORDS inhaltlichen Wörtern und ohne Datum,
+Zahl, Aussage über das eigene Leben oder Namen. Im Zweifel bleibt der Turn
+drin – Fakten stecken oft in Sätzen ohne festes Muster ("Hab heute
+gekündigt"). Bleibt keiner übrig, entfällt der LLM-Aufruf.
+Der Puffer ist prozesslokal.
+"""
+import asyncio
+import os
+import re
+from typing import Awaitable, Callable, Dict, List
+
+from metrics import metrics
+
+PROFILE_BATCH_TURNS = int(os.getenv("PROFILE_BATCH_TURNS", "5"))
+PROFILE_BATCH_IDLE_SECONDS = float(os.getenv("PROFILE_BATCH_IDLE_SECONDS", "300"))
+PROFILE_FILTER_MIN_WORDS = int(os.getenv("PROFILE_FILTER_MIN_WORDS", "3"))
+
+# Ein Austausch: {"ai_prompt": ..., "user_input": ..., "ai_response": ...}
+Austausch = Dict[str, str]
+
+_DATUM = re.compile(
+    r"\d|\b(januar|februar|märz|april|mai|juni|juli|august|september|oktober|november|dezember"
+    r"|montag|dienstag|mittwoch|donnerstag|freitag|samstag|sonntag|morgen|gestern|übermorgen"
+    r"|wochenende|letzte[nms]?|nächste[nms]?|vorige[nms]?|jahr|monat|woche)\b", re.IGNORECASE)
+_LEBEN = re.compile(
+    r"\b(ich (bin|war|habe|hatte|arbeite|wohne|lebe|studiere|trainiere|plane|werde|ziehe|heirate|fange|höre|spiele)"
+    r"|mein(e|en|em|er)?|wir|unser(e|en|em|er)?|seit|vorbei|abgeschlossen|zurück|angefangen|aufgehört)\b", re.IGNORECASE)
+# Namen: Großgeschriebenes nach Präposition ("in Köln", "bei Siemens", "mit Anna") oder Abkürzungen/Binnenmajuskeln
+_NAME = re.compile(r"\b(in|nach|bei|mit|für|von|aus) [A-ZÄÖÜ][\wäöüß]+|\b[A-ZÄÖÜ]{2,}\b|\b[a-zäöü]+[A-ZÄÖÜ]\w*")
+# Zustimmung, Dank, Floskeln und Funktionswörter – zählen nicht als Inhalt
+_FUELLWOERTER = set("""
+ja jap jo nein nee ok okay oki alles klar gut super prima toll cool top perfekt genau stimmt passt gerne gern
+danke dank vielen lieben dir dich euch mache machen mach ich du es das der die den dem des ein eine einen einem
+einer und oder aber so auch noch schon mal nur sehr ganz echt wirklich klingt hört sich an ist sind war gute
+idee tipp tipps mehr nicht mit für zu am im an auf in von hm hmm ah ach oh aha haha lol bis dann später tschüss
+""".split())
+
+
+def hat_profil_fakten(text: str) -> bool:
+    """Lokaler Filter: False nur für eindeutige Füllnachrichten (Zustimmung, Dank, Floskeln)."""
+    if _DATUM.search(text) or _LEBEN.search(text) or _NAME.search(text):
+        return True
+    inhalt = [w for w in re.findall(r"[^\W\d_]+", text.casefold()) if w not in _FUELLWOERTER]
+    return len(inhalt) >= PROFILE_FILTER_MIN_WORDS
+
+
+class ProfilExtraktion:
+    def __init__(self, extrahieren: Callable[[str, List[Austausch]], Awaitable[None]],
+                 alle_n: int = PROFILE_BATCH_TURNS, idle_sekunden: float = PROFILE_BATCH_IDLE_SECONDS):
+        self.extrahieren = extrahieren
+        self.alle_n = alle_n
+        self.idle_sekunden = idle_sekunden
+        self._puffer: Dict[str, List[Austausch]] = {}
+        self._timer: Dict[str, asyncio.TimerHandle] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks = set()
+
+    def nach_turn(self, user_id: str, user_input: str, ai_response: str, ai_prompt: str = ""):
+        """Merkt sich den Turn; extrahiert nach alle_n Turns oder wenn die Sitzung idle_sekunden ruht."""
+        metrics.incr("profile_extraction.turns")
+        puffer = self._puffer.setdefault(user_id, [])
+        puffer.append({"ai_prompt": ai_prompt, "user_input": user_input, "ai_response": ai_response})
+        if user_id in self._timer:
+            self._timer.pop(user_id).cancel()
+        if len(puffer) >= self.alle_n:
+            self._starten(user_id)
+        else:
+            self._timer[user_id] = asyncio.get_running_loop().call_later(self.idle_sekunden, self._idle, user_id)
+
+    def _idle(self, user_id: str):
+        self._timer.pop(user_id, None)
+        self._starten(user_id)
+
+    def _starten(self, user_id: str):
+        task = asyncio.create_task(self.leeren(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def leeren(self, user_id: str):
+        """Extrahiert alle gesammelten Turns des Nutzers (ohne Turns, die der lokale Filter aussortiert)."""
+        austausche = self._puffer.pop(user_id, [])
+        if not austausche:
+            return
+        relevant = [a for a in austausche if hat_profil_fakten(a["user_input"])]
+        metrics.incr("profile_extraction.turns_filtered", len(austausche) - len(relevant))
+        if not relevant:
+            metrics.incr("profile_extraction.skipped")
+            return
+        metrics.incr("profile_extraction.batches")
+        # Ein Nutzer zur Zeit, damit sich zwei Batches nicht gegenseitig überschreiben
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            try:
+                await self.extrahieren(user_id, relevant)
+            except Exception as e:
+                print(f"Fehler bei der Profil-Extraktion für User {user_id}: {e}")
+
+    async def beenden(self, timeout: float = 10.0):
+        """Beim Herunterfahren: Timer stoppen und alle Puffer noch extrahieren."""
+        for handle in self._timer.values():
+            handle.cancel()
+        self._timer.clear()
+        for user_id in list(self._puffer):
+            self._starten(user_id)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
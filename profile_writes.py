@@ -0,0 +1,79 @@
+"""Gesammelte Schreibzugriffe auf das Profil (EAV-Tabelle profile).
+
+Bisher kostete jede Profiländerung eigene Roundtrips: ein UPDATE pro
+archiviertem Schlüssel, dazu eine ilike-Suche und ein UPDATE pro verwandtem
+Eintrag, bei POST /profile ein SELECT plus UPDATE/INSERT pro Attribut.
+ProfilAenderungen sammelt alle Änderungen eines Vorgangs und schreibt sie
+gebündelt:
+
+- ein UPSERT für alle gesetzten Werte (on_conflict user_id,attribute_name;
+  ein gesetzter Wert ist danach immer aktiv),
+- ein UPDATE ... IN (...) für alle zu archivierenden Einträge.
+
+Welche Einträge archiviert werden, wird lokal über den Trigramm-Index des
+ProfilCache bestimmt (exakter Schlüssel bzw. Stichwort als Teilstring wie
+bisher mit ilike); die Datenbank sieht nur noch die beiden Schreibzugriffe,
+die gleichzeitig laufen.
+
+Voraussetzung ist ein eindeutiger Index:
+    create unique index if not exists profile_user_attribute on profile (user_id, attribute_name);
+"""
+import asyncio
+import datetime
+from typing import Dict, List, Optional, Tuple
+
+from profile_context import ProfilCache
+from trigram_index import TrigrammIndex
+
+TABELLE = "profile"
+
+
+class ProfilAenderungen:
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.gesetzt: Dict[str, str] = {}
+        self._schluessel: Dict[str, Optional[str]] = {}
+        self._stichwoerter: List[str] = []
+
+    def setzen(self, name: str, wert: str):
+        self.gesetzt[name] = wert
+
+    def archivieren(self, name: str, ersatz_stichwort: Optional[str] = None):
+        """Archiviert den Schlüssel; gibt es ihn nicht, alle Einträge, deren Wert zu ersatz_stichwort passt."""
+        self._schluessel[name] = ersatz_stichwort
+
+    def archivieren_passend(self, stichwort: str):
+        """Archiviert alle Einträge, deren Schlüssel oder Wert zum Stichwort passt."""
+        self._stichwoerter.append(stichwort)
+
+    def _zu_archivieren(self, profil: Dict[str, str], index: TrigrammIndex) -> List[str]:
+        namen = [n for n in self._schluessel if n in profil]
+        ersatz = [s for n, s in self._schluessel.items() if n not in profil and s]
+        # Archivieren ist destruktiv: nur echte Teilstring-Treffer wie früher mit ilike,
+        # ähnliche Wörter ("Freundin" – "Freunde") bleiben unberührt
+        treffer = index.teilstring(ersatz, felder=["wert"])
+        treffer.update(index.teilstring(self._stichwoerter, felder=["name", "wert"]))
+        for stichwort in ersatz + self._stichwoerter:
+            namen += treffer[stichwort]
+        # Was im selben Vorgang gesetzt wird, ist neu und bleibt aktiv
+        return [n for n in dict.fromkeys(namen) if n not in self.gesetzt]
+
+    async def anwenden(self, db, cache: ProfilCache) -> Tuple[Dict[str, str], List[str]]:
+        """Schreibt alles in einem (parallelen) Roundtrip. Gibt (gesetzt, archiviert) zurück."""
+        archiviert = []
+        if self._schluessel or self._stichwoerter:
+            archiviert = self._zu_archivieren(*await cache.index(self.user_id))
+        schreiben = []
+        if self.gesetzt:
+            now = datetime.datetime.utcnow().isoformat() + 'Z'
+            zeilen = [{"user_id": self.user_id, "attribute_name": n, "attribute_value": w, "archived": False, "last_updated": now}
+                      for n, w in self.gesetzt.items()]
+            schreiben.append(db.execute(db.table(TABELLE).upsert(zeilen, on_conflict="user_id,attribute_name")))
+        if archiviert:
+            schreiben.append(db.execute(db.table(TABELLE)
+                .update({"archived": True})
+                .eq("user_id", self.user_id)
+                .in_("attribute_name", archiviert)))
+        await asyncio.gather(*schreiben)
+        cache.aktualisieren(self.user_id, self.gesetzt, archiviert=archiviert)
+        return dict(self.gesetzt), archiviert
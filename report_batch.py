@@ -0,0 +1,205 @@
+"""Berichte für alle Nutzer in einem Lauf erzeugen (Batch-Modus).
+
+Jeden Montag und jeden Monatsersten ist für alle Nutzer gleichzeitig ein
+Bericht fällig. Statt sie einzeln über den Tag verteilt anzustoßen, arbeitet
+ein Batch-Lauf alle fälligen Nutzer ab:
+
+    python report_batch.py [--worker 8] [--ohne-planen]
+
+- Nutzer mit fälligem Bericht kommen aus der Job-Tabelle des Schedulers
+  (report_jobs, siehe report_scheduler); vorher werden die fälligen Berichte
+  aller aktiven Nutzer dort angelegt.
+- REPORT_BATCH_WORKERS Worker nehmen sich je einen Nutzer und erzeugen
+  seine Berichte nacheinander. Berichte warten fast nur auf OpenAI und
+  Supabase, deshalb Tasks im Event-Loop statt eigener Prozesse.
+- Rate-Limits (HTTP 429): Drossel halbiert die Zahl gleichzeitiger Berichte
+  und pausiert alle Worker (Retry-After oder REPORT_BATCH_RATE_LIMIT_PAUSE);
+  nach erfolgreichen Berichten steigt sie wieder bis zum Maximum. Der
+  betroffene Job wird nach REPORT_BATCH_RETRY_SECONDS im selben Lauf erneut
+  versucht.
+- Checkpoint ist die Job-Tabelle selbst: fertige Jobs bleiben fertig, ein
+  unterbrochener Lauf (Strg+C) gibt laufende Jobs sofort wieder frei und
+  setzt beim nächsten Start dort fort.
+- Fortschritt und Durchsatz (Nutzer/Minute) werden laufend ausgegeben.
+
+Der Lauf braucht nur db, erzeugen() und nutzer() und lässt sich so auch
+gegen ein lokales Fake-LLM und eine Fake-DB ausführen.
+
+Die Berichte erzeugt reports.Berichte ohne main.py: main.py legt beim Import
+den lokalen Vektor-Index an, der genau einem Server-Prozess gehört. Die neuen
+Berichte in long_term_memory indexiert der laufende Server selbst nach
+(REPORT_INDEX_INTERVAL_SECONDS).
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import metrics
+from report_scheduler import BerichtScheduler
+
+REPORT_BATCH_WORKERS = int(os.getenv("REPORT_BATCH_WORKERS", "8"))
+REPORT_BATCH_RATE_LIMIT_PAUSE = float(os.getenv("REPORT_BATCH_RATE_LIMIT_PAUSE", "20"))
+REPORT_BATCH_RETRY_SECONDS = float(os.getenv("REPORT_BATCH_RETRY_SECONDS", "30"))
+# Länger wird am Ende nicht auf Wiederholungen gewartet; der Rest bleibt dem Scheduler
+REPORT_BATCH_MAX_WAIT_SECONDS = float(os.getenv("REPORT_BATCH_MAX_WAIT_SECONDS", "300"))
+REPORT_BATCH_PROGRESS_EVERY = int(os.getenv("REPORT_BATCH_PROGRESS_EVERY", "25"))
+
+
+def retry_after(fehler: Exception) -> Optional[float]:
+    """Wartezeit in Sekunden, wenn der Fehler ein Rate-Limit ist (0.0 ohne Retry-After), sonst None."""
+    if getattr(fehler, "status_code", None) != 429:
+        return None
+    headers = getattr(getattr(fehler, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Drossel:
+    """Gemeinsame Bremse aller Worker: begrenzt gleichzeitige Berichte und pausiert nach Rate-Limits."""
+
+    def __init__(self, maximum: int, pause_sekunden: float = REPORT_BATCH_RATE_LIMIT_PAUSE):
+        self.maximum = maximum
+        self.grenze = maximum
+        self.pause_sekunden = pause_sekunden
+        self._laufend = 0
+        self._erfolge = 0
+        self._pause_bis = 0.0
+        self._frei = asyncio.Event()
+
+    async def eintreten(self):
+        while True:
+            rest = self._pause_bis - time.monotonic()
+            if rest > 0:
+                await asyncio.sleep(rest)
+            elif self._laufend < self.grenze:
+                self._laufend += 1
+                return
+            else:
+                self._frei.clear()
+                await self._frei.wait()
+
+    def austreten(self, erfolg: bool):
+        self._laufend -= 1
+        if erfolg:
+            # Nach `grenze` Erfolgen in Folge wieder einen Bericht mehr gleichzeitig
+            self._erfolge += 1
+            if self._erfolge >= self.grenze and self.grenze < self.maximum:
+                self.grenze += 1
+                self._erfolge = 0
+        self._frei.set()
+
+    def rate_limit(self, warten: float):
+        metrics.incr("report_batch.rate_limited")
+        self.grenze = max(1, self.grenze // 2)
+        self._erfolge = 0
+        self._pause_bis = max(self._pause_bis, time.monotonic() + (warten or self.pause_sekunden))
+
+
+class BerichtBatch:
+    def __init__(self, db, erzeugen: Callable[[str, str, datetime.datetime], Awaitable[Optional[str]]],
+                 nutzer: Callable[[], Awaitable[List[str]]], worker: int = REPORT_BATCH_WORKERS,
+                 pause_sekunden: float = REPORT_BATCH_RATE_LIMIT_PAUSE, retry_sekunden: float = REPORT_BATCH_RETRY_SECONDS,
+                 max_warten: float = REPORT_BATCH_MAX_WAIT_SECONDS):
+        self.erzeugen = erzeugen
+        self.worker = worker
+        self.max_warten = max_warten
+        self.drossel = Drossel(worker, pause_sekunden)
+        self.scheduler = BerichtScheduler(db, self._erzeugen, nutzer, parallel=worker, retry_sekunden=retry_sekunden)
+        self._start = 0.0
+        self._nutzer: Dict[str, None] = {}
+        self.berichte = 0
+        self.fehler = 0
+
+    async def _erzeugen(self, user_id: str, typ: str, beginn: datetime.datetime) -> Optional[str]:
+        await self.drossel.eintreten()
+        erfolg = False
+        try:
+            bericht = await self.erzeugen(user_id, typ, beginn)
+            erfolg = True
+            self.berichte += bericht is not None
+            return bericht
+        except Exception as e:
+            self.fehler += 1
+            warten = retry_after(e)
+            if warten is not None:
+                self.drossel.rate_limit(warten)
+            raise
+        finally:
+            self.drossel.austreten(erfolg)
+
+    def stand(self) -> Dict[str, float]:
+        minuten = max(time.monotonic() - self._start, 1e-9) / 60
+        return {
+            "nutzer": len(self._nutzer),
+            "berichte": self.berichte,
+            "fehler": self.fehler,
+            "dauer_sekunden": round(minuten * 60, 1),
+            "nutzer_pro_minute": round(len(self._nutzer) / minuten, 1),
+        }
+
+    async def _worker(self, warteschlange: asyncio.Queue):
+        while not warteschlange.empty():
+            user_id = warteschlange.get_nowait()
+            await self.scheduler.abarbeiten(user_id=user_id)
+            if user_id not in self._nutzer:
+                self._nutzer[user_id] = None
+                metrics.incr("report_batch.users")
+                if len(self._nutzer) % REPORT_BATCH_PROGRESS_EVERY == 0:
+                    s = self.stand()
+                    print(f"Bericht-Batch: {s['nutzer']} Nutzer, {s['berichte']} Berichte, {s['fehler']} Fehler, {s['nutzer_pro_minute']} Nutzer/min")
+
+    async def lauf(self, planen: bool = True) -> Dict[str, float]:
+        """Erzeugt alle fälligen Berichte; Wiederholungen innerhalb von max_warten werden abgewartet."""
+        self._start = time.monotonic()
+        if planen:
+            await self.scheduler.planen()
+        while True:
+            nutzer = await self.scheduler.faellige_nutzer()
+            if not nutzer:
+                warten = await self.scheduler.naechster_versuch()
+                if warten is None or warten > self.max_warten:
+                    break
+                await asyncio.sleep(warten)
+                continue
+            warteschlange: asyncio.Queue = asyncio.Queue()
+            for user_id in nutzer:
+                warteschlange.put_nowait(user_id)
+            await asyncio.gather(*[self._worker(warteschlange) for _ in range(min(self.worker, len(nutzer)))])
+        s = self.stand()
+        print(f"Bericht-Batch fertig: {s['nutzer']} Nutzer, {s['berichte']} Berichte, {s['fehler']} Fehler "
+              f"in {s['dauer_sekunden']}s ({s['nutzer_pro_minute']} Nutzer/min)")
+        return s
+
+
+async def _cli(args: argparse.Namespace):
+    from dotenv import load_dotenv
+    from supabase import create_client
+    from data_access import Database
+    from digests import Digests
+    from llm_gateway import LLMGateway
+    from report_scheduler import aktive_nutzer
+    from reports import Berichte
+
+    load_dotenv()
+    db = Database(create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY")))
+    llm = LLMGateway(api_key=os.getenv("OPENAI_API_KEY"))
+    # Ohne Vektor-Index (gehört dem Server-Prozess): die neuen Berichte indexiert der Server nach
+    berichte = Berichte(db, llm, Digests(db, llm))
+    batch = BerichtBatch(db, berichte.erzeugen, lambda: aktive_nutzer(db), worker=args.worker)
+    try:
+        await batch.lauf(planen=not args.ohne_planen)
+    finally:
+        await llm.aclose()
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fällige Berichte für alle aktiven Nutzer erzeugen.")
+    parser.add_argument("--worker", type=int, default=REPORT_BATCH_WORKERS, help="gleichzeitig bearbeitete Nutzer")
+    parser.add_argument("--ohne-planen", action="store_true", help="nur bereits angelegte Jobs abarbeiten")
+    asyncio.run(_cli(parser.parse_args()))
@@ -0,0 +1,247 @@
+"""Berichte im Hintergrund erzeugen statt beim Seitenaufruf.
+
+Bisher prüfte GET /bericht/automatisch bei jedem Laden der Seite bis zu vier
+Mal, ob ein Bericht fällig ist, und erzeugte ihn dann synchron mit gpt-4o –
+der Nutzer wartete vor einem Spinner. Jetzt:
+
+- planen() legt einmal pro Tag im Nebenzeitfenster (REPORT_OFFPEAK_HOURS,
+  UTC) für alle aktiven Nutzer die fälligen Berichte als Jobs an – nach
+  denselben Regeln wie bisher (faellige_berichte),
+- abarbeiten() erzeugt fällige Jobs mit höchstens REPORT_SCHEDULER_CONCURRENCY
+  gleichzeitig; Fehler werden mit wachsendem Abstand erneut versucht, nach
+  REPORT_MAX_ATTEMPTS Versuchen gilt der Job als fehlgeschlagen,
+- abholen() liefert dem Endpunkt den fertigen, noch nicht gezeigten Bericht
+  (höchste Ebene zuerst) – ohne zu generieren.
+
+Tabelle report_jobs (id, user_id, typ, periode, beginn, status, versuche,
+naechster_versuch, fehler, bericht, fertig_am, angezeigt_am), eindeutig über
+(user_id, typ, periode). status ist "offen", "fertig" oder "fehlgeschlagen".
+Ein Worker reserviert einen Job, indem er versuche hochzählt (nur wenn der
+Wert noch stimmt) und naechster_versuch um REPORT_JOB_LEASE_SECONDS
+verschiebt; stürzt der Prozess ab, wird der Job danach erneut versucht.
+Mehrere Instanzen können so dieselbe Tabelle abarbeiten.
+"""
+import asyncio
+import datetime
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from map_reduce import zeilen_seitenweise
+from metrics import metrics
+
+REPORT_OFFPEAK_HOURS = os.getenv("REPORT_OFFPEAK_HOURS", "0-5")
+REPORT_SCHEDULER_INTERVAL_SECONDS = float(os.getenv("REPORT_SCHEDULER_INTERVAL_SECONDS", "600"))
+REPORT_SCHEDULER_CONCURRENCY = int(os.getenv("REPORT_SCHEDULER_CONCURRENCY", "2"))
+REPORT_MAX_ATTEMPTS = int(os.getenv("REPORT_MAX_ATTEMPTS", "5"))
+REPORT_RETRY_SECONDS = float(os.getenv("REPORT_RETRY_SECONDS", "600"))
+REPORT_JOB_LEASE_SECONDS = float(os.getenv("REPORT_JOB_LEASE_SECONDS", "900"))
+# Als aktiv gilt, wer in diesem Zeitraum geschrieben hat
+REPORT_ACTIVE_DAYS = int(os.getenv("REPORT_ACTIVE_DAYS", "35"))
+
+TABELLE = "report_jobs"
+# Reihenfolge = Vorrang beim Anzeigen
+BERICHTE = ("Jahresrückblick", "Quartalsbericht", "Monatsrückblick", "Wochenrückblick")
+
+
+def _jetzt() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _iso(zeitpunkt: datetime.datetime) -> str:
+    return zeitpunkt.isoformat() + 'Z'
+
+
+def faellige_berichte(jetzt: datetime.datetime) -> List[Tuple[str, str, datetime.datetime]]:
+    """(typ, periode, beginn) aller zum Zeitpunkt fälligen Berichte; beginn ist der Start der Berichtsperiode."""
+    mitternacht = jetzt.replace(hour=0, minute=0, second=0, microsecond=0)
+    faellig = []
+    # Jahresbericht ab Februar, Quartalsbericht im ersten Monat des Quartals, Monatsbericht ab dem 2.
+    if jetzt.month > 1:
+        faellig.append(("Jahresrückblick", str(jetzt.year), mitternacht.replace(month=1, day=1)))
+    if jetzt.month in (1, 4, 7, 10) and jetzt.day > 1:
+        faellig.append(("Quartalsbericht", f"{jetzt.year}-Q{(jetzt.month - 1) // 3 + 1}", mitternacht.replace(day=1)))
+    if jetzt.day > 1:
+        faellig.append(("Monatsrückblick", f"{jetzt.year}-{jetzt.month:02d}", mitternacht.replace(day=1)))
+    # Wochenbericht ab dem letzten Sonntag (oder heute, falls Sonntag)
+    letzter_sonntag = mitternacht - datetime.timedelta(days=(jetzt.weekday() + 1) % 7)
+    faellig.append(("Wochenrückblick", letzter_sonntag.date().isoformat(), letzter_sonntag))
+    return faellig
+
+
+def im_zeitfenster(stunde: int, fenster: str = REPORT_OFFPEAK_HOURS) -> bool:
+    """Liegt die UTC-Stunde im Fenster "von-bis" (inklusive, darf über Mitternacht gehen)?"""
+    von, bis = (int(s) for s in fenster.split("-"))
+    return von <= stunde <= bis if von <= bis else stunde >= von or stunde <= bis
+
+
+async def aktive_nutzer(db, tage: int = REPORT_ACTIVE_DAYS) -> List[str]:
+    """Alle Nutzer mit Gesprächen in den letzten `tage` Tagen."""
+    seit = _iso(_jetzt() - datetime.timedelta(days=tage))
+    nutzer: Dict[str, None] = {}
+    async for row in zeilen_seitenweise(db, lambda: db.table("conversation_history")
+            .select("user_id")
+            .gte("timestamp", seit)
+            .order("user_id", desc=False)):
+        nutzer[str(row["user_id"])] = None
+    return list(nutzer)
+
+
+class BerichtScheduler:
+    def __init__(self, db, erzeugen: Callable[[str, str, datetime.datetime], Awaitable[Optional[str]]],
+                 nutzer: Callable[[], Awaitable[List[str]]], parallel: int = REPORT_SCHEDULER_CONCURRENCY,
+                 intervall: float = REPORT_SCHEDULER_INTERVAL_SECONDS, zeitfenster: str = REPORT_OFFPEAK_HOURS,
+                 max_versuche: int = REPORT_MAX_ATTEMPTS, retry_sekunden: float = REPORT_RETRY_SECONDS):
+        """erzeugen(user_id, typ, beginn) liefert den Berichtstext oder None, wenn es für die Periode schon einen gibt."""
+        self.db = db
+        self.erzeugen = erzeugen
+        self.nutzer = nutzer
+        self.intervall = intervall
+        self.zeitfenster = zeitfenster
+        self.max_versuche = max_versuche
+        self.retry_sekunden = retry_sekunden
+        self._semaphore = asyncio.Semaphore(parallel)
+        self._geplant_am: Optional[datetime.date] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def planen(self, user_ids: Optional[List[str]] = None) -> int:
+        """Legt die fälligen Berichte der Nutzer als Jobs an (vorhandene bleiben unverändert)."""
+        jetzt = _jetzt()
+        if user_ids is None:
+            user_ids = await self.nutzer()
+        jobs = [{
+            "user_id": user_id,
+            "typ": typ,
+            "periode": periode,
+            "beginn": _iso(beginn),
+            "status": "offen",
+            "versuche": 0,
+            "naechster_versuch": _iso(jetzt),
+        } for user_id in user_ids for typ, periode, beginn in faellige_berichte(jetzt)]
+        for start in range(0, len(jobs), 500):
+            await self.db.execute(self.db.table(TABELLE).upsert(jobs[start:start + 500], on_conflict="user_id,typ,periode", ignore_duplicates=True))
+        metrics.incr("report_scheduler.planned_users", len(user_ids))
+        return len(jobs)
+
+    def _faellig(self, spalten: str):
+        return self.db.table(TABELLE).select(spalten).eq("status", "offen").lte("naechster_versuch", _iso(_jetzt()))
+
+    async def abarbeiten(self, limit: int = 100, user_id: Optional[str] = None) -> int:
+        """Erzeugt die fälligen Jobs (höchstens `limit`); gibt zurück, wie viele dabei waren.
+
+        Die Jobs eines Nutzers laufen nacheinander und von unten nach oben – so findet
+        der Quartalsbericht die Monats-Digests, die der Monatsbericht gerade gebaut hat.
+        Verschiedene Nutzer laufen parallel (begrenzt über `parallel`).
+        """
+        query = self._faellig("id, user_id, typ, beginn, versuche")
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        jobs = await self.db.fetch(query.order("naechster_versuch", desc=False).limit(limit))
+        pro_nutzer: Dict[str, List[Dict]] = {}
+        for job in jobs:
+            pro_nutzer.setdefault(str(job["user_id"]), []).append(job)
+        await asyncio.gather(*[self._nacheinander(eigene) for eigene in pro_nutzer.values()])
+        return len(jobs)
+
+    async def _nacheinander(self, jobs: List[Dict]):
+        for job in sorted(jobs, key=lambda j: -BERICHTE.index(j["typ"])):
+            await self._ausfuehren(job)
+
+    async def faellige_nutzer(self) -> List[str]:
+        """Alle Nutzer mit mindestens einem fälligen Job."""
+        nutzer: Dict[str, None] = {}
+        async for row in zeilen_seitenweise(self.db, lambda: self._faellig("user_id").order("user_id", desc=False)):
+            nutzer[str(row["user_id"])] = None
+        return list(nutzer)
+
+    async def naechster_versuch(self) -> Optional[float]:
+        """Sekunden bis zum nächsten offenen Job (0 wenn schon fällig), None wenn keiner mehr offen ist."""
+        naechster = await self.db.fetch(self.db.table(TABELLE)
+            .select("naechster_versuch")
+            .eq("status", "offen")
+            .order("naechster_versuch", desc=False)
+            .limit(1))
+        if not naechster:
+            return None
+        zeitpunkt = datetime.datetime.fromisoformat(naechster[0]["naechster_versuch"].replace("Z", "+00:00")).replace(tzinfo=None)
+        return max(0.0, (zeitpunkt - _jetzt()).total_seconds())
+
+    async def _ausfuehren(self, job: Dict):
+        async with self._semaphore:
+            versuche = job["versuche"] + 1
+            reserviert = await self.db.execute(self.db.table(TABELLE)
+                .update({"versuche": versuche, "naechster_versuch": _iso(_jetzt() + datetime.timedelta(seconds=REPORT_JOB_LEASE_SECONDS))})
+                .eq("id", job["id"])
+                .eq("versuche", job["versuche"]))
+            if not reserviert.data:
+                return  # Ein anderer Worker war schneller
+            beginn = datetime.datetime.fromisoformat(job["beginn"].replace("Z", "+00:00")).replace(tzinfo=None)
+            try:
+                bericht = await self.erzeugen(job["user_id"], job["typ"], beginn)
+            except asyncio.CancelledError:
+                # Abgebrochen (Herunterfahren, Strg+C): Job sofort wieder freigeben statt die Reservierung abzuwarten
+                await self.db.execute(self.db.table(TABELLE)
+                    .update({"versuche": job["versuche"], "naechster_versuch": _iso(_jetzt())})
+                    .eq("id", job["id"]))
+                raise
+            except Exception as e:
+                endgueltig = versuche >= self.max_versuche
+                print(f"Fehler beim Erzeugen des {job['typ']} für User {job['user_id']} (Versuch {versuche}): {e}")
+                metrics.incr("report_scheduler.failed" if endgueltig else "report_scheduler.retried")
+                await self.db.execute(self.db.table(TABELLE).update({
+                    "status": "fehlgeschlagen" if endgueltig else "offen",
+                    "naechster_versuch": _iso(_jetzt() + datetime.timedelta(seconds=self.retry_sekunden * 2 ** (versuche - 1))),
+                    "fehler": str(e)[:500],
+                }).eq("id", job["id"]))
+                return
+            jetzt = _iso(_jetzt())
+            await self.db.execute(self.db.table(TABELLE).update({
+                "status": "fertig",
+                "bericht": bericht,
+                "fertig_am": jetzt,
+                # Schon vorhandene Berichte (None) nicht noch einmal anzeigen
+                "angezeigt_am": jetzt if bericht is None else None,
+            }).eq("id", job["id"]))
+            metrics.incr("report_scheduler.generated")
+
+    async def abholen(self, user_id: str) -> Optional[Dict[str, str]]:
+        """Der fertige, noch nicht angezeigte Bericht mit dem höchsten Vorrang (einmalig), sonst None."""
+        fertig = await self.db.fetch(self.db.table(TABELLE)
+            .select("id, typ, bericht")
+            .eq("user_id", user_id)
+            .eq("status", "fertig")
+            .is_("angezeigt_am", "null"))
+        if not fertig:
+            return None
+        job = min(fertig, key=lambda j: BERICHTE.index(j["typ"]))
+        await self.db.execute(self.db.table(TABELLE).update({"angezeigt_am": _iso(_jetzt())}).eq("id", job["id"]))
+        return {"typ": job["typ"], "inhalt": job["bericht"]}
+
+    async def durchlauf(self):
+        """Ein Takt des Workers: im Zeitfenster einmal täglich planen, dann alle fälligen Jobs abarbeiten."""
+        jetzt = _jetzt()
+        if not im_zeitfenster(jetzt.hour, self.zeitfenster):
+            return
+        if self._geplant_am != jetzt.date():
+            await self.planen()
+            self._geplant_am = jetzt.date()
+        while await self.abarbeiten():
+            pass
+
+    def starten(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._schleife())
+
+    async def _schleife(self):
+        while True:
+            try:
+                await self.durchlauf()
+            except Exception as e:
+                print(f"Fehler im Bericht-Scheduler: {e}")
+            await asyncio.sleep(self.intervall)
+
+    async def beenden(self):
+        """Beim Herunterfahren: Worker stoppen; unterbrochene Jobs laufen nach Ablauf der Reservierung erneut."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
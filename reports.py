@@ -0,0 +1,282 @@
+"""Wochen-, Monats-, Quartals- und Jahresberichte erzeugen.
+
+Die Berichte brauchen nur Supabase, das LLM und die Digests. Sie liegen
+deshalb außerhalb von main.py, damit report_batch.py sie erzeugen kann, ohne
+den Server (und dessen lokalen Vektor-Index) zu laden. Jeder Bericht wird in
+long_term_memory gespeichert; nach_speichern(user_id, zeilen) erhält die neuen
+Zeilen – der Server indexiert sie so sofort, der Batch-Lauf lässt das dem
+Server (vector_index.berichte_nachindexieren).
+"""
+import asyncio
+import datetime
+from typing import Callable, Dict, List, Optional
+
+from digests import Digests, digest_text, kind_perioden, periode_von, tage_zwischen, vorherige_perioden
+from prompts import JAHRESBERICHT_ANWEISUNGEN, QUARTALSBERICHT_ANWEISUNGEN, RUECKBLICK_ANWEISUNGEN
+
+
+class Berichte:
+    def __init__(self, db, llm, digests: Digests, nach_speichern: Optional[Callable[[str, List[Dict]], None]] = None):
+        self.db = db
+        self.llm = llm
+        self.digests = digests
+        self.nach_speichern = nach_speichern
+
+    def _gespeichert(self, user_id: str, zeilen: List[Dict]):
+        if self.nach_speichern is not None and zeilen:
+            self.nach_speichern(user_id, zeilen)
+
+    async def erzeugen(self, user_id: str, typ: str, beginn: datetime.datetime) -> Optional[str]:
+        """Erzeugt einen fälligen Bericht für den Scheduler; None, wenn es für die Periode schon einen gibt."""
+        vorhanden = await self.db.fetch(self.db.table("long_term_memory") \
+            .select("id") \
+            .eq("user_id", user_id) \
+            .eq("thema", typ) \
+            .gte("timestamp", beginn.isoformat() + 'Z') \
+            .limit(1))
+        if vorhanden:
+            return None
+
+        if typ == "Jahresrückblick":
+            return await self.jahresbericht(user_id)
+        if typ == "Quartalsbericht":
+            return await self.quartalsbericht(user_id)
+        if typ == "Wochenrückblick":
+            # Beginn ist der letzte Sonntag; der Bericht umfasst die Woche ab dem Montag davor
+            return await self.rueckblick("Wochen", 7, user_id, seit=(beginn - datetime.timedelta(days=6)).isoformat() + 'Z')
+
+        bericht_inhalt = await self.rueckblick("Monats", 30, user_id)
+        try:
+            # Erst den Vormonat vollständig verdichten – danach gibt es seine Rohdaten nicht mehr
+            vormonat = periode_von("monat", beginn.date() - datetime.timedelta(days=1))
+            await self.digests.perioden(user_id, "monat", [vormonat])
+            if not await self.digests.gespeichert(user_id, "monat", [vormonat]):
+                raise RuntimeError(f"Monats-Digest {vormonat} fehlt")
+            await self.db.execute(self.db.table("conversation_history") \
+                .delete() \
+                .eq("user_id", user_id) \
+                .lt("timestamp", beginn.isoformat() + 'Z'))
+        except Exception as e:
+            print(f"Fehler beim Cleanup der Konversationshistorie: {e}")
+        return bericht_inhalt
+
+    async def quartalsbericht(self, user_id: str):
+        heute = datetime.datetime.now()
+        quartal = (heute.month - 1) // 3 + 1
+        quartal_name = f"Q{quartal} {heute.year}"
+
+        # Abgelaufenes Quartal aus seinen Monats-Digests; der Quartals-Digest wird dabei für den Jahresbericht abgelegt
+        vorquartal = periode_von("quartal", heute.replace(month=3 * quartal - 2, day=1).date() - datetime.timedelta(days=1))
+        monate = await self.digests.perioden(user_id, "monat", kind_perioden("quartal", vorquartal)[1])
+        await self.digests.perioden(user_id, "quartal", [vorquartal])
+        monatsberichte_text = digest_text(monate) or "Keine Gespräche in diesem Quartal."
+
+        profil_data, fruehere_quartale, letztes_jahr = await asyncio.gather(
+            self.db.fetch(self.db.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id)),
+            self.digests.gespeichert(user_id, "quartal", vorherige_perioden("quartal", vorquartal, 4)),
+            self.digests.gespeichert(user_id, "jahr", [str(heute.year - 1)]),
+        )
+        profil_text = "\n".join([f"- {p['attribute_name']}: {p['attribute_value']}" for p in profil_data]) if profil_data else "Keine Profildaten."
+        frueherer_quartale_text = digest_text(fruehere_quartale) or "Keine früheren Quartale vorhanden."
+        letzter_jahresbericht_text = f"Vorjahr:\n{digest_text(letztes_jahr)}" if letztes_jahr else "Kein Vorjahr vorhanden."
+
+        response = await self.llm.complete(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": QUARTALSBERICHT_ANWEISUNGEN},
+                {"role": "user", "content": f"""Quartal: {quartal_name}
+
+Monate des Quartals (Digests):
+{monatsberichte_text}
+
+Frühere Quartale (Digests, Entwicklung über die Zeit):
+{frueherer_quartale_text}
+
+Übergeordneter Kontext:
+{letzter_jahresbericht_text}
+
+Benutzerprofil:
+{profil_text}"""}
+            ],
+            max_tokens=900,
+            temperature=0.8,
+            timeout=120,
+            tag="bericht"
+        )
+
+        bericht = response.choices[0].message.content
+
+        result = await self.db.execute(self.db.table("long_term_memory").insert({
+            "thema": "Quartalsbericht",
+            "inhalt": bericht,
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
+            "user_id": user_id
+        }))
+        self._gespeichert(user_id, result.data or [])
+
+        return bericht
+
+    async def jahresbericht(self, user_id: str):
+        heute = datetime.datetime.now()
+        jahr = heute.year
+
+        # Abgelaufenes Jahr aus seinen Quartals-Digests (fehlende werden aus den Monats-Digests gebaut)
+        vorjahr = str(jahr - 1)
+        quartale = await self.digests.perioden(user_id, "quartal", kind_perioden("jahr", vorjahr)[1])
+        await self.digests.perioden(user_id, "jahr", [vorjahr])
+        quartale_text = digest_text(quartale) or "Keine Gespräche in diesem Jahr."
+
+        profil_data, all_ziele, fruehere_jahre = await asyncio.gather(
+            self.db.fetch(self.db.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id)),
+            self.db.fetch(self.db.table("goals").select("titel, status").eq("user_id", user_id)),
+            self.digests.gespeichert(user_id, "jahr", vorherige_perioden("jahr", vorjahr, 3)),
+        )
+        profil_text = "\n".join([f"- {p['attribute_name']}: {p['attribute_value']}" for p in profil_data]) if profil_data else "Keine Profildaten."
+        ziele_text = "\n".join([f"- {z['titel']} ({z['status']})" for z in all_ziele]) if all_ziele else "Keine Ziele."
+        vorheriger_bericht = digest_text(fruehere_jahre) or "Kein früheres Jahr vorhanden."
+
+        response = await self.llm.complete(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": JAHRESBERICHT_ANWEISUNGEN},
+                {"role": "user", "content": f"""Jahr: {jahr}
+
+Quartale des Jahres {vorjahr} (Digests):
+{quartale_text}
+
+Ziele:
+{ziele_text}
+
+Benutzerprofil:
+{profil_text}
+
+Frühere Jahre (Digests, Entwicklung über die Jahre):
+{vorheriger_bericht}"""}
+            ],
+            max_tokens=1500,
+            temperature=0.8,
+            timeout=120,
+            tag="bericht"
+        )
+
+        bericht = response.choices[0].message.content
+
+        result = await self.db.execute(self.db.table("long_term_memory").insert({
+            "thema": "Jahresrückblick",
+            "inhalt": bericht,
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
+            "user_id": user_id
+        }))
+        self._gespeichert(user_id, result.data or [])
+
+        return bericht
+
+    # Wochen- und Monatsberichte generieren (mit Summarisierung)
+    async def rueckblick(self, zeitraum: str, tage: int, user_id: str, seit: str = None):
+        if seit is None:
+            seit = (datetime.datetime.utcnow() - datetime.timedelta(days=tage)).isoformat() + 'Z'
+
+        # Gespräche des Zeitraums aus den Tages-Digests (fehlende Tage werden einmalig aus der Historie verdichtet)
+        tages_digests = await self.digests.perioden(user_id, "tag", tage_zwischen(datetime.date.fromisoformat(seit[:10]), datetime.datetime.utcnow().date()))
+
+        # Alle Lesezugriffe für den Bericht gleichzeitig: Ziele des Zeitraums, Profil, Routinen,
+        # die letzten 4 Berichte gleichen Typs sowie der letzte Monats- und Quartalsbericht als übergeordneter Kontext
+        all_ziele, profil_data, all_routines_res, latest_reports_res, letzter_monat, letzter_quartal = await self.db.gather(
+            self.db.table("goals").select("titel", "status", "created_at").gte("created_at", seit).eq("user_id", user_id).order("created_at", desc=False),
+            self.db.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id),
+            self.db.table("todos").select("title, recurrence_weekday, last_checked_date, missed_count").eq("user_id", user_id).eq("is_recurring", True).not_.in_("status", ["completed", "archived"]),
+            self.db.table("long_term_memory").select("inhalt, timestamp").eq("user_id", user_id).eq("thema", f"{zeitraum}rückblick").order("timestamp", desc=True).limit(4),
+            self.db.table("long_term_memory").select("inhalt, timestamp").eq("user_id", user_id).eq("thema", "Monatsrückblick").order("timestamp", desc=True).limit(1),
+            self.db.table("long_term_memory").select("inhalt, timestamp").eq("user_id", user_id).eq("thema", "Quartalsbericht").order("timestamp", desc=True).limit(1),
+        )
+    
+        profil_text = ""
+        if profil_data:
+            profil_text = "\n".join([f"- {item['attribute_name']}: {item['attribute_value']}" for item in profil_data])
+        else:
+            profil_text = "Keine Profildaten vorhanden."
+
+        gespraeche_text_for_prompt = digest_text(tages_digests)
+        if not gespraeche_text_for_prompt:
+            gespraeche_text_for_prompt = "Es gab keine relevanten Gespräche in diesem Zeitraum."
+
+        # Ziele können oft kompakter sein. Wenn sie aber auch zu lang werden, hier auch summarisieren.
+        ziele_text = "\n".join([f"{z['titel']} ({z['status']})" for z in all_ziele[-20:]]) # max. die letzten 20 Ziele
+
+        _report_date = datetime.datetime.now().strftime("%Y-%m-%d")
+        routinen_text = ""
+        if all_routines_res:
+            routinen_text = "\n".join([f"- {r['title']} (Tag: {r['recurrence_weekday']}, Heute erledigt: {'Ja' if r.get('last_checked_date') == _report_date else 'Nein'}, Verpasst: {r.get('missed_count', 0)})" for r in all_routines_res])
+        else:
+            routinen_text = "Keine Routinen vorhanden."
+
+        if latest_reports_res:
+            previous_report_content = "\n\n".join([
+                f"Bericht vom {r['timestamp'][:10]}:\n{r['inhalt']}" for r in reversed(latest_reports_res)
+            ])
+        else:
+            previous_report_content = "Kein früherer Bericht dieses Typs vorhanden."
+
+        # Übergeordneter Kontext: eine Ebene höher
+        uebergeordnet_text = ""
+        if zeitraum == "Wochen":
+            if letzter_monat:
+                uebergeordnet_text += f"Letzter Monatsbericht ({letzter_monat[0]['timestamp'][:7]}):\n{letzter_monat[0]['inhalt']}"
+            if letzter_quartal:
+                uebergeordnet_text += f"\n\nLetzter Quartalsbericht ({letzter_quartal[0]['timestamp'][:7]}):\n{letzter_quartal[0]['inhalt']}"
+        elif zeitraum == "Monats":
+            if letzter_quartal:
+                uebergeordnet_text = f"Letzter Quartalsbericht ({letzter_quartal[0]['timestamp'][:7]}):\n{letzter_quartal[0]['inhalt']}"
+
+        heute = datetime.datetime.now()
+        if zeitraum == "Monats":
+            zeitraum_label = heute.strftime('%B %Y')
+        else:
+            montag = (heute - datetime.timedelta(days=heute.weekday())).strftime('%d.%m.')
+            zeitraum_label = f"Woche {montag} – {heute.strftime('%d.%m.%Y')}"
+
+        uebergeordnet_abschnitt = f"\n\n    Übergeordneter Kontext (höhere Berichtsebene):\n    {uebergeordnet_text}" if uebergeordnet_text else ""
+        user = f"""
+    Heute: {heute.strftime('%d. %B %Y')}
+    Zeitraum: {zeitraum_label}
+
+    Gespräche:
+    {gespraeche_text_for_prompt}
+
+    Ziele (Status):
+    {ziele_text}
+
+    Routinen:
+    {routinen_text}
+
+    Frühere Berichte gleichen Typs (Entwicklung über die Zeit):
+    {previous_report_content}{uebergeordnet_abschnitt}
+
+    Benutzerprofil-Details:
+    {profil_text}
+    """
+
+        response = await self.llm.complete(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": RUECKBLICK_ANWEISUNGEN},
+                {"role": "user", "content": user}
+            ],
+            max_tokens=400,
+            temperature=0.7,
+            timeout=120,
+            tag="bericht"
+        )
+
+        bericht = response.choices[0].message.content
+
+        # Bericht speichern
+        result = await self.db.execute(self.db.table("long_term_memory").insert({
+            "thema": f"{zeitraum}rückblick",
+            "inhalt": bericht,
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
+            "user_id": user_id # user_id auch hier speichern!
+        }))
+        self._gespeichert(user_id, result.data or [])
+
+        return bericht
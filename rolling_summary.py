@@ -0,0 +1,128 @@
+"""Fortlaufende Gesprächszusammenfassung pro Nutzer.
+
+Statt für Chat und Berichte immer wieder die rohe Konversationshistorie zu
+lesen und neu zusammenzufassen, wird pro Nutzer und Kalenderwoche eine
+Zusammenfassung gepflegt. Alle ROLLING_SUMMARY_EVERY Turns werden die neuen
+Turns in die bisherige Zusammenfassung ihrer Woche eingearbeitet – die Kosten
+pro Turn bleiben konstant, egal wie lang der Zeitraum ist.
+
+Tabelle conversation_summaries (user_id, woche, zusammenfassung, turns,
+bis_timestamp, updated_at), eindeutig über (user_id, woche). bis_timestamp
+ist der Zeitstempel des zuletzt eingearbeiteten Turns; alles danach gilt als
+noch nicht eingearbeitet.
+"""
+import asyncio
+import datetime
+import os
+from typing import Dict, List
+
+ROLLING_SUMMARY_EVERY = int(os.getenv("ROLLING_SUMMARY_EVERY", "4"))
+ROLLING_SUMMARY_MAX_WORDS = int(os.getenv("ROLLING_SUMMARY_MAX_WORDS", "250"))
+# Höchstens so viele Turns pro LLM-Aufruf einarbeiten (z.B. beim ersten Lauf mit langer Historie)
+FALT_MAX_TURNS = 40
+
+TABELLE = "conversation_summaries"
+
+
+def woche_von(timestamp: str) -> str:
+    """ISO-Kalenderwoche eines Zeitstempels, z.B. "2026-W42" (sortierbar)."""
+    jahr, woche, _ = datetime.date.fromisoformat(timestamp[:10]).isocalendar()
+    return f"{jahr}-W{woche:02d}"
+
+
+def formatiere_turns(rows: List[Dict]) -> str:
+    zeilen = []
+    for r in rows:
+        if r.get("ai_prompt"):
+            zeilen.append(f"Einstiegsfrage: {r['ai_prompt']}")
+        if r.get("user_input"):
+            zeilen.append(f"User: {r['user_input']}")
+        if r.get("ai_response"):
+            zeilen.append(f"Berater: {r['ai_response']}")
+    return "\n".join(zeilen)
+
+
+class RollingSummary:
+    def __init__(self, db, llm, alle_n: int = ROLLING_SUMMARY_EVERY):
+        self.db = db
+        self.llm = llm
+        self.alle_n = alle_n
+        self._offen: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, user_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(user_id, asyncio.Lock())
+
+    async def nach_turn(self, user_id: str):
+        """Zählt einen Turn; jeder N-te Turn arbeitet die neuen Turns in die Zusammenfassung ein."""
+        self._offen[user_id] = self._offen.get(user_id, 0) + 1
+        if self._offen[user_id] >= self.alle_n:
+            await self.falte(user_id)
+
+    async def falte(self, user_id: str):
+        """Arbeitet alle noch nicht eingearbeiteten Turns in die Zusammenfassung ihrer Woche ein."""
+        async with self._lock(user_id):
+            self._offen.pop(user_id, None)
+            letzte = await self.db.fetch(self.db.table(TABELLE)
+                .select("woche, zusammenfassung, turns, bis_timestamp")
+                .eq("user_id", user_id)
+                .order("bis_timestamp", desc=True)
+                .limit(1))
+            bis = letzte[0]["bis_timestamp"] if letzte else ""
+            stand = {letzte[0]["woche"]: letzte[0]} if letzte else {}
+
+            while True:
+                query = self.db.table("conversation_history") \
+                    .select("user_input, ai_response, ai_prompt, timestamp") \
+                    .eq("user_id", user_id)
+                if bis:
+                    query = query.gt("timestamp", bis)
+                neue = await self.db.fetch(query.order("timestamp", desc=False).limit(FALT_MAX_TURNS))
+                if not neue:
+                    return
+                # Turns einer Woche gemeinsam einarbeiten (Wochengrenzen im Block möglich)
+                gruppen: Dict[str, List[Dict]] = {}
+                for row in neue:
+                    gruppen.setdefault(woche_von(row["timestamp"]), []).append(row)
+                for woche, rows in gruppen.items():
+                    if woche not in stand:
+                        vorhanden = await self.db.fetch(self.db.table(TABELLE)
+                            .select("woche, zusammenfassung, turns, bis_timestamp")
+                            .eq("user_id", user_id)
+                            .eq("woche", woche)
+                            .limit(1))
+                        stand[woche] = vorhanden[0] if vorhanden else {"woche": woche, "zusammenfassung": "", "turns": 0}
+                    stand[woche] = await self._aktualisiere(user_id, stand[woche], rows)
+                bis = neue[-1]["timestamp"]
+                if len(neue) < FALT_MAX_TURNS:
+                    return
+
+    async def _aktualisiere(self, user_id: str, bisher: Dict, rows: List[Dict]) -> Dict:
+        prompt = f"""Bisherige Zusammenfassung der Woche {bisher['woche']}:
+{bisher['zusammenfassung'] or 'Noch keine.'}
+
+Neue Gesprächsausschnitte:
+{formatiere_turns(rows)}
+
+Aktualisiere die Zusammenfassung, indem du die neuen Ausschnitte einarbeitest. Konzentriere dich auf besprochene Themen, Fortschritte, Herausforderungen und Muster. Wichtig: erhalte explizit, wenn der Nutzer ein Thema als vergangen eingeordnet hat (z.B. 'das war vor Jahren') oder den Berater korrigiert hat, weil dieser ein nicht mehr aktuelles Thema angesprochen hat.
+Beschränke die Zusammenfassung auf maximal {ROLLING_SUMMARY_MAX_WORDS} Wörter. Antworte nur mit der Zusammenfassung."""
+        response = await self.llm.complete(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": "Du bist ein hilfreicher Assistent, der Gesprächsverläufe fortlaufend zusammenfasst."},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=ROLLING_SUMMARY_MAX_WORDS * 2,
+            temperature=0.3,
+            tag="zusammenfassung",
+        )
+        neu = {
+            "user_id": user_id,
+            "woche": bisher["woche"],
+            "zusammenfassung": response.choices[0].message.content.strip(),
+            "turns": (bisher.get("turns") or 0) + len(rows),
+            "bis_timestamp": rows[-1]["timestamp"],
+            "updated_at": datetime.datetime.utcnow().isoformat() + 'Z',
+        }
+        await self.db.execute(self.db.table(TABELLE).upsert(neu, on_conflict="user_id,woche"))
+        return neu
@@ -0,0 +1,69 @@
+"""Spekulative Ausführung mit Messung von gesparter und verschwendeter Arbeit.
+
+Eine Spekulation startet eine Arbeit (z.B. Kontext laden und gpt-4o-Antwort),
+bevor feststeht, ob sie gebraucht wird. Wird sie bestätigt, ist die parallel
+gelaufene Zeit gespart; wird sie verworfen, wird sie abgebrochen und als
+Verschwendung gezählt. Die Zähler landen unter "speculation.<name>.*" in /metrics.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from metrics import metrics
+
+
+class Spekulation:
+    def __init__(self, name: str, factory: Callable[[], Awaitable[Any]]):
+        self.name = name
+        self._factory = factory
+        self._task: Optional[asyncio.Task] = None
+        self._start = 0.0
+        self._ende: Optional[float] = None
+        self._entscheidung: Optional[float] = None
+
+    @property
+    def gestartet(self) -> bool:
+        return self._task is not None
+
+    def starten(self):
+        if self._task is None:
+            self._start = time.monotonic()
+            self._task = asyncio.create_task(self._factory())
+            self._task.add_done_callback(self._beendet)
+            metrics.incr(f"speculation.{self.name}.started")
+
+    def _beendet(self, task: asyncio.Task):
+        self._ende = time.monotonic()
+
+    def _laufzeit_bis(self, zeitpunkt: float) -> float:
+        return max(0.0, min(zeitpunkt, self._ende or zeitpunkt) - self._start)
+
+    def bestaetigen(self):
+        """Die Spekulation wird gebraucht; gespart ist die Arbeit, die bis jetzt parallel lief."""
+        if self._entscheidung is None:
+            self._entscheidung = time.monotonic()
+            metrics.incr(f"speculation.{self.name}.used")
+            metrics.incr(f"speculation.{self.name}.saved_seconds", round(self._laufzeit_bis(self._entscheidung), 4))
+
+    async def nutzen(self) -> Any:
+        self.bestaetigen()
+        return await self._task
+
+    def verwerfen(self):
+        """Die Spekulation wird nicht gebraucht: abbrechen und als Verschwendung zählen."""
+        if self._task is None or self._entscheidung is not None:
+            return
+        self._entscheidung = time.monotonic()
+        metrics.incr(f"speculation.{self.name}.wasted")
+        metrics.incr(f"speculation.{self.name}.wasted_seconds", round(self._laufzeit_bis(self._entscheidung), 4))
+        if self._task.done():
+            # Bereits fertig – der Aufruf ist vollständig bezahlt
+            if not self._task.cancelled() and self._task.exception() is None:
+                metrics.incr(f"speculation.{self.name}.wasted_completed")
+        else:
+            self._task.cancel()
+
+    def abbrechen(self):
+        """Aufräumen (z.B. Client-Abbruch) ohne Metriken."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
@@ -0,0 +1,75 @@
+"""Chat-Antworten als Server-Sent Events (POST /chat/{user_id}/stream).
+
+Die Antwort (Intent, Tokens, Speichern des Turns) entsteht in einem eigenen
+Task; der Response-Stream liest nur dessen Tokens mit. Trennt der Client die
+Verbindung, läuft der Task trotzdem zu Ende: der Turn wird gespeichert und
+bekommt Zusammenfassung und Profil-Extraktion wie bei /chat, und eine
+Wiederholung mit demselben Idempotency-Key bekommt das Ergebnis.
+
+Events: "data: {"token": ...}" pro Token, abschließend "event: done" mit dem
+Ergebnis bzw. "event: error" mit {"detail": ...}. Ein Duplikat bekommt nur
+das done-Event der ursprünglichen Anfrage.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from idempotency import Idempotenz
+
+# erzeugen(senden) ruft senden(token) pro Token auf und liefert die Nutzlast des done-Events
+Erzeugen = Callable[[Callable[[str], None]], Awaitable[Dict[str, Any]]]
+
+
+def sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    """Formatiert ein Server-Sent-Event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class ChatStreams:
+    def __init__(self, idempotenz: Idempotenz, fehler_text: str):
+        self.idempotenz = idempotenz
+        self.fehler_text = fehler_text
+        self._tasks: Set[asyncio.Task] = set()
+
+    def starten(self, key: Optional[str], erzeugen: Erzeugen) -> AsyncIterator[str]:
+        """Startet erzeugen() sofort als eigenen Task und gibt den Event-Stream dazu zurück.
+
+        Der Aufrufer hat key vorher beansprucht; der Task meldet ihn beim Ende zurück.
+        """
+        tokens: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(erzeugen(tokens.put_nowait))
+
+        def fertig(t: asyncio.Task):
+            self._tasks.discard(t)
+            tokens.put_nowait(None)
+            if t.cancelled() or t.exception() is not None:
+                print(f"Fehler in der Chat-Stream-Funktion: {'abgebrochen' if t.cancelled() else t.exception()}")
+                if key:
+                    self.idempotenz.fehlgeschlagen(key, RuntimeError("Chat-Stream nicht abgeschlossen"))
+            elif key:
+                self.idempotenz.abschliessen(key, t.result())
+
+        # Referenz halten, sonst kann der Task nach einem Client-Abbruch eingesammelt werden
+        self._tasks.add(task)
+        task.add_done_callback(fertig)
+        return self._events(task, tokens)
+
+    async def _events(self, task: asyncio.Task, tokens: asyncio.Queue) -> AsyncIterator[str]:
+        while (token := await tokens.get()) is not None:
+            yield sse({"token": token})
+        if task.cancelled() or task.exception() is not None:
+            yield sse({"detail": self.fehler_text}, event="error")
+        else:
+            yield sse(task.result(), event="done")
+
+    async def duplikat(self, vorhanden: Awaitable[Dict[str, Any]]) -> AsyncIterator[str]:
+        """Event-Stream für ein Duplikat: nur das done-Event der ursprünglichen Anfrage."""
+        try:
+            yield sse(await vorhanden, event="done")
+        except Exception:
+            yield sse({"detail": self.fehler_text}, event="error")
+
+    async def beenden(self):
+        """Beim Herunterfahren: laufende Antworten noch zu Ende schreiben."""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
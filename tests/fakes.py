@@ -0,0 +1,191 @@
+"""Gemeinsame Fakes für die Tests (from fakes import FakeDB, FakeLLM): Supabase-Query-Builder und LLMGateway im Speicher.
+
+FakeDB hält pro Tabelle eine Liste von Zeilen und wertet die Queries wie
+Supabase aus (Filter, Sortierung, range/limit, insert/upsert/update/delete).
+Jede ausgeführte Query landet in FakeDB.abfragen, so lassen sich Roundtrips,
+Seiten und gelesene Tabellen prüfen. Database(FakeDB(...)) testet die echte
+Datenzugriffsschicht gegen dieselben Tabellen.
+"""
+import itertools
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+
+class FakeQuery:
+    def __init__(self, db, tabelle):
+        self.db, self.tabelle = db, tabelle
+        self.aktion, self.daten, self.on_conflict, self.ignore_duplicates = "select", None, "", False
+        self.filter, self.sortierung, self.bereich, self.anzahl = [], [], None, None
+        self._nicht = False
+
+    def _filter(self, bedingung):
+        nicht, self._nicht = self._nicht, False
+        self.filter.append((lambda r: not bedingung(r)) if nicht else bedingung)
+        return self
+
+    @property
+    def not_(self):
+        self._nicht = True
+        return self
+
+    def select(self, *_):
+        return self
+
+    def eq(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) == wert)
+
+    def neq(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) != wert)
+
+    def gt(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) is not None and r[feld] > wert)
+
+    def gte(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) is not None and r[feld] >= wert)
+
+    def lt(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) is not None and r[feld] < wert)
+
+    def lte(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) is not None and r[feld] <= wert)
+
+    def in_(self, feld, werte):
+        return self._filter(lambda r: r.get(feld) in werte)
+
+    def is_(self, feld, wert):
+        return self._filter(lambda r: r.get(feld) is None)
+
+    def order(self, feld, desc=False):
+        self.sortierung.append((feld, desc))
+        return self
+
+    def range(self, start, ende):
+        self.bereich = (start, ende)
+        return self
+
+    def limit(self, anzahl):
+        self.anzahl = anzahl
+        return self
+
+    def insert(self, daten):
+        self.aktion, self.daten = "insert", daten
+        return self
+
+    def upsert(self, daten, on_conflict="", ignore_duplicates=False):
+        self.aktion, self.daten, self.on_conflict, self.ignore_duplicates = "upsert", daten, on_conflict, ignore_duplicates
+        return self
+
+    def update(self, daten):
+        self.aktion, self.daten = "update", daten
+        return self
+
+    def delete(self):
+        self.aktion = "delete"
+        return self
+
+    def _auswahl(self):
+        return [r for r in self.db.tabellen[self.tabelle] if all(f(r) for f in self.filter)]
+
+    def ausfuehren(self):
+        zeilen = self.db.tabellen[self.tabelle]
+        if self.aktion in ("insert", "upsert"):
+            neu = self.daten if isinstance(self.daten, list) else [self.daten]
+            schluessel = [k for k in self.on_conflict.split(",") if k]
+            ergebnis = []
+            for row in neu:
+                alt = next((r for r in zeilen if schluessel and all(r.get(k) == row.get(k) for k in schluessel)), None)
+                if alt is None:
+                    alt = dict(row, id=row.get("id", next(self.db.ids)))
+                    zeilen.append(alt)
+                elif self.ignore_duplicates:
+                    continue
+                else:
+                    alt.update(row)
+                ergebnis.append(dict(alt))
+            return ergebnis
+        treffer = self._auswahl()
+        if self.aktion == "update":
+            for r in treffer:
+                r.update(self.daten)
+        elif self.aktion == "delete":
+            zeilen[:] = [r for r in zeilen if not any(r is t for t in treffer)]
+        treffer = [dict(r) for r in treffer]
+        for feld, desc in reversed(self.sortierung):
+            treffer.sort(key=lambda r: (r.get(feld) is None, r.get(feld)), reverse=desc)
+        if self.bereich:
+            treffer = treffer[self.bereich[0]:self.bereich[1] + 1]
+        return treffer[:self.anzahl] if self.anzahl is not None else treffer
+
+    def execute(self):
+        # Wie der synchrone Supabase-Client: so dient FakeDB auch als Client für data_access.Database
+        return SimpleNamespace(data=self.ausfuehren())
+
+
+class FakeDB:
+    """Wie data_access.Database, nur im Speicher: FakeDB(todos=[...], profile=[...])."""
+
+    def __init__(self, **tabellen):
+        self.tabellen = defaultdict(list, tabellen)
+        self.abfragen = []
+        self.ids = itertools.count(1)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    async def fetch(self, query):
+        self.abfragen.append(query)
+        return query.ausfuehren()
+
+    async def execute(self, query):
+        self.abfragen.append(query)
+        return SimpleNamespace(data=query.ausfuehren())
+
+    async def gather(self, *queries):
+        return [await self.fetch(q) for q in queries]
+
+
+class LangsamerClient(FakeDB):
+    """Supabase-Client-Ersatz für Database: execute() blockiert pro Tabelle (verzoegerung in Sekunden)
+    oder schlägt fehl (kaputt). threads sammelt die Namen der ausführenden Threads."""
+
+    def __init__(self, verzoegerung=None, kaputt=(), **tabellen):
+        super().__init__(**tabellen)
+        self.verzoegerung, self.kaputt = verzoegerung or {}, kaputt
+        self.threads = set()
+
+    def table(self, name):
+        query = super().table(name)
+        ausfuehren = query.execute
+
+        def execute():
+            self.threads.add(threading.current_thread().name)
+            if name in self.kaputt:
+                raise RuntimeError(f"{name} nicht erreichbar")
+            time.sleep(self.verzoegerung.get(name, 0))
+            return ausfuehren()
+
+        query.execute = execute
+        return query
+
+
+class FakeLLM:
+    """Wie LLMGateway: complete() antwortet mit `antwort` (Text oder Funktion der Aufrufnummer),
+    embed() liefert pro Text `vektor(text)`. Mit `fehler` schlägt complete() fehl."""
+
+    def __init__(self, antwort="Antwort", vektor=None, fehler=None):
+        self.antwort, self.vektor, self.fehler = antwort, vektor, fehler
+        self.prompts, self.kwargs, self.texte = [], [], []
+
+    async def complete(self, messages, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        self.kwargs.append(kwargs)
+        if self.fehler:
+            raise self.fehler
+        inhalt = self.antwort(len(self.prompts)) if callable(self.antwort) else self.antwort
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=inhalt))])
+
+    async def embed(self, texte, **kwargs):
+        self.texte += texte
+        return [self.vektor(t) if self.vektor else [1.0, 0.0, 0.0] for t in texte]
@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import time
+
+import chat_context
+from chat_context import lade_chat_kontext
+from data_access import Database
+from fakes import FakeDB, LangsamerClient
+
+
+def _tabellen():
+    heute = datetime.datetime.now().strftime("%Y-%m-%d")
+    return dict(
+        conversation_history=[
+            {"user_id": "1", "user_input": "Hallo", "ai_response": "Hi", "ai_prompt": "", "timestamp": "2026-10-17T08:00:00Z"},
+            {"user_id": "1", "user_input": "Wie gehts?", "ai_response": "Gut", "ai_prompt": "Was steht heute an?", "timestamp": "2026-10-18T08:00:00Z"},
+            {"user_id": "2", "user_input": "fremd", "ai_response": "fremd", "ai_prompt": "", "timestamp": "2026-10-18T09:00:00Z"},
+        ],
+        long_term_memory=[
+            {"user_id": "1", "thema": "Laufen", "inhalt": "Halbmarathon", "timestamp": "2026-09-01T10:00:00Z"},
+            {"user_id": "1", "thema": "Wochenrückblick", "inhalt": "Woche gut", "timestamp": "2026-10-12T01:00:00Z"},
+            {"user_id": "1", "thema": "Monatsrückblick", "inhalt": "Monat ok", "timestamp": "2026-10-01T02:00:00Z"},
+        ],
+        goals=[
+            {"user_id": "1", "titel": "Marathon", "status": "offen", "deadline": "2027-04-01"},
+            {"user_id": "1", "titel": "10 km", "status": "erreicht", "deadline": "2026-05-01"},
+        ],
+        profile=[
+            {"user_id": "1", "attribute_name": "Beruf", "attribute_value": "Lehrer", "archived": False},
+            {"user_id": "1", "attribute_name": "Termin_Zahnarzt", "attribute_value": "Dienstag", "archived": False},
+            {"user_id": "1", "attribute_name": "Prozess_Umzug", "attribute_value": "abgeschlossen", "archived": False},
+            {"user_id": "1", "attribute_name": "Wohnort", "attribute_value": "Köln", "archived": True},
+        ],
+        todos=[
+            {"user_id": "1", "title": "Laufen", "is_recurring": True, "status": "open", "recurrence_weekday": "Montag",
+             "last_checked_date": heute, "missed_count": 2},
+            {"user_id": "1", "title": "Steuer", "is_recurring": False, "status": "open", "priority": "hoch",
+             "due_date": "2999-01-01", "category": "Finanzen"},
+            {"user_id": "1", "title": "Arzt", "is_recurring": False, "status": "in_progress", "priority": "mittel",
+             "due_date": "2020-01-01", "category": "Gesundheit"},
+            {"user_id": "1", "title": "Erledigt", "is_recurring": False, "status": "completed", "priority": "hoch",
+             "due_date": "2020-01-01", "category": "Sonstiges"},
+        ],
+        conversation_summaries=[
+            {"user_id": "1", "woche": "2026-W40", "zusammenfassung": "alt"},
+            {"user_id": "1", "woche": "2026-W42", "zusammenfassung": "B"},
+            {"user_id": "1", "woche": "2026-W41", "zusammenfassung": "A"},
+        ],
+    )
+
+
+def test_abschnitte_wie_bisher_formatiert():
+    kontext = asyncio.run(lade_chat_kontext(Database(FakeDB(**_tabellen())), "1"))
+
+    assert [h["user_input"] for h in kontext["gespraechs_historie"]] == ["Hallo", "Wie gehts?"]
+    assert kontext["history_text"] == "User: Wie gehts?\nBerater: Gut\nBerater: Was steht heute an?\nUser: Hallo\nBerater: Hi"
+    assert kontext["wochenbericht_text"] == "[Erstellt am 2026-10-12]\nWoche gut"
+    assert kontext["monatsbericht_text"] == "[Erstellt am 2026-10-01]\nMonat ok"
+    assert kontext["ziele_text"] == "Aktuelle offene Ziele:\n- Marathon (Deadline: 2027-04-01)"
+    assert kontext["profile_text_for_prompt"] == ("Aktuelles Benutzerprofil:\n- Beruf: Lehrer\n- Termin_Zahnarzt: Dienstag\n"
+                                                  "- Prozess_Umzug: abgeschlossen")
+    assert kontext["upcoming_events_text"] == "- Termin_Zahnarzt: Dienstag"
+    assert kontext["routines_text"] == "Aktuelle Routinen:\n- Laufen (Tag: Montag, Erledigt: Ja, Verpasst: 2)"
+    assert kontext["todos_text"] == (
+        "Offene To-Dos:\n- Steuer (Priorität: hoch, Fällig: 2999-01-01, Kategorie: Finanzen)\n"
+        "- Arzt (Priorität: mittel, Fällig: 2020-01-01, Kategorie: Gesundheit)\n\n"
+        "Überfällige To-Dos:\n- Arzt (Fällig seit: 2020-01-01, Priorität: mittel)"
+    )
+    assert kontext["memory_text"] == ("[Aufgezeichnet: 2026-10-12] Wochenrückblick: Woche gut\n"
+                                      "[Aufgezeichnet: 2026-10-01] Monatsrückblick: Monat ok\n"
+                                      "[Aufgezeichnet: 2026-09-01] Laufen: Halbmarathon")
+    assert kontext["zusammenfassung_text"] == "Woche 2026-W41:\nA\n\nWoche 2026-W42:\nB"
+
+
+def test_ohne_daten_die_bisherigen_standardtexte():
+    kontext = asyncio.run(lade_chat_kontext(Database(FakeDB()), "1"))
+
+    assert kontext == {
+        "gespraechs_historie": [],
+        "history_text": "Bisher keine frühere Konversationshistorie.",
+        "wochenbericht_text": "Kein Wochenbericht verfügbar.",
+        "monatsbericht_text": "Kein Monatsbericht verfügbar.",
+        "ziele_text": "Keine offenen Ziele.",
+        "profile_text_for_prompt": "Keine spezifischen Profilinformationen erfasst.",
+        "upcoming_events_text": "Keine bevorstehenden Termine oder laufenden Prozesse.",
+        "routines_text": "Keine Routinen definiert.",
+        "todos_text": "Keine To-Dos definiert.",
+        "memory_text": "Keine spezifischen Langzeit-Erkenntnisse gespeichert.",
+        "zusammenfassung_text": "Noch keine Zusammenfassung früherer Gespräche.",
+    }
+
+
+def test_langsame_und_fehlerhafte_quellen_fallen_einzeln_auf_standardwerte(monkeypatch):
+    monkeypatch.setattr(chat_context, "CONTEXT_SOURCE_TIMEOUT", 0.05)
+    monkeypatch.setitem(chat_context.SOURCE_TIMEOUTS, "historie", 0.075)
+    client = LangsamerClient({"goals": 0.5, "conversation_history": 0.5}, kaputt=("conversation_summaries",), **_tabellen())
+
+    async def run():
+        start = time.monotonic()
+        kontext = await lade_chat_kontext(Database(client), "1")
+        return kontext, time.monotonic() - start
+
+    kontext, dauer = asyncio.run(run())
+    # Die Quellen laufen gleichzeitig: die Wartezeit ist das längste Timeout, nicht die Summe
+    assert dauer < 0.3
+    assert kontext["ziele_text"] == "Keine offenen Ziele."
+    assert kontext["gespraechs_historie"] == []
+    assert kontext["history_text"] == "Bisher keine frühere Konversationshistorie."
+    assert kontext["zusammenfassung_text"] == "Noch keine Zusammenfassung früherer Gespräche."
+    # Die übrigen Abschnitte sind vollständig geladen
+    assert kontext["wochenbericht_text"] == "[Erstellt am 2026-10-12]\nWoche gut"
+    assert kontext["upcoming_events_text"] == "- Termin_Zahnarzt: Dienstag"
+    assert kontext["routines_text"].startswith("Aktuelle Routinen:\n- Laufen")
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from data_access import Database
+from fakes import LangsamerClient
+
+
+def test_execute_bricht_nach_dem_timeout_ab():
+    db = Database(LangsamerClient({"todos": 0.5}, todos=[{"title": "a"}]), timeout=0.05)
+
+    async def run():
+        start = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await db.execute(db.table("todos").select("*"))
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) < 0.3
+    db.close()
+
+
+def test_timeout_pro_aufruf_ueberschreibt_den_standard():
+    db = Database(LangsamerClient({"todos": 0.1}, todos=[{"title": "a"}]), timeout=0.01)
+
+    async def run():
+        zeilen = await db.fetch(db.table("todos").select("*"), timeout=1.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await db.fetch(db.table("todos").select("*"), timeout=0.01)
+        return zeilen
+
+    assert asyncio.run(run()) == [{"title": "a"}]
+    db.close()
+
+
+def test_roundtrips_laufen_im_thread_pool_ohne_den_event_loop_zu_blockieren():
+    client = LangsamerClient({"todos": 0.1, "goals": 0.1}, todos=[{"title": "a"}], goals=[{"titel": "b"}])
+    db = Database(client, max_workers=4, timeout=1.0)
+
+    async def run():
+        start = time.monotonic()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while time.monotonic() - start < 0.1:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ergebnisse, _ = await asyncio.gather(db.gather(db.table("todos"), db.table("goals")), ticker())
+        return ergebnisse, ticks, time.monotonic() - start
+
+    ergebnisse, ticks, dauer = asyncio.run(run())
+    assert ergebnisse == [[{"title": "a"}], [{"titel": "b"}]]
+    # Beide Queries gleichzeitig, der Event-Loop läuft währenddessen weiter
+    assert dauer < 0.19 and ticks >= 5
+    assert all(name.startswith("supabase") for name in client.threads)
+    db.close()
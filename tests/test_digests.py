@@ -0,0 +1,92 @@
+import asyncio
+import datetime
+import json
+
+import digests as digests_modul
+from digests import Digests, digest_text, kind_perioden, periode_von, vorherige_perioden, zeitraum
+from fakes import FakeDB, FakeLLM
+
+
+def digest(n):
+    return json.dumps({"themen": [f"Digest {n}"], "stimmung": "gut"})
+
+
+def turn(tag, text):
+    return {"user_id": "1", "user_input": text, "ai_response": "Antwort", "ai_prompt": "", "timestamp": f"{tag}T09:00:00Z"}
+
+
+def test_perioden():
+    tag = datetime.date(2026, 2, 14)
+    assert [periode_von(e, tag) for e in ("tag", "monat", "quartal", "jahr")] == ["2026-02-14", "2026-02", "2026-Q1", "2026"]
+    assert zeitraum("monat", "2026-02") == (datetime.date(2026, 2, 1), datetime.date(2026, 2, 28))
+    assert kind_perioden("quartal", "2026-Q4") == ("monat", ["2026-10", "2026-11", "2026-12"])
+    assert kind_perioden("jahr", "2025")[1] == ["2025-Q1", "2025-Q2", "2025-Q3", "2025-Q4"]
+    assert vorherige_perioden("quartal", "2026-Q1", 2) == ["2025-Q3", "2025-Q4"]
+
+
+def test_tage_einmal_verdichten_und_monat_aus_tagen(monkeypatch):
+    monkeypatch.setattr(digests_modul, "_heute", lambda: datetime.date(2026, 10, 18))
+    db = FakeDB(conversation_history=[turn("2026-09-02", "Bewerbung abgeschickt"), turn("2026-09-03", "Lauftraining")])
+    llm = FakeLLM(digest)
+    d = Digests(db, llm)
+
+    tage = asyncio.run(d.perioden("1", "tag", ["2026-09-01", "2026-09-02", "2026-09-03"]))
+    assert sorted(tage) == ["2026-09-02", "2026-09-03"]
+    assert len(llm.prompts) == 2
+    # Auch der leere Tag ist gespeichert und wird nicht erneut gelesen
+    assert len([r for r in db.tabellen["digests"] if r["ebene"] == "tag"]) == 3
+
+    monat = asyncio.run(d.perioden("1", "monat", ["2026-09"]))
+    assert list(monat) == ["2026-09"]
+    # Die zwei bekannten Tage aus dem Speicher, die restlichen 28 ohne Turns: nur der Monats-Aufruf kommt hinzu
+    assert len(llm.prompts) == 3
+    assert "2026-09-02: Themen: Digest 1" in llm.prompts[-1]
+    # Turns (seitenweise) nur einmal pro Bau gelesen
+    assert len([q for q in db.abfragen if q.tabelle == "conversation_history" and q.bereich]) == 2
+
+    asyncio.run(d.perioden("1", "monat", ["2026-09"]))
+    assert len(llm.prompts) == 3
+
+
+def test_fehler_werden_nicht_gespeichert(monkeypatch):
+    monkeypatch.setattr(digests_modul, "_heute", lambda: datetime.date(2026, 10, 18))
+    db = FakeDB(conversation_history=[turn("2026-09-02", "Bewerbung abgeschickt")])
+    d = Digests(db, FakeLLM(fehler=RuntimeError("Timeout")))
+
+    assert asyncio.run(d.perioden("1", "monat", ["2026-09"])) == {}
+    gespeichert = {(r["ebene"], r["periode"]) for r in db.tabellen["digests"]}
+    assert ("tag", "2026-09-02") not in gespeichert
+    assert ("monat", "2026-09") not in gespeichert
+    # Die übrigen (leeren) Tage sind fertig und bleiben gespeichert
+    assert ("tag", "2026-09-01") in gespeichert
+
+
+def test_monat_ohne_historie_aus_dem_monatsbericht(monkeypatch):
+    monkeypatch.setattr(digests_modul, "_heute", lambda: datetime.date(2026, 10, 18))
+    # Der Cleanup hat alles vor dem 1.10. gelöscht; vom August gibt es nur noch den Monatsrückblick
+    db = FakeDB(
+        conversation_history=[turn("2026-10-05", "Neuer Trainingsplan")],
+        long_term_memory=[
+            {"user_id": "1", "thema": "Monatsrückblick", "inhalt": "Juli: Umzug", "timestamp": "2026-08-01T03:00:00Z"},
+            {"user_id": "1", "thema": "Monatsrückblick", "inhalt": "August: Halbmarathon gelaufen", "timestamp": "2026-09-01T03:00:00Z"},
+            {"user_id": "1", "thema": "Wochenrückblick", "inhalt": "Woche", "timestamp": "2026-09-02T03:00:00Z"},
+        ],
+    )
+    llm = FakeLLM(digest)
+    d = Digests(db, llm)
+
+    quartal = asyncio.run(d.perioden("1", "quartal", ["2026-Q3"]))
+    assert "Digest" in digest_text(quartal)
+    # Juli und August aus ihren Berichten, der September ist unbekannt; danach der Quartals-Digest
+    assert len(llm.prompts) == 3
+    assert {"Juli: Umzug", "August: Halbmarathon gelaufen"} <= {p.split("\n\n")[-1] for p in llm.prompts}
+    gespeichert = {(r["ebene"], r["periode"]) for r in db.tabellen["digests"]}
+    assert {("monat", "2026-07"), ("monat", "2026-08")} <= gespeichert
+    # Weder leere Tage noch der unvollständige September bzw. das Quartal werden festgeschrieben
+    assert not [e for e, _ in gespeichert if e == "tag"]
+    assert ("monat", "2026-09") not in gespeichert and ("quartal", "2026-Q3") not in gespeichert
+
+    # August kommt jetzt aus dem Speicher, der Oktober (mit Turns) wie bisher aus den Tagen
+    monate = asyncio.run(d.perioden("1", "monat", ["2026-08", "2026-10"]))
+    assert list(monate) == ["2026-08", "2026-10"]
+    assert len(llm.prompts) == 5 and "Neuer Trainingsplan" in llm.prompts[3]
@@ -0,0 +1,157 @@
+import asyncio
+import datetime
+
+import entry_questions
+from entry_questions import Einstiegsfragen, aktueller_stand, neuartige_frage, quellen_fuer_modus
+from fakes import FakeDB, FakeLLM
+
+
+def test_vorbereitete_frage_wird_einmal_und_nur_frisch_ausgeliefert():
+    db = FakeDB(todos=[{"id": 1, "user_id": "1", "status": "open", "due_date": "2026-10-20"}])
+    erzeugt = []
+
+    async def erzeugen(user_id):
+        erzeugt.append(user_id)
+        return f"Frage {len(erzeugt)}", "normal"
+
+    async def run():
+        fragen = Einstiegsfragen(db, erzeugen, idle_sekunden=0.01)
+        assert await fragen.abholen("1") is None
+
+        await fragen.vorbereiten("1")
+        assert (await fragen.abholen("1"))["frage"] == "Frage 1"
+        assert await fragen.abholen("1") is None  # verbraucht
+
+        # Geänderte To-Dos machen die vorbereitete Frage ungültig
+        await fragen.vorbereiten("1")
+        db.tabellen["todos"].append({"id": 2, "user_id": "1", "status": "open", "due_date": None})
+        assert await fragen.abholen("1") is None
+
+        # Nach einem Chat-Turn wird erst nach der Ruhezeit neu erzeugt, mehrere Turns nur einmal
+        fragen.nach_turn("1")
+        fragen.nach_turn("1")
+        await asyncio.sleep(0.05)
+        await fragen.beenden()
+
+    asyncio.run(run())
+    assert len(erzeugt) == 3
+    assert [r["frage"] for r in db.tabellen["entry_questions"]] == ["Frage 3"]
+
+
+def test_neuer_tag_macht_frage_nur_bei_faelligkeiten_ungueltig(monkeypatch):
+    jetzt = [datetime.datetime(2026, 10, 18, 21)]  # Sonntag
+
+    class Uhr(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return jetzt[0]
+
+    monkeypatch.setattr(entry_questions.datetime, "datetime", Uhr)
+    db = FakeDB(todos=[
+        {"id": 1, "user_id": "1", "status": "open", "due_date": "2026-10-25"},
+        {"id": 2, "user_id": "1", "status": "open", "is_recurring": True, "recurrence_weekday": "Tuesday"},
+    ])
+
+    async def stand():
+        return await aktueller_stand(db, "1")
+
+    async def run():
+        abends = await stand()
+        # Am nächsten Morgen hat sich nichts für die Frage Relevantes geändert
+        jetzt[0] = datetime.datetime(2026, 10, 19, 7)
+        assert await stand() == abends
+        # Dienstag steht die Routine an
+        jetzt[0] = datetime.datetime(2026, 10, 20, 7)
+        dienstag = await stand()
+        assert dienstag != abends
+        # Erst überfällig zu werden ändert den Stand wieder
+        jetzt[0] = datetime.datetime(2026, 10, 24, 7)
+        samstag = await stand()
+        jetzt[0] = datetime.datetime(2026, 10, 26, 7)
+        assert await stand() != samstag
+
+    asyncio.run(run())
+
+
+class FakeIndex:
+    def hat_eintraege(self, user_id, quellen=None):
+        return True
+
+    def max_aehnlichkeit(self, user_id, vektoren, quellen=None):
+        return [v[0] for v in vektoren]
+
+
+def test_zu_aehnliche_frage_wird_durch_neuartigsten_kandidaten_ersetzt():
+    bekannt = {"Wie läuft das Training?": 0.97, "Was trainierst du gerade?": 0.9, "Was hat dich diese Woche überrascht?": 0.3}
+    # Erste Komponente = "Ähnlichkeit" zu früheren Fragen
+    index, llm = FakeIndex(), FakeLLM(vektor=lambda t: [bekannt.get(t, 0.1)])
+    angefragt = []
+
+    async def weitere(n):
+        angefragt.append(n)
+        return ["Was trainierst du gerade?", "Was hat dich diese Woche überrascht?"]
+
+    async def run():
+        neu = await neuartige_frage(index, llm, "1", "Worauf freust du dich?", weitere)
+        ersetzt = await neuartige_frage(index, llm, "1", "Wie läuft das Training?", weitere)
+        return neu, ersetzt
+
+    neu, ersetzt = asyncio.run(run())
+    assert neu == "Worauf freust du dich?"
+    assert ersetzt == "Was hat dich diese Woche überrascht?"
+    assert angefragt == [3]
+
+
+def _gelesen(db):
+    return sorted(q.tabelle for q in db.abfragen)
+
+
+def test_quellen_nur_fuer_den_gewaehlten_modus():
+    db = FakeDB(
+        goals=[{"user_id": "1", "titel": "Marathon", "status": "offen"}],
+        profile=[{"user_id": "1", "attribute_name": "Beruf", "attribute_value": "Lehrer", "archived": False}],
+        long_term_memory=[{"user_id": "1", "thema": "Laufen", "inhalt": "Halbmarathon", "timestamp": "2026-10-01"}],
+    )
+    mode, geladen = asyncio.run(quellen_fuer_modus(db, "1", "ziel_check"))
+    assert mode == "ziel_check" and list(geladen) == ["ziele"] and geladen["ziele"][0]["titel"] == "Marathon"
+    assert _gelesen(db) == ["goals"]
+
+    db.abfragen.clear()
+    assert asyncio.run(quellen_fuer_modus(db, "1", "todo_followup")) == ("todo_followup", {})
+    assert db.abfragen == []
+
+    # insight mit Erkenntnissen bleibt insight, Berichte werden nicht gelesen
+    mode, geladen = asyncio.run(quellen_fuer_modus(db, "1", "insight"))
+    assert mode == "insight" and [e["thema"] for e in geladen["insights"]] == ["Laufen"]
+    assert _gelesen(db) == ["long_term_memory"]
+
+
+def test_insight_faellt_auf_rueckblick_und_normal_zurueck():
+    berichte = [
+        {"user_id": "1", "thema": "Wochenrückblick", "inhalt": "Woche", "timestamp": "2026-10-12"},
+        {"user_id": "1", "thema": "Jahresrückblick", "inhalt": "Jahr", "timestamp": "2026-01-01"},
+    ]
+    # Nur Berichte, keine Erkenntnisse: insight -> rueckblick
+    db = FakeDB(long_term_memory=list(berichte))
+    mode, geladen = asyncio.run(quellen_fuer_modus(db, "1", "insight"))
+    assert mode == "rueckblick"
+    assert geladen["insights"] == [] and [r["thema"] for r in geladen["rueckblicke"]] == ["Wochenrückblick", "Jahresrückblick"]
+    assert len(db.abfragen) == 1 + 3
+
+    # Gar nichts: insight -> rueckblick -> normal, mit den Quellen von normal
+    db = FakeDB(
+        goals=[{"user_id": "1", "titel": "Marathon", "status": "offen"}],
+        profile=[{"user_id": "1", "attribute_name": "Beruf", "attribute_value": "Lehrer", "archived": False},
+                 {"user_id": "1", "attribute_name": "Wohnort", "attribute_value": "Köln", "archived": True}],
+    )
+    mode, geladen = asyncio.run(quellen_fuer_modus(db, "1", "insight"))
+    assert mode == "normal"
+    assert sorted(geladen) == ["insights", "monatsberichte", "profil", "rueckblicke", "wochenberichte", "ziele"]
+    assert [p["attribute_name"] for p in geladen["profil"]] == ["Beruf"]
+    assert geladen["monatsberichte"] == geladen["wochenberichte"] == []
+    assert len(db.abfragen) == 1 + 3 + 4
+
+    # rueckblick mit Berichten bleibt rueckblick
+    db = FakeDB(long_term_memory=list(berichte))
+    assert asyncio.run(quellen_fuer_modus(db, "1", "rueckblick"))[0] == "rueckblick"
+    assert _gelesen(db) == ["long_term_memory"] * 3
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from idempotency import Idempotenz, IdempotenzKonflikt
+
+
+def test_duplikate_haengen_sich_an_und_werden_wiederholt():
+    aufrufe = []
+
+    async def anfrage():
+        aufrufe.append(1)
+        await asyncio.sleep(0.05)
+        return {"response": "ok", "nr": len(aufrufe)}
+
+    async def run():
+        idem = Idempotenz(ttl=60)
+        gleichzeitig = await asyncio.gather(*[idem.ausfuehren("chat:1:a", "fp", anfrage) for _ in range(3)])
+        spaeter = await idem.ausfuehren("chat:1:a", "fp", anfrage)
+        anderer_key = await idem.ausfuehren("chat:1:b", "fp", anfrage)
+        with pytest.raises(IdempotenzKonflikt):
+            await idem.ausfuehren("chat:1:a", "anderer-fp", anfrage)
+        return gleichzeitig, spaeter, anderer_key
+
+    gleichzeitig, spaeter, anderer_key = asyncio.run(run())
+    assert gleichzeitig == [{"response": "ok", "nr": 1}] * 3
+    assert spaeter == {"response": "ok", "nr": 1}
+    assert anderer_key["nr"] == 2
+    assert len(aufrufe) == 2
+
+
+def test_fehler_werden_nicht_gespeichert():
+    versuche = []
+
+    async def anfrage():
+        versuche.append(1)
+        if len(versuche) == 1:
+            raise RuntimeError("LLM nicht erreichbar")
+        return "ok"
+
+    async def run():
+        idem = Idempotenz(ttl=60)
+        with pytest.raises(RuntimeError):
+            await idem.ausfuehren("todo:1:x", "fp", anfrage)
+        return await idem.ausfuehren("todo:1:x", "fp", anfrage)
+
+    assert asyncio.run(run()) == "ok"
+    assert len(versuche) == 2
+
+
+def test_ttl_abgelaufen_fuehrt_neu_aus():
+    async def run():
+        idem = Idempotenz(ttl=0)
+        zaehler = []
+
+        async def anfrage():
+            zaehler.append(1)
+            return len(zaehler)
+
+        await idem.ausfuehren("k", "fp", anfrage)
+        await asyncio.sleep(0.01)
+        return await idem.ausfuehren("k", "fp", anfrage)
+
+    assert asyncio.run(run()) == 2
+
+
+def test_nie_zurueckgemeldete_beanspruchung_verfaellt():
+    async def run():
+        idem = Idempotenz(ttl=0)
+        # Stream bricht vor dem ersten Event ab: weder abschliessen() noch fehlgeschlagen()
+        assert idem.beanspruchen("chat:1:a", "fp") is None
+        await asyncio.sleep(0.01)
+        # Die Wiederholung hängt nicht, sondern läuft neu
+        assert idem.beanspruchen("chat:1:a", "fp") is None
+        # Doppeltes Freigeben (Stream-Ende und BackgroundTask) ist harmlos
+        idem.fehlgeschlagen("chat:1:a", RuntimeError("abgebrochen"))
+        idem.fehlgeschlagen("chat:1:a", RuntimeError("abgebrochen"))
+        assert idem.beanspruchen("chat:1:a", "fp") is None
+
+    asyncio.run(run())
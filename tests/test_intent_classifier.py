@@ -0,0 +1,49 @@
+from intent_classifier import IntentClassifier, NGramModell
+
+
+BEISPIELE = [
+    ("ich will jeden montag joggen", "routine"), ("erstelle eine routine für dienstags", "routine"),
+    ("jeden freitag staubsaugen als routine", "routine"), ("ich möchte täglich meditieren", "routine"),
+    ("lösch das todo einkaufen", "todo_delete"), ("entferne die aufgabe steuer", "todo_delete"),
+    ("ich muss bis freitag die steuer machen", "todo"), ("leg ein todo an für den arzt", "todo"),
+    ("hallo wie gehts", "chat"), ("mir geht es heute gut", "chat"), ("danke war ein schöner tag", "chat"),
+] * 5
+
+
+def test_regeln_und_kontext():
+    c = IntentClassifier()
+    assert c.schnell("Ok danke, war ein guter Tag").intent == "chat"
+    # Ohne Modell schreibt keine Regel allein
+    assert c.schnell("Ich will jeden Montag joggen gehen") is None
+    assert c.schnell("Lösch das To-Do bitte") is None
+    # Beschreibung ohne Absicht ist keine Routine, aber auch kein sicherer Chat
+    assert c.schnell("Ich mache jeden Sonntag Yoga") is None
+    # Antwort auf eine Rückfrage zur Routine entscheidet das LLM
+    assert c.schnell("Dienstag", "An welchem Wochentag soll 'Sport' stattfinden?") is None
+
+
+def test_schreibende_intents_nur_wenn_regel_und_modell_uebereinstimmen():
+    c = IntentClassifier(NGramModell.trainiere(BEISPIELE), schwelle=0.6)
+    assert c.schnell("Ich will jeden Montag joggen gehen").intent == "routine"
+    assert c.schnell("Lösch das To-Do einkaufen").intent == "todo_delete"
+    assert c.schnell("Ich muss bis Freitag die Steuer machen").intent == "todo"
+    # Lose Regeltreffer ohne echtes Anliegen, Profiländerungen und Mehrfach-Anliegen gehen ans LLM
+    for text in [
+        "Ich will jeden Tag glücklicher sein",
+        "ich möchte täglich weniger am Handy sein",
+        "Entferne Kolumbien aus meinem Profil",
+        "Mein Halbmarathon ist vorbei, ich will jetzt jeden Sonntag laufen",
+    ]:
+        assert c.schnell(text) is None, text
+
+
+def test_modell_training_und_speichern(tmp_path):
+    beispiele = [
+        ("hallo wie gehts", "chat"), ("mir geht es heute gut", "chat"),
+        ("neues todo arzt", "todo"), ("todo steuererklärung", "todo"),
+    ] * 5
+    pfad = tmp_path / "modell.json"
+    NGramModell.trainiere(beispiele).speichere(str(pfad))
+    c = IntentClassifier.aus_datei(str(pfad), schwelle=0.6)
+    assert c.modell.vorhersagen("wie gehts dir")[0] == "chat"
+    assert c.modell.vorhersagen("todo für den arzt")[0] == "todo"
@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+from llm_cache import LLMCache
+from llm_gateway import LLMGateway
+from metrics import metrics
+
+
+class FakeCompletions:
+    async def create(self, **kwargs):
+        usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=20, prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=usage)
+
+
+class FakeClient:
+    chat = SimpleNamespace(completions=FakeCompletions())
+
+
+def test_cached_tokens_werden_erfasst():
+    gateway = LLMGateway(api_key="x", client=FakeClient())
+    response = asyncio.run(gateway.complete(model="gpt-4o", messages=[], tag="test_cache"))
+    assert response.choices[0].message.content == "ok"
+    assert metrics.get("llm.test_cache.prompt_tokens") == 1200
+    assert metrics.get("llm.test_cache.cached_tokens") == 1024
+    assert metrics.rate("llm.test_cache.cached_tokens", "llm.test_cache.prompt_tokens") == round(1024 / 1200, 4)
+
+
+class ZaehlendeCompletions:
+    def __init__(self):
+        self.aufrufe = 0
+
+    async def create(self, **kwargs):
+        self.aufrufe += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='{"intent": "todo_delete"}'), finish_reason="stop")], usage=None)
+
+
+def test_ergebnis_cache_fuer_temperature_0(tmp_path):
+    pfad = str(tmp_path / "llm_cache.sqlite")
+    completions = ZaehlendeCompletions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    anfrage = dict(model="gpt-4o-mini", temperature=0, tag="test_llm_cache", cache=True)
+
+    async def run():
+        gateway = LLMGateway(api_key="x", client=client, cache=LLMCache(pfad=pfad))
+        erste = await gateway.complete(messages=[{"role": "user", "content": "lösch das"}], **anfrage)
+        # Gleiche Anfrage bis auf Leerzeichen -> Treffer ohne API-Aufruf
+        zweite = await gateway.complete(messages=[{"role": "user", "content": "lösch  das "}], **anfrage)
+        # Andere Groß-/Kleinschreibung ist eine andere Anfrage
+        await gateway.complete(messages=[{"role": "user", "content": "Lösch das"}], **anfrage)
+        # Ohne temperature=0 wird nie aus dem Cache beantwortet
+        await gateway.complete(messages=[{"role": "user", "content": "lösch das"}], **{**anfrage, "temperature": 0.7})
+        # Neuer Prozess: Treffer aus der Datei
+        neu = LLMGateway(api_key="x", client=client, cache=LLMCache(pfad=pfad))
+        await neu.complete(messages=[{"role": "user", "content": "lösch das"}], **anfrage)
+        return erste, zweite
+
+    erste, zweite = asyncio.run(run())
+    assert erste.choices[0].message.content == zweite.choices[0].message.content
+    assert completions.aufrufe == 3
+    assert metrics.get("llm_cache.test_llm_cache.hit") == 2
+    assert metrics.get("llm_cache.test_llm_cache.hit_disk") == 1
+    assert metrics.get("llm_cache.test_llm_cache.miss") == 2
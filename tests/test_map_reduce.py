@@ -0,0 +1,56 @@
+import asyncio
+
+from fakes import FakeDB
+from map_reduce import abschnitte, map_reduce, zeilen_seitenweise
+
+
+async def als_strom(texte):
+    for text in texte:
+        yield text
+
+
+def formatieren(rows):
+    return "\n".join(r["text"] for r in rows)
+
+
+def test_seitenweise_lesen_und_abschnitte_bilden():
+    db = FakeDB(texte=[{"text": "x" * 40} for _ in range(25)])  # je ~10 Tokens
+
+    async def run():
+        zeilen = zeilen_seitenweise(db, lambda: db.table("texte").select("text"), seitengroesse=10)
+        return [t async for t in abschnitte(zeilen, formatieren, max_tokens=100)]
+
+    teile = asyncio.run(run())
+    assert [q.bereich for q in db.abfragen] == [(0, 9), (10, 19), (20, 29)]
+    assert [t.count("\n") + 1 for t in teile] == [10, 10, 5]
+
+
+def test_map_parallel_begrenzt_und_stufenweise_reduziert():
+    laufend, max_laufend, reduce_eingaben = [0], [0], []
+
+    async def zusammenfassen(text):
+        laufend[0] += 1
+        max_laufend[0] = max(max_laufend[0], laufend[0])
+        await asyncio.sleep(0.01)
+        laufend[0] -= 1
+        return "s" * 200  # ~50 Tokens
+
+    async def zusammenfuehren(text):
+        reduce_eingaben.append(text)
+        return "r" * 200
+
+    teile = als_strom([f"Teil {i}" for i in range(8)])
+    ergebnis = asyncio.run(map_reduce(teile, zusammenfassen, zusammenfuehren, max_tokens=120, parallel=3))
+
+    assert ergebnis == "r" * 200
+    assert max_laufend[0] == 3
+    # 8 Teilzusammenfassungen passen nicht in einen Aufruf: 4 Gruppen, dann 2, dann die letzte Zusammenführung
+    assert len(reduce_eingaben) == 4 + 2 + 1
+
+
+def test_kurzer_zeitraum_bleibt_unveraendert():
+    async def nie(text):
+        raise AssertionError("kein LLM-Aufruf erwartet")
+
+    assert asyncio.run(map_reduce(als_strom(["kurz"]), nie, nie, direkt_bis_tokens=10)) == "kurz"
+    assert asyncio.run(map_reduce(als_strom([]), nie, nie)) == ""
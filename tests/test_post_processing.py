@@ -0,0 +1,27 @@
+import asyncio
+
+from post_processing import PostProcessor
+
+
+def test_failing_task_does_not_affect_others():
+    async def run():
+        pp = PostProcessor(max_concurrency=1)
+
+        async def boom():
+            raise RuntimeError("kaputt")
+
+        async def suggest():
+            pp.set_suggestion("1", {"titel": "Arzt anrufen"})
+
+        pp.submit("1", "boom", boom())
+        pp.submit("1", "suggest", suggest())
+        assert pp.is_pending("1")
+        assert pp.is_pending("1", "suggest")
+        assert not pp.is_pending("1", "commitment_check")
+        await pp.drain()
+        return pp
+
+    pp = asyncio.run(run())
+    assert not pp.is_pending("1")
+    assert pp.pop_suggestion("1") == {"titel": "Arzt anrufen"}
+    assert pp.pop_suggestion("1") is None
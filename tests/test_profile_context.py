@@ -0,0 +1,54 @@
+import asyncio
+
+from fakes import FakeDB
+from profile_context import ProfilCache, relevante_attribute
+
+
+def zeile(name, wert, archived=False):
+    return {"user_id": "1", "attribute_name": name, "attribute_value": wert, "archived": archived}
+
+
+def test_relevante_attribute_nach_schluessel_und_wert():
+    profil = {
+        "Halbmarathon_Köln_2023": "Oktober 2023, Training 3 Monate",
+        "Beruf": "Ingenieurin bei einem Autozulieferer",
+        "Familie": "zwei Kinder",
+        "Sport": "Laufen dreimal pro Woche",
+    }
+    treffer = relevante_attribute(profil, ["Wie lief das Lauftraining?", "Ich war heute wieder laufen, Köln war toll"])
+    assert list(treffer) == ["Halbmarathon_Köln_2023", "Sport"]
+    assert relevante_attribute(profil, ["Das habe ich heute nicht geschafft"]) == {}
+    assert len(relevante_attribute(profil, ["Köln Laufen Beruf Familie"], max_anzahl=2)) == 2
+
+
+def test_cache_liest_nur_einmal_und_fuehrt_schreibzugriffe_nach():
+    db = FakeDB(profile=[zeile("Beruf", "Ingenieurin"), zeile("Reise_Kolumbien", "geplant"), zeile("Alt", "x", archived=True)])
+    cache = ProfilCache(db, ttl=60)
+
+    async def run():
+        erstes = await cache.laden("1")
+        version = cache.version("1")
+        assert erstes == {"Beruf": "Ingenieurin", "Reise_Kolumbien": "geplant"}
+        assert await cache.laden("1") == erstes and len(db.abfragen) == 1
+
+        cache.aktualisieren("1", {"Sport": "Laufen"}, archiviert=["Reise_Kolumbien"])
+        assert await cache.laden("1") == {"Beruf": "Ingenieurin", "Sport": "Laufen"}
+        assert cache.version("1") != version and len(db.abfragen) == 1
+
+        cache.verwerfen("1")
+        await cache.laden("1")
+        assert len(db.abfragen) == 2 and cache.version("1") == version
+
+    asyncio.run(run())
+
+
+def test_abgelaufener_cache_liest_neu():
+    db = FakeDB(profile=[zeile("Beruf", "Ingenieurin")])
+    cache = ProfilCache(db, ttl=-1)
+
+    async def run():
+        await cache.laden("1")
+        await cache.laden("1")
+
+    asyncio.run(run())
+    assert len(db.abfragen) == 2
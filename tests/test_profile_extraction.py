@@ -0,0 +1,53 @@
+import asyncio
+
+from profile_extraction import ProfilExtraktion, hat_profil_fakten
+
+
+def test_lokaler_filter():
+    assert hat_profil_fakten("Ich arbeite seit März bei Siemens")
+    assert hat_profil_fakten("Meine Schwester heiratet")
+    assert hat_profil_fakten("Termin ist am 12.")
+    assert hat_profil_fakten("das war mit Anna super")
+    assert not hat_profil_fakten("ja klingt gut, mache ich")
+    assert not hat_profil_fakten("okay danke dir")
+    assert not hat_profil_fakten("Super, danke für den Tipp!")
+    # Fakten ohne festes Muster dürfen nicht herausfallen
+    for text in [
+        "Hab heute gekündigt, endlich frei von dem Laden",
+        "Habe mich endlich getrennt, war lange überfällig",
+        "Die Hochzeit ist abgesagt worden leider",
+        "Kolumbien war großartig, bin wieder zu Hause",
+        "Der Halbmarathon lief super, persönliche Bestzeit",
+    ]:
+        assert hat_profil_fakten(text), text
+
+
+def test_extraktion_nach_n_turns_und_nach_pause():
+    aufrufe = []
+
+    async def extrahieren(user_id, austausche):
+        aufrufe.append((user_id, [a["user_input"] for a in austausche]))
+
+    async def run():
+        extraktion = ProfilExtraktion(extrahieren, alle_n=3, idle_sekunden=0.05)
+        for text in ["ok danke", "Ich wohne in Köln", "alles klar"]:
+            extraktion.nach_turn("1", text, "Antwort", "Frage")
+        await asyncio.sleep(0)
+        assert aufrufe == [("1", ["Ich wohne in Köln"])]
+
+        # Nur Füllwörter: nach der Pause kein LLM-Aufruf
+        extraktion.nach_turn("1", "ja genau", "Antwort")
+        await asyncio.sleep(0.1)
+        assert len(aufrufe) == 1
+
+        extraktion.nach_turn("2", "Im Juni ziehe ich um", "Antwort")
+        await asyncio.sleep(0.1)
+        assert aufrufe[-1] == ("2", ["Im Juni ziehe ich um"])
+
+        # Beim Herunterfahren geht nichts verloren
+        extraktion.idle_sekunden = 60
+        extraktion.nach_turn("3", "Ich bin 34", "Antwort")
+        await extraktion.beenden()
+        assert aufrufe[-1] == ("3", ["Ich bin 34"])
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import asyncio
+
+from fakes import FakeDB
+from profile_context import ProfilCache
+from profile_writes import ProfilAenderungen
+
+
+def aktionen(db):
+    return [q.aktion for q in db.abfragen]
+
+
+def zeile(name, wert, archived=False):
+    return {"user_id": "1", "attribute_name": name, "attribute_value": wert, "archived": archived}
+
+
+def test_alle_aenderungen_in_wenigen_roundtrips():
+    db = FakeDB(profile=[
+        zeile("Reise_Kolumbien", "geplant"),
+        zeile("Lauf_Event", "Halbmarathon Köln, geplant"),
+        zeile("Reise_Sambia", "Sambia 2022"),
+        zeile("Beruf", "Student", archived=True),
+    ])
+    aenderungen = ProfilAenderungen("1")
+    aenderungen.setzen("Beruf", "Ingenieurin")
+    aenderungen.setzen("Sport", "Laufen")
+    aenderungen.archivieren("Reise_Kolumbien", ersatz_stichwort="Kolumbien")
+    aenderungen.archivieren("Termin_Halbmarathon", ersatz_stichwort="Halbmarathon")
+    aenderungen.archivieren_passend("sambia")  # Teilstring, Groß-/Kleinschreibung egal
+
+    gesetzt, archiviert = asyncio.run(aenderungen.anwenden(db, ProfilCache(db)))
+
+    assert gesetzt == {"Beruf": "Ingenieurin", "Sport": "Laufen"}
+    assert archiviert == ["Reise_Kolumbien", "Lauf_Event", "Reise_Sambia"]
+    # Profil einmal lesen, danach nur die beiden Schreibzugriffe
+    assert aktionen(db)[0] == "select" and sorted(aktionen(db)[1:]) == ["update", "upsert"]
+    aktiv = {r["attribute_name"]: r["attribute_value"] for r in db.tabellen["profile"] if not r["archived"]}
+    assert aktiv == {"Beruf": "Ingenieurin", "Sport": "Laufen"}
+
+
+def test_nur_setzen_braucht_einen_roundtrip():
+    db = FakeDB()
+    aenderungen = ProfilAenderungen("1")
+    aenderungen.setzen("hobby", "Laufen")
+    asyncio.run(aenderungen.anwenden(db, ProfilCache(db)))
+    assert aktionen(db) == ["upsert"]
+
+
+def test_archivieren_mit_geladenem_profil_liest_nicht_erneut():
+    db = FakeDB(profile=[zeile("Reise_Kolumbien", "geplant")])
+    cache = ProfilCache(db)
+
+    async def run():
+        await cache.laden("1")
+        aenderungen = ProfilAenderungen("1")
+        aenderungen.archivieren_passend("Kolumbien")
+        return await aenderungen.anwenden(db, cache)
+
+    assert asyncio.run(run())[1] == ["Reise_Kolumbien"]
+    assert aktionen(db) == ["select", "update"]
+    assert cache.version("1") is not None
+
+
+def test_kurzes_stichwort_archiviert_keine_aehnlichen_woerter():
+    db = FakeDB(profile=[zeile("Kinderwunsch", "ja"), zeile("Hobby_Kino", "jeden Freitag"), zeile("Partner", "Jonas")])
+    aenderungen = ProfilAenderungen("1")
+    aenderungen.archivieren_passend("Kino")
+    aenderungen.archivieren_passend("Park")
+    assert asyncio.run(aenderungen.anwenden(db, ProfilCache(db)))[1] == ["Hobby_Kino"]
+
+
+def test_aehnliche_woerter_werden_nicht_archiviert():
+    db = FakeDB(profile=[zeile("Hobby", "Freunde treffen"), zeile("Beruf", "Arbeitet als Lehrer"), zeile("Partnerin", "Freundin Lea")])
+    aenderungen = ProfilAenderungen("1")
+    aenderungen.archivieren_passend("Freundin")
+    aenderungen.archivieren_passend("Lehrerin")
+    assert asyncio.run(aenderungen.anwenden(db, ProfilCache(db)))[1] == ["Partnerin"]
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from fakes import FakeDB
+from report_batch import BerichtBatch, Drossel, retry_after
+
+
+def jobs(db):
+    return db.tabellen["report_jobs"]
+
+
+class RateLimit(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0.05"})
+
+
+def test_retry_after():
+    assert retry_after(RateLimit()) == 0.05
+    assert retry_after(RuntimeError("Timeout")) is None
+
+
+def test_drossel_halbiert_und_erholt_sich():
+    async def run():
+        drossel = Drossel(4, pause_sekunden=0.01)
+        drossel.rate_limit(0)
+        assert drossel.grenze == 2
+        for _ in range(2):
+            await drossel.eintreten()
+            drossel.austreten(True)
+        assert drossel.grenze == 3
+
+    asyncio.run(run())
+
+
+def test_alle_nutzer_begrenzt_mit_rate_limit():
+    db = FakeDB()
+    laufend, max_laufend, aufrufe = [0], [0], []
+
+    async def erzeugen(user_id, typ, beginn):
+        aufrufe.append((user_id, typ))
+        laufend[0] += 1
+        max_laufend[0] = max(max_laufend[0], laufend[0])
+        try:
+            await asyncio.sleep(0.005)
+            if aufrufe.count((user_id, typ)) == 1 and user_id == "7":
+                raise RateLimit()
+            return f"{typ} für {user_id}"
+        finally:
+            laufend[0] -= 1
+
+    async def nutzer():
+        return [str(i) for i in range(20)]
+
+    batch = BerichtBatch(db, erzeugen, nutzer, worker=4, retry_sekunden=0.01, max_warten=1)
+    stand = asyncio.run(batch.lauf())
+
+    assert stand["nutzer"] == 20
+    assert max_laufend[0] <= 4
+    # Jeder Bericht von Nutzer 7 lief einmal ins Rate-Limit
+    assert batch.fehler == len([j for j in jobs(db) if j["user_id"] == "7"]) > 0
+    # Das Rate-Limit wurde im selben Lauf nachgeholt
+    assert all(j["status"] == "fertig" for j in jobs(db))
+    assert stand["berichte"] == len(jobs(db))
+    assert stand["nutzer_pro_minute"] > 0
+
+
+def test_unterbrochener_lauf_setzt_fort():
+    db = FakeDB()
+    erzeugt = []
+    haenger = asyncio.Event()
+
+    async def erzeugen(user_id, typ, beginn):
+        if user_id == "3" and not haenger.is_set():
+            haenger.set()
+            await asyncio.sleep(60)
+        erzeugt.append((user_id, typ))
+        return "Bericht"
+
+    async def nutzer():
+        return [str(i) for i in range(6)]
+
+    async def run():
+        erster = asyncio.create_task(BerichtBatch(db, erzeugen, nutzer, worker=2).lauf())
+        await haenger.wait()
+        await asyncio.sleep(0.01)
+        erster.cancel()
+        await asyncio.gather(erster, return_exceptions=True)
+        vorher = len(erzeugt)
+        assert 0 < vorher < len(jobs(db))
+
+        # Der zweite Lauf macht nur den Rest, ohne auf die Reservierung zu warten
+        await BerichtBatch(db, erzeugen, nutzer, worker=2).lauf(planen=False)
+        assert len(erzeugt) == len(jobs(db)) == len(set(erzeugt))
+        assert all(j["status"] == "fertig" for j in jobs(db))
+
+    asyncio.run(run())
@@ -0,0 +1,112 @@
+import asyncio
+import datetime
+
+import report_scheduler
+from fakes import FakeDB
+from report_scheduler import BerichtScheduler, faellige_berichte, im_zeitfenster
+
+
+def jobs(db):
+    return db.tabellen["report_jobs"]
+
+
+def test_faellige_berichte_wie_bisher():
+    # Sonntag, 18.10.2026: Jahr, Quartal (erster Quartalsmonat), Monat und Woche
+    faellig = faellige_berichte(datetime.datetime(2026, 10, 18, 3))
+    assert [(t, p) for t, p, _ in faellig] == [
+        ("Jahresrückblick", "2026"), ("Quartalsbericht", "2026-Q4"), ("Monatsrückblick", "2026-10"), ("Wochenrückblick", "2026-10-18")]
+    # 1. Januar: nur der Wochenbericht (ab Sonntag, 28.12.)
+    assert faellige_berichte(datetime.datetime(2026, 1, 1)) == [("Wochenrückblick", "2025-12-28", datetime.datetime(2025, 12, 28))]
+    assert im_zeitfenster(3, "0-5") and not im_zeitfenster(12, "0-5")
+    assert im_zeitfenster(23, "22-4") and im_zeitfenster(2, "22-4") and not im_zeitfenster(10, "22-4")
+
+
+def test_planen_erzeugen_wiederholen_und_abholen(monkeypatch):
+    jetzt = [datetime.datetime(2026, 11, 10, 2)]
+    monkeypatch.setattr(report_scheduler, "_jetzt", lambda: jetzt[0])
+    db = FakeDB()
+    aufrufe = []
+
+    async def erzeugen(user_id, typ, beginn):
+        aufrufe.append((user_id, typ))
+        if user_id == "2" and len([a for a in aufrufe if a == ("2", typ)]) == 1:
+            raise RuntimeError("Rate limit")
+        return f"{typ} für {user_id}"
+
+    async def nutzer():
+        return ["1", "2"]
+
+    async def run():
+        scheduler = BerichtScheduler(db, erzeugen, nutzer, zeitfenster="0-5", retry_sekunden=60)
+        # Außerhalb des Zeitfensters passiert nichts
+        jetzt[0] = datetime.datetime(2026, 11, 10, 12)
+        await scheduler.durchlauf()
+        assert jobs(db) == []
+
+        jetzt[0] = datetime.datetime(2026, 11, 10, 2)
+        await scheduler.durchlauf()
+        # Jahr, Monat, Woche je Nutzer; Nutzer 2 scheitert beim ersten Versuch
+        assert len(aufrufe) == 6
+        assert [j["status"] for j in jobs(db) if j["user_id"] == "2"] == ["offen"] * 3
+        assert await scheduler.abholen("2") is None
+
+        # Nochmal planen legt keine doppelten Jobs an; nach der Wartezeit wird erneut versucht
+        await scheduler.planen()
+        jetzt[0] += datetime.timedelta(seconds=61)
+        await scheduler.durchlauf()
+        assert len(jobs(db)) == 6 and len(aufrufe) == 9
+        assert all(j["status"] == "fertig" for j in jobs(db))
+
+        # Anzeige: höchste Ebene zuerst, jeder Bericht nur einmal
+        assert await scheduler.abholen("1") == {"typ": "Jahresrückblick", "inhalt": "Jahresrückblick für 1"}
+        assert (await scheduler.abholen("1"))["typ"] == "Monatsrückblick"
+        assert (await scheduler.abholen("1"))["typ"] == "Wochenrückblick"
+        assert await scheduler.abholen("1") is None
+
+    asyncio.run(run())
+
+
+def test_endgueltig_fehlgeschlagen_und_schon_vorhanden(monkeypatch):
+    monkeypatch.setattr(report_scheduler, "_jetzt", lambda: datetime.datetime(2026, 1, 1, 2))
+    db = FakeDB()
+
+    async def erzeugen(user_id, typ, beginn):
+        if user_id == "1":
+            raise RuntimeError("kaputt")
+        return None  # Bericht gab es schon
+
+    async def run():
+        scheduler = BerichtScheduler(db, erzeugen, None, max_versuche=1)
+        await scheduler.planen(["1", "2"])
+        await scheduler.abarbeiten()
+        assert [j["status"] for j in jobs(db)] == ["fehlgeschlagen", "fertig"]
+        assert await scheduler.abholen("2") is None
+
+    asyncio.run(run())
+
+
+def test_ohne_nutzer_je_nutzer_nacheinander_von_unten_nach_oben(monkeypatch):
+    monkeypatch.setattr(report_scheduler, "_jetzt", lambda: datetime.datetime(2026, 10, 18, 3))
+    db = FakeDB()
+    reihenfolge, laufend, max_laufend = [], [0], [0]
+
+    async def erzeugen(user_id, typ, beginn):
+        laufend[0] += 1
+        max_laufend[0] = max(max_laufend[0], laufend[0])
+        await asyncio.sleep(0.01)
+        laufend[0] -= 1
+        reihenfolge.append((user_id, typ))
+        return typ
+
+    async def run():
+        scheduler = BerichtScheduler(db, erzeugen, None, parallel=4)
+        await scheduler.planen(["1", "2"])
+        # Höchste Ebene zuerst angelegt, soll aber zuletzt laufen
+        assert [j["typ"] for j in jobs(db) if j["user_id"] == "1"][0] == "Jahresrückblick"
+        assert await scheduler.abarbeiten() == 8
+
+    asyncio.run(run())
+    for user_id in ["1", "2"]:
+        assert [t for u, t in reihenfolge if u == user_id] == ["Wochenrückblick", "Monatsrückblick", "Quartalsbericht", "Jahresrückblick"]
+    # Pro Nutzer nur ein Bericht zur Zeit, die Nutzer parallel
+    assert max_laufend[0] == 2
@@ -0,0 +1,38 @@
+import asyncio
+
+from fakes import FakeDB, FakeLLM
+from rolling_summary import RollingSummary, woche_von
+
+
+def turn(tag, text):
+    return {"user_id": "1", "user_input": text, "ai_response": "ok", "ai_prompt": "", "timestamp": f"2026-10-{tag}T10:00:00Z"}
+
+
+def test_woche_von():
+    assert woche_von("2026-10-18T10:00:00Z") == "2026-W42"
+    assert woche_von("2027-01-01T00:00:00Z") == "2026-W53"
+
+
+def test_neue_turns_werden_alle_n_turns_eingearbeitet():
+    db, llm = FakeDB(), FakeLLM(lambda n: f"Zusammenfassung {n}")
+    summary = RollingSummary(db, llm, alle_n=2)
+
+    async def run():
+        db.tabellen["conversation_history"] += [turn("12", "Laufen angefangen"), turn("13", "Knie tut weh")]
+        await summary.nach_turn("1")
+        assert llm.prompts == []
+        await summary.nach_turn("1")
+        assert len(llm.prompts) == 1 and "Knie tut weh" in llm.prompts[0]
+
+        # Nur der neue Turn wird eingearbeitet
+        db.tabellen["conversation_history"].append(turn("19", "Wieder schmerzfrei"))
+        await summary.falte("1")
+        assert "Laufen angefangen" not in llm.prompts[1] and "Wieder schmerzfrei" in llm.prompts[1]
+        assert "Noch keine." in llm.prompts[1]  # neue Woche beginnt leer
+
+        db.tabellen["conversation_history"].append(turn("20", "Intervalle geplant"))
+        await summary.falte("1")
+        assert "Zusammenfassung 2" in llm.prompts[2]
+
+    asyncio.run(run())
+    assert [r["turns"] for r in db.tabellen["conversation_summaries"]] == [2, 2]
@@ -0,0 +1,29 @@
+import asyncio
+
+from metrics import metrics
+from speculation import Spekulation
+
+
+def test_nutzen_und_verwerfen():
+    async def run():
+        async def antwort():
+            await asyncio.sleep(0.01)
+            return "Antwort"
+
+        genutzt = Spekulation("test", antwort)
+        genutzt.starten()
+        ergebnis = await genutzt.nutzen()
+
+        verworfen = Spekulation("test", lambda: asyncio.sleep(10))
+        verworfen.starten()
+        await asyncio.sleep(0)
+        verworfen.verwerfen()
+        await asyncio.sleep(0)
+        return ergebnis, verworfen
+
+    ergebnis, verworfen = asyncio.run(run())
+    assert ergebnis == "Antwort"
+    assert verworfen._task.cancelled()
+    assert metrics.get("speculation.test.used") == 1
+    assert metrics.get("speculation.test.wasted") == 1
+    assert metrics.get("speculation.test.wasted_completed") == 0
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+from idempotency import Idempotenz
+from streaming import ChatStreams, sse
+
+FEHLER = "Entschuldige, es gab ein Problem."
+
+
+def _parse(events):
+    """[(event, data)] aus den SSE-Blöcken."""
+    ergebnis = []
+    for block in events:
+        assert block.endswith("\n\n")
+        zeilen = block.strip("\n").split("\n")
+        event = zeilen[0][len("event: "):] if zeilen[0].startswith("event: ") else None
+        ergebnis.append((event, json.loads(zeilen[-1][len("data: "):])))
+    return ergebnis
+
+
+def _antwort(gespeichert, fehler=None):
+    async def erzeugen(senden):
+        for token in ("Hallo ", "Wörld"):
+            await asyncio.sleep(0.01)
+            senden(token)
+        if fehler:
+            raise fehler
+        await asyncio.sleep(0.01)
+        gespeichert.append("Hallo Wörld")
+        return {"response": "Hallo Wörld", "created_todo": False}
+    return erzeugen
+
+
+async def _alle(stream):
+    return [e async for e in stream]
+
+
+def test_sse_format():
+    assert sse({"token": "ä"}) == 'data: {"token": "ä"}\n\n'
+    assert sse({"response": "x"}, event="done") == 'event: done\ndata: {"response": "x"}\n\n'
+
+
+def test_tokens_dann_done_und_duplikat_bekommt_nur_done():
+    gespeichert = []
+
+    async def run():
+        idem = Idempotenz(ttl=60)
+        streams = ChatStreams(idem, FEHLER)
+        assert idem.beanspruchen("chat:1:a", "fp") is None
+        erste = _parse(await _alle(streams.starten("chat:1:a", _antwort(gespeichert))))
+        duplikat = _parse(await _alle(streams.duplikat(idem.beanspruchen("chat:1:a", "fp"))))
+        return erste, duplikat
+
+    erste, duplikat = asyncio.run(run())
+    assert erste == [(None, {"token": "Hallo "}), (None, {"token": "Wörld"}),
+                     ("done", {"response": "Hallo Wörld", "created_todo": False})]
+    assert duplikat == [("done", {"response": "Hallo Wörld", "created_todo": False})]
+    assert gespeichert == ["Hallo Wörld"]
+
+
+def test_duplikat_waehrend_des_streams_wartet_auf_done():
+    async def run():
+        idem = Idempotenz(ttl=60)
+        streams = ChatStreams(idem, FEHLER)
+        idem.beanspruchen("chat:1:a", "fp")
+        erste = streams.starten("chat:1:a", _antwort([]))
+        return await asyncio.gather(_alle(erste), _alle(streams.duplikat(idem.beanspruchen("chat:1:a", "fp"))))
+
+    erste, duplikat = asyncio.run(run())
+    assert _parse(duplikat) == _parse(erste)[-1:]
+
+
+def test_fehler_liefert_error_event_und_gibt_den_key_frei():
+    async def run():
+        idem = Idempotenz(ttl=60)
+        streams = ChatStreams(idem, FEHLER)
+        idem.beanspruchen("chat:1:a", "fp")
+        events = _parse(await _alle(streams.starten("chat:1:a", _antwort([], fehler=RuntimeError("LLM weg")))))
+        # Wiederholung nach einem Fehler läuft neu
+        return events, idem.beanspruchen("chat:1:a", "fp")
+
+    events, vorhanden = asyncio.run(run())
+    assert events[:2] == [(None, {"token": "Hallo "}), (None, {"token": "Wörld"})]
+    assert events[-1] == ("error", {"detail": FEHLER})
+    assert vorhanden is None
+
+
+def test_abbruch_des_clients_speichert_den_turn_trotzdem():
+    gespeichert = []
+
+    async def run():
+        idem = Idempotenz(ttl=60)
+        streams = ChatStreams(idem, FEHLER)
+        idem.beanspruchen("chat:1:a", "fp")
+        stream = streams.starten("chat:1:a", _antwort(gespeichert))
+        # Client liest das erste Token und trennt dann die Verbindung
+        assert await stream.__anext__() == sse({"token": "Hallo "})
+        await stream.aclose()
+        assert gespeichert == []
+        await streams.beenden()
+        # Die Wiederholung bekommt das Ergebnis des abgebrochenen Streams
+        return _parse(await _alle(streams.duplikat(idem.beanspruchen("chat:1:a", "fp"))))
+
+    duplikat = asyncio.run(run())
+    assert gespeichert == ["Hallo Wörld"]
+    assert duplikat == [("done", {"response": "Hallo Wörld", "created_todo": False})]
@@ -0,0 +1,25 @@
+from token_budget import Abschnitt, TokenBudget, kuerze, zaehle_tokens
+
+
+def test_niedrige_prioritaet_wird_zuerst_gekuerzt():
+    historie = "\n".join(f"User: Nachricht {i}" for i in range(50))
+    bericht = "\n".join(f"Absatz {i} " + "x" * 80 for i in range(50))
+    texte = TokenBudget(400).verteile([
+        Abschnitt("historie", historie, prioritaet=100, min_tokens=200),
+        Abschnitt("bericht", bericht, prioritaet=10),
+    ])
+    assert sum(zaehle_tokens(t) for t in texte.values()) <= 400
+    assert texte["historie"].startswith("User: Nachricht 0")
+    # Der Bericht hat niedrigere Priorität und wird stärker gekürzt als die Historie
+    assert zaehle_tokens(texte["bericht"]) < zaehle_tokens(bericht) - (zaehle_tokens(historie) - zaehle_tokens(texte["historie"]))
+
+
+def test_kuerze_behaelt_ende():
+    text = "\n".join(str(i) * 20 for i in range(10))
+    gekuerzt = kuerze(text, 20, behalte="ende")
+    assert gekuerzt.endswith("9" * 20)
+    assert zaehle_tokens(gekuerzt) <= 20
+
+
+def test_innerhalb_budget_unveraendert():
+    assert TokenBudget(1000).verteile([Abschnitt("profil", "- Beruf: Ingenieur", prioritaet=1)]) == {"profil": "- Beruf: Ingenieur"}
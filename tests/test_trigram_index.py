@@ -0,0 +1,47 @@
+from trigram_index import TrigrammIndex, trigramme
+
+
+def test_trigramme_pro_wort():
+    assert trigramme("Job") == {"  j", " jo", "job", "ob "}
+    assert trigramme("Reise_Kolumbien") == trigramme("reise kolumbien")
+
+
+def test_suche_rangiert_und_findet_tippfehler():
+    index = TrigrammIndex({
+        "Reise_Kolumbien": {"name": "Reise Kolumbien", "wert": "2023, abgeschlossen"},
+        "Reise_Sambia": {"name": "Reise Sambia", "wert": "geplant"},
+        "Lauf_Event": {"name": "Lauf Event", "wert": "Halbmarathon Köln"},
+    })
+    treffer = index.suche(["Kolumbein", "reise", "Laufen", ""], felder=["name", "wert"])
+    assert [n for n, _ in treffer["Kolumbein"]] == ["Reise_Kolumbien"]
+    assert [n for n, _ in treffer["reise"]] == ["Reise_Kolumbien", "Reise_Sambia"]
+    assert treffer["reise"][0][1] == 1.0
+    assert treffer["Laufen"] == [] and treffer[""] == []
+    # Nur im Wert suchen
+    assert index.suche(["Sambia"], felder=["wert"])["Sambia"] == []
+
+
+def test_kurze_stichwoerter_nur_exakt_und_wortweise():
+    index = TrigrammIndex({
+        "Kinderwunsch": {"name": "Kinderwunsch", "wert": "ja, in ein paar Jahren"},
+        "Hobby_Ballett": {"name": "Hobby Ballett", "wert": "seit 2020"},
+        "Partner": {"name": "Partner", "wert": "Jonas"},
+        "Lieblingsort": {"name": "Lieblingsort", "wert": "Kinobesuch am Sonntag"},
+    })
+    treffer = index.suche(["Kino", "Bali", "Park"], felder=["name", "wert"])
+    assert [n for n, _ in treffer["Kino"]] == ["Lieblingsort"]
+    assert treffer["Bali"] == [] and treffer["Park"] == []
+    # Trigramme aus verschiedenen Wörtern ergeben zusammen keinen Treffer
+    assert TrigrammIndex({"x": {"wert": "Kolb umbien"}}).suche(["Kolumbien"], felder=["wert"])["Kolumbien"] == []
+
+
+def test_teilstring_wie_ilike_nach_score_sortiert():
+    index = TrigrammIndex({
+        "Hobby": {"name": "Hobby", "wert": "Freunde treffen, Halbmarathonvorbereitung"},
+        "Lauf_Event": {"name": "Lauf Event", "wert": "Halbmarathon Köln"},
+    })
+    treffer = index.teilstring(["halbmarathon", "Freundin", "freunde treffen", ""], felder=["name", "wert"])
+    # Beide enthalten das Stichwort; das ganze Wort rangiert vor dem zusammengesetzten
+    assert treffer["halbmarathon"] == ["Lauf_Event", "Hobby"]
+    assert treffer["Freundin"] == [] and treffer[""] == []
+    assert treffer["freunde treffen"] == ["Hobby"]
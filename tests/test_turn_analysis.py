@@ -0,0 +1,26 @@
+import asyncio
+import json
+
+from fakes import FakeLLM
+from turn_analysis import TURN_ANALYSIS_SCHEMA, analysiere_turn
+
+
+def test_schema_is_strict():
+    assert set(TURN_ANALYSIS_SCHEMA["required"]) == set(TURN_ANALYSIS_SCHEMA["properties"])
+    assert TURN_ANALYSIS_SCHEMA["additionalProperties"] is False
+
+
+def test_analysiere_turn_parses_and_rejects():
+    antwort = {
+        "intent": "todo",
+        "todo": {"title": "Steuer machen", "due_date": "2026-10-30", "priority": "low"},
+        "routine": None,
+        "commitment": None,
+    }
+    llm = FakeLLM(json.dumps(antwort))
+    analyse = asyncio.run(analysiere_turn(llm, "Bis 30.10. Steuer machen"))
+    assert analyse.intent == "todo"
+    assert analyse.todo.title == "Steuer machen"
+    assert llm.kwargs[-1]["response_format"]["json_schema"]["name"] == "turn_analysis"
+
+    assert asyncio.run(analysiere_turn(FakeLLM('{"intent": "unbekannt"}'), "hallo")) is None
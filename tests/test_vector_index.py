@@ -0,0 +1,110 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+from fakes import FakeDB, FakeLLM
+from vector_index import VektorIndex, berichte_nachindexieren, nachindexieren
+
+
+def test_suche_ersetzen_entfernen_und_neu_laden(tmp_path):
+    index = VektorIndex(str(tmp_path), dim=3)
+    index.hinzufuegen(
+        [("memory:1", "1", "gedaechtnis", "Laufen"), ("memory:2", "1", "gedaechtnis", "Finanzen"),
+         ("profil:1:Beruf", "1", "profil", "Beruf: Lehrer"), ("memory:3", "2", "gedaechtnis", "Laufen")],
+        [[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 0]],
+    )
+    treffer = index.suche("1", [0.9, 0.1, 0], k=2)
+    assert [t["key"] for t in treffer] == ["memory:1", "memory:2"]
+    assert index.suche("1", [1, 0, 0], k=5, quellen=["profil"])[0]["text"] == "Beruf: Lehrer"
+
+    # Gleicher Key ersetzt den alten Eintrag, entfernte Keys tauchen nicht mehr auf
+    index.hinzufuegen([("profil:1:Beruf", "1", "profil", "Beruf: Ingenieur")], [[0, 0, 1]])
+    index.entfernen(["memory:2"])
+    assert [t["text"] for t in index.suche("1", [0, 0, 1], k=5, quellen=["profil"])] == ["Beruf: Ingenieur"]
+
+    # Nach dem Neuladen (mit Kompaktierung) bleibt der Stand erhalten
+    neu = VektorIndex(str(tmp_path), dim=3)
+    assert len(neu) == 3
+    assert [t["key"] for t in neu.suche("1", [0, 1, 0.1], k=5)] == ["profil:1:Beruf", "memory:1"]
+    assert not neu.hat_eintraege("3")
+
+
+def test_max_aehnlichkeit_pro_kandidat(tmp_path):
+    index = VektorIndex(str(tmp_path), dim=3)
+    index.hinzufuegen(
+        [("frage:1:a", "1", "einstiegsfrage", "Wie läuft das Training?"), ("memory:1", "1", "gedaechtnis", "Laufen")],
+        [[1, 0, 0], [0, 1, 0]],
+    )
+    werte = index.max_aehnlichkeit("1", [[1, 0, 0], [0, 1, 0], [0, 0, 2]], quellen=["einstiegsfrage"])
+    assert [round(w, 3) for w in werte] == [1.0, 0.0, 0.0]
+    assert index.max_aehnlichkeit("2", [[1, 0, 0]]) == [-1.0]
+    assert index.hat_eintraege("1", quellen=["profil"]) is False
+
+
+def test_nachindexieren_macht_nutzer_vollstaendig(tmp_path):
+    index = VektorIndex(str(tmp_path), dim=3)
+    # Seit dem Deploy ist nur ein neuer Eintrag indexiert: noch nicht vollständig
+    index.hinzufuegen([("memory:2", "1", "gedaechtnis", "neu")], [[0, 1, 0]])
+    assert index.hat_eintraege("1") and not index.vollstaendig("1")
+
+    db = FakeDB(
+        long_term_memory=[{"id": 1, "user_id": "1", "thema": "Laufen", "inhalt": "alt", "timestamp": "2026-01-01"},
+                          {"id": 2, "user_id": "1", "thema": "Laufen", "inhalt": "neu", "timestamp": "2026-10-01"}],
+        profile=[{"user_id": "1", "attribute_name": "Beruf", "attribute_value": "Lehrer", "archived": False}],
+    )
+    llm = FakeLLM()
+    asyncio.run(nachindexieren(index, llm, db, "1"))
+    # Nur die fehlenden Einträge werden eingebettet
+    assert len(llm.texte) == 2
+    assert index.vollstaendig("1") and len(index) == 3
+    assert VektorIndex(str(tmp_path), dim=3).vollstaendig("1")
+
+
+def test_berichte_aus_dem_batch_werden_nachindexiert(tmp_path):
+    index = VektorIndex(str(tmp_path), dim=3)
+    index.hinzufuegen([("memory:1", "1", "bericht", "Wochenrückblick: schon da")], [[1, 0, 0]])
+    db = FakeDB(long_term_memory=[
+        {"id": 1, "user_id": "1", "thema": "Wochenrückblick", "inhalt": "schon da", "timestamp": "2026-10-12T01:00:00Z"},
+        {"id": 2, "user_id": "2", "thema": "Monatsrückblick", "inhalt": "vom Batch", "timestamp": "2026-10-01T02:00:00Z"},
+        {"id": 3, "user_id": "2", "thema": "Laufen", "inhalt": "kein Bericht", "timestamp": "2026-10-02T00:00:00Z"},
+        {"id": 4, "user_id": "1", "thema": "Monatsrückblick", "inhalt": "zu alt", "timestamp": "2026-08-01T02:00:00Z"},
+    ])
+    llm = FakeLLM()
+    assert asyncio.run(berichte_nachindexieren(index, llm, db, "2026-09-30T00:00:00Z")) == 1
+    assert index.enthaelt("memory:2") and not index.enthaelt("memory:3") and not index.enthaelt("memory:4")
+    assert llm.texte == ["[Aufgezeichnet: 2026-10-01] Monatsrückblick: vom Batch"]
+    # Ein zweiter Lauf findet nichts mehr
+    assert asyncio.run(berichte_nachindexieren(index, llm, db, "2026-09-30T00:00:00Z")) == 0
+
+
+def test_zweiter_prozess_auf_demselben_verzeichnis(tmp_path):
+    VektorIndex(str(tmp_path), dim=3)
+    # Ein anderer, noch laufender Prozess (hier: der Elternprozess) als Besitzer
+    (tmp_path / "owner").write_text(f"{socket.gethostname()}:{os.getppid()}")
+    with pytest.raises(RuntimeError):
+        VektorIndex(str(tmp_path), dim=3)
+
+
+def test_abgebrochener_schreibvorgang_verschiebt_keine_vektoren(tmp_path):
+    index = VektorIndex(str(tmp_path), dim=3)
+    index.hinzufuegen([("memory:1", "1", "gedaechtnis", "Laufen")], [[1, 0, 0]])
+    # Absturz nach dem Vektor, vor bzw. mitten in der Metadaten-Zeile
+    with open(tmp_path / "vectors.f32", "ab") as fh:
+        fh.write(bytes(4 * 3 + 5))
+    with open(tmp_path / "meta.jsonl", "a", encoding="utf-8") as fh:
+        fh.write('{"op": "add", "eintrag": {"key": "memo')
+
+    neu = VektorIndex(str(tmp_path), dim=3)
+    assert len(neu) == 1
+    neu.hinzufuegen([("memory:2", "1", "gedaechtnis", "Finanzen")], [[0, 1, 0]])
+    wieder = VektorIndex(str(tmp_path), dim=3)
+    assert [t["key"] for t in wieder.suche("1", [0, 1, 0], k=1)] == ["memory:2"]
+    assert wieder.suche("1", [0, 1, 0], k=1)[0]["score"] > 0.99
+
+
+def test_mehrere_worker_werden_abgelehnt(tmp_path, monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(RuntimeError):
+        VektorIndex(str(tmp_path), dim=3)
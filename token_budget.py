@@ -0,0 +1,100 @@
+"""Token-Budget für die Kontext-Abschnitte der Prompts.
+
+Jeder Abschnitt (Profil, Historie, Berichte, ...) wird gezählt. Übersteigt die
+Summe das Budget, werden die Abschnitte mit der niedrigsten Priorität zuerst
+zeilenweise gekürzt, höchstens bis auf ihr Minimum. Die Aufteilung pro
+Abschnitt wird bei jedem Aufruf protokolliert.
+
+Zählt mit tiktoken, falls installiert, sonst mit einer Schätzung (~4 Zeichen pro Token).
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # tiktoken fehlt oder Encoding nicht verfügbar
+    _ENCODING = None
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+START_CONTEXT_TOKEN_BUDGET = int(os.getenv("START_CONTEXT_TOKEN_BUDGET", "4000"))
+
+KUERZUNGS_HINWEIS = "[…gekürzt]"
+
+
+def zaehle_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class Abschnitt:
+    name: str
+    text: str
+    prioritaet: int  # höher = wichtiger, wird zuletzt gekürzt
+    min_tokens: int = 0
+    behalte: str = "anfang"  # "anfang": erste Zeilen behalten, "ende": letzte Zeilen behalten
+
+
+def kuerze(text: str, max_tokens: int, behalte: str = "anfang") -> str:
+    """Kürzt zeilenweise auf max_tokens; eine einzelne zu lange Zeile wird abgeschnitten."""
+    if zaehle_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    zeilen = text.split("\n")
+    if behalte == "ende":
+        zeilen.reverse()
+    rest = max_tokens - zaehle_tokens(KUERZUNGS_HINWEIS)
+    behalten: List[str] = []
+    for zeile in zeilen:
+        t = zaehle_tokens(zeile) + 1
+        if t > rest:
+            anteil = int(len(zeile) * rest / t)
+            if not behalten and anteil > 0:
+                # Nicht einmal die erste Zeile passt: anteilig abschneiden
+                behalten.append(zeile[:anteil] if behalte == "anfang" else zeile[-anteil:])
+            break
+        behalten.append(zeile)
+        rest -= t
+    if behalte == "ende":
+        behalten.reverse()
+        return "\n".join([KUERZUNGS_HINWEIS] + behalten)
+    return "\n".join(behalten + [KUERZUNGS_HINWEIS])
+
+
+class TokenBudget:
+    def __init__(self, budget: int):
+        self.budget = budget
+
+    def verteile(self, abschnitte: List[Abschnitt], protokoll: str = "") -> Dict[str, str]:
+        """Gibt die (ggf. gekürzten) Texte pro Abschnitt zurück und protokolliert die Token-Aufteilung."""
+        texte = {a.name: a.text for a in abschnitte}
+        tokens = {a.name: zaehle_tokens(a.text) for a in abschnitte}
+        vorher = dict(tokens)
+        ueberschuss = sum(tokens.values()) - self.budget
+
+        for a in sorted(abschnitte, key=lambda a: a.prioritaet):
+            if ueberschuss <= 0:
+                break
+            kuerzbar = tokens[a.name] - a.min_tokens
+            if kuerzbar <= 0:
+                continue
+            ziel = tokens[a.name] - min(kuerzbar, ueberschuss)
+            texte[a.name] = kuerze(a.text, ziel, a.behalte)
+            neu = zaehle_tokens(texte[a.name])
+            ueberschuss -= tokens[a.name] - neu
+            tokens[a.name] = neu
+
+        if protokoll:
+            aufteilung = ", ".join(
+                f"{name} {tokens[name]}" + (f" (von {vorher[name]})" if tokens[name] != vorher[name] else "")
+                for name in texte
+            )
+            print(f"Token-Budget {protokoll}: {sum(tokens.values())}/{self.budget} – {aufteilung}")
+        return texte
@@ -0,0 +1,125 @@
+"""Trigramm-Index für unscharfe Stichwortsuche in kurzen Texten (Profileinträge).
+
+Jeder Eintrag hat benannte Felder (z.B. "name", "wert"). Der invertierte
+Index bildet jedes Trigramm auf die Wörter der Einträge ab, in denen es
+vorkommt. Eine Suche zählt für alle Stichwörter in einem Durchgang die Treffer
+pro Wort; der Score ist der Anteil der Stichwort-Trigramme, die im jeweils
+ähnlichsten Wort des Feldes vorkommen (1.0 = Stichwort steckt vollständig
+drin, wie bei ilike '%stichwort%', kleine Tippfehler oder Flexionen landen
+knapp darunter). Kurze Stichwörter (bis PROFILE_MATCH_EXACT_MAX_LEN Zeichen)
+müssen exakt vorkommen – bei ihnen reicht schon ein gleicher Wortanfang für
+den Mindest-Score.
+"""
+import os
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+PROFILE_MATCH_MIN_SIMILARITY = float(os.getenv("PROFILE_MATCH_MIN_SIMILARITY", "0.6"))
+# Kurze Stichwörter teilen mit vielen Wörtern den Anfang ("Kino" – "Kinderwunsch"),
+# deshalb bis zu dieser Länge nur exakte Teilstrings wie bei ilike
+PROFILE_MATCH_EXACT_MAX_LEN = int(os.getenv("PROFILE_MATCH_EXACT_MAX_LEN", "5"))
+
+
+def woerter(text: str) -> List[str]:
+    return re.findall(r"[^\W_]+", (text or "").casefold())
+
+
+def _wort_trigramme(wort: str) -> Set[str]:
+    wort = f"  {wort} "
+    return {wort[i:i + 3] for i in range(len(wort) - 2)}
+
+
+def trigramme(text: str) -> Set[str]:
+    """Trigramme pro Wort, vorne mit zwei und hinten mit einem Leerzeichen aufgefüllt (wie pg_trgm)."""
+    ergebnis = set()
+    for wort in woerter(text):
+        ergebnis.update(_wort_trigramme(wort))
+    return ergebnis
+
+
+class TrigrammIndex:
+    def __init__(self, eintraege: Dict[str, Dict[str, str]]):
+        """eintraege: {schluessel: {feld: text}}"""
+        # Trigramm -> (Schlüssel, Wortnummer): Treffer zählen nur innerhalb eines Wortes
+        self._postings: Dict[str, Dict[str, Set[Tuple[str, int]]]] = defaultdict(lambda: defaultdict(set))
+        self._woerter: Dict[str, Dict[str, List[str]]] = defaultdict(dict)
+        for schluessel, felder in eintraege.items():
+            for feld, text in felder.items():
+                self._woerter[feld][schluessel] = woerter(text)
+                for nr, wort in enumerate(self._woerter[feld][schluessel]):
+                    for gramm in _wort_trigramme(wort):
+                        self._postings[feld][gramm].add((schluessel, nr))
+
+    def _exakt(self, feld: str, wort: str) -> Set[str]:
+        """Einträge, in deren Feld `wort` als Teilstring eines Wortes vorkommt."""
+        innen = [wort[i:i + 3] for i in range(len(wort) - 2)]
+        if innen:
+            # Kandidaten über die inneren Trigramme, dann exakt prüfen
+            kandidaten = set.intersection(*(self._postings[feld].get(g, set()) for g in innen))
+        else:
+            kandidaten = {(s, nr) for s, ws in self._woerter[feld].items() for nr in range(len(ws))}
+        return {s for s, nr in kandidaten if wort in self._woerter[feld][s][nr]}
+
+    def _unscharf(self, feld: str, gesucht: Set[str]) -> Dict[str, int]:
+        """Pro Eintrag die meisten gemeinsamen Trigramme mit einem einzelnen Wort des Feldes."""
+        zaehler: Dict[Tuple[str, int], int] = defaultdict(int)
+        for gramm in gesucht:
+            for treffer in self._postings[feld].get(gramm, ()):
+                zaehler[treffer] += 1
+        beste: Dict[str, int] = {}
+        for (schluessel, _), anzahl in zaehler.items():
+            beste[schluessel] = max(beste.get(schluessel, 0), anzahl)
+        return beste
+
+    def teilstring(self, stichwoerter: Iterable[str], felder: Iterable[str]) -> Dict[str, List[str]]:
+        """Pro Stichwort die Einträge, in denen es als Teilstring vorkommt (wie ilike '%stichwort%').
+
+        Sortiert nach dem unscharfen Score; Groß-/Kleinschreibung und Satzzeichen zählen nicht.
+        """
+        felder, stichwoerter = list(felder), list(stichwoerter)
+        scores = self.suche(stichwoerter, felder, min_score=0.0)
+        ergebnis = {}
+        for stichwort in stichwoerter:
+            teile = woerter(stichwort)
+            gesucht = " ".join(teile)
+            treffer = set()
+            for feld in felder:
+                if not teile:
+                    break
+                # Kandidaten: jedes Wort des Stichworts steckt in einem Wort des Feldes
+                kandidaten = set.intersection(*(self._exakt(feld, w) for w in teile))
+                treffer.update(k for k in kandidaten if gesucht in " ".join(self._woerter[feld][k]))
+            rang = dict(scores[stichwort])
+            ergebnis[stichwort] = sorted(treffer, key=lambda k: (-rang.get(k, 0.0), k))
+        return ergebnis
+
+    def suche(self, stichwoerter: Iterable[str], felder: Iterable[str], min_score: float = PROFILE_MATCH_MIN_SIMILARITY) -> Dict[str, List[Tuple[str, float]]]:
+        """Pro Stichwort die passenden Einträge, absteigend nach Score (bestes Feld zählt).
+
+        Jedes Wort des Stichworts wird mit dem ähnlichsten Wort des Feldes
+        verglichen; kurze Wörter müssen exakt (als Teilstring) vorkommen.
+        """
+        felder = list(felder)
+        ergebnis = {}
+        for stichwort in stichwoerter:
+            teile = [(w, _wort_trigramme(w)) for w in woerter(stichwort)]
+            gesamt = sum(len(g) for _, g in teile)
+            if not gesamt:
+                ergebnis[stichwort] = []
+                continue
+            beste: Dict[str, float] = {}
+            for feld in felder:
+                zaehler: Dict[str, int] = defaultdict(int)
+                for wort, gesucht in teile:
+                    if len(wort) <= PROFILE_MATCH_EXACT_MAX_LEN:
+                        anteile = dict.fromkeys(self._exakt(feld, wort), len(gesucht))
+                    else:
+                        anteile = self._unscharf(feld, gesucht)
+                    for schluessel, anzahl in anteile.items():
+                        zaehler[schluessel] += anzahl
+                for schluessel, anzahl in zaehler.items():
+                    beste[schluessel] = max(beste.get(schluessel, 0.0), anzahl / gesamt)
+            treffer = [(s, score) for s, score in beste.items() if score >= min_score]
+            ergebnis[stichwort] = sorted(treffer, key=lambda t: (-t[1], t[0]))
+        return ergebnis
@@ -0,0 +1,121 @@
+"""Strukturierte Analyse einer Chat-Nachricht in einem einzigen LLM-Aufruf.
+
+Ersetzt die getrennten Aufrufe für Intent-Erkennung, Commitment-Check und
+die Feld-Extraktion für neue To-Dos und Routinen. Das Ergebnis wird per
+JSON-Schema (Structured Outputs) erzwungen und mit Pydantic validiert.
+"""
+import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ValidationError
+
+Intent = Literal["todo", "routine", "todo_update", "todo_delete", "archive_profile", "routine_datum", "chat"]
+Priority = Literal["low", "medium", "high"]
+
+
+class TodoFelder(BaseModel):
+    title: str
+    due_date: Optional[str] = None
+    priority: Priority = "medium"
+
+
+class RoutineFelder(BaseModel):
+    task: str
+    interval_days: Optional[int] = None
+    interval_months: Optional[int] = None
+    weekday: Optional[str] = None
+    day_of_month: Optional[str] = None
+    chosen_date: Optional[str] = None
+
+
+class CommitmentVorschlag(BaseModel):
+    titel: str
+    due_date: Optional[str] = None
+    priority: Priority = "medium"
+
+
+class TurnAnalysis(BaseModel):
+    intent: Intent
+    todo: Optional[TodoFelder] = None
+    routine: Optional[RoutineFelder] = None
+    commitment: Optional[CommitmentVorschlag] = None
+
+
+def _nullable(schema: dict) -> dict:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+
+def _objekt(properties: dict) -> dict:
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+_PRIORITY = {"type": "string", "enum": ["low", "medium", "high"]}
+_DATUM = _nullable({"type": "string", "description": "YYYY-MM-DD"})
+
+TURN_ANALYSIS_SCHEMA = _objekt({
+    "intent": {"type": "string", "enum": ["todo", "routine", "todo_update", "todo_delete", "archive_profile", "routine_datum", "chat"]},
+    "todo": _nullable(_objekt({"title": {"type": "string"}, "due_date": _DATUM, "priority": _PRIORITY})),
+    "routine": _nullable(_objekt({
+        "task": {"type": "string"},
+        "interval_days": _nullable({"type": "integer"}),
+        "interval_months": _nullable({"type": "integer"}),
+        "weekday": _nullable({"type": "string", "enum": ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]}),
+        "day_of_month": _nullable({"type": "string", "description": "Zahl 1-31 oder 'last'"}),
+        "chosen_date": _DATUM,
+    })),
+    "commitment": _nullable(_objekt({"titel": {"type": "string"}, "due_date": _DATUM, "priority": _PRIORITY})),
+})
+
+
+def _baue_prompt(user_message: str, last_ai_response: str) -> str:
+    today = datetime.datetime.now().strftime("%Y-%m-%d")
+    context = f"Letzte KI-Antwort: '{last_ai_response}'\n" if last_ai_response else ""
+    return f"""Heute ist {today}.
+{context}Neue Nachricht: '{user_message}'
+
+Analysiere die Nachricht und fülle das JSON-Schema aus.
+
+1. intent — genau einer von:
+- todo: Anfrage zum Erstellen eines einmaligen To-Dos (z.B. 'bis Freitag erledigen')
+- routine: Bitte oder Absicht eine wiederkehrende Routine anzulegen (NUR wenn der Nutzer eine Verpflichtung oder Absicht mit konkretem Zeitplan ausdrückt: 'ich muss jeden X', 'ich will jeden X', 'erstelle', 'richte ein', 'als Routine', 'tracken' — NICHT wenn er nur beschreibt was er bereits regelmäßig tut, z.B. 'ich mache sonntags X')
+- todo_update: Korrektur oder Änderung eines bestehenden To-Dos — NUR wenn in der letzten KI-Antwort ein To-Do besprochen wurde, NICHT wenn über Routinen oder andere Themen gesprochen wurde (z.B. 'nein, bitte korrigieren', 'Datum ändern', 'Relevanz hoch', 'doch am Dienstag')
+- todo_delete: Löschen oder Entfernen eines bestehenden To-Dos (z.B. 'lösch das To-Do', 'bitte entfernen', 'rausnehmen')
+- archive_profile: Meldung dass bestimmte Ereignisse/Vorhaben/Reisen/Aktivitäten bereits vergangen oder abgeschlossen sind (z.B. 'X ist vorbei', 'X war letztes Jahr', 'X ist abgeschlossen')
+- routine_datum: Antwort auf eine Terminauswahl oder Rückfrage der KI für eine Routine
+- chat: normaler Chat
+
+2. todo — NUR bei intent=todo, sonst null. Falls die Nachricht auf den Kontext verweist ('dazu', 'das', 'es'), nutze die letzte KI-Antwort um das Thema zu verstehen.
+- title: Nomen oder kurze Nomen-Phrase, maximal 4 Wörter, KEIN ganzer Satz (Beispiel: 'Arzttermin buchen' statt 'ich muss einen Arzt anrufen'), korrektes Deutsch mit Großschreibung und Umlauten
+- due_date: Fälligkeitsdatum oder null; priority: low/medium/high
+
+3. routine — NUR bei intent=routine oder routine_datum, sonst null. Bei routine_datum die vollständige Routine aus KI-Frage und Antwort zusammensetzen.
+- task: Nomen oder kurze Phrase, max. 4 Wörter (Beispiel: 'Sport machen' statt 'ich will Sport machen')
+- ENTWEDER interval_days ODER interval_months, nie beides. Beispiele: täglich→1 Tag, wöchentlich→7 Tage, alle 2 Wochen→14 Tage, monatlich→1 Monat, alle 3 Monate→3 Monate, halbjährlich→6 Monate, jährlich→12 Monate
+- weekday wenn ein Wochentag genannt wird; day_of_month (Zahl oder 'last') wenn ein Monatstag genannt wird; chosen_date wenn der Nutzer ein konkretes Datum gewählt hat
+
+4. commitment — NUR bei intent=chat, sonst null. Ein Commitment ist NUR relevant wenn ALLE Kriterien erfüllt sind:
+- Spezifische Aktion (nicht vage wie "ich will gesünder leben")
+- Hat einen Zeitbezug oder ist zeitkritisch
+- Nicht trivial (kein "ich gehe heute einkaufen", kein "ich trinke mehr Wasser")
+- Relevant für Ziele, Gesundheit oder persönliche Entwicklung — NICHT beruflich (keine Meetings, Arbeitsprojekte, Kundentermine, berufliche Präsentationen)
+Dann: titel (kurzer Aktions-Titel), due_date, priority."""
+
+
+async def analysiere_turn(llm, user_message: str, last_ai_response: str = "") -> Optional[TurnAnalysis]:
+    """Analysiert eine Nachricht mit einem LLM-Aufruf. Gibt None zurück, wenn die Antwort nicht valide ist."""
+    response = await llm.complete(
+        model="gpt-4o-mini",
+        messages=[{"role": "user", "content": _baue_prompt(user_message, last_ai_response)}],
+        response_format={"type": "json_schema", "json_schema": {"name": "turn_analysis", "strict": True, "schema": TURN_ANALYSIS_SCHEMA}},
+        temperature=0,
+        timeout=15,
+        cache=True,
+        tag="turn_analyse"
+    )
+    raw = response.choices[0].message.content
+    try:
+        return TurnAnalysis.model_validate_json(raw)
+    except ValidationError as e:
+        print(f"FEHLER bei der Validierung der Turn-Analyse: {e}")
+        print(f"GPT-Antwort (Roh): {raw}")
+        return None
@@ -0,0 +1,330 @@
+"""Lokaler Vektor-Index über Langzeitgedächtnis, Berichte, Profil-Attribute und gestellte Einstiegsfragen.
+
+Die Embeddings liegen als kompakte float32-Matrix (eine normalisierte Zeile
+pro Eintrag) in einer Datei, die per np.memmap gelesen wird. Neue Einträge
+werden angehängt; ersetzte oder entfernte Einträge werden nur in den
+Metadaten markiert und beim nächsten Start kompaktiert. Die Metadaten sind
+ein Append-Only-Log (JSONL).
+
+Der Index lebt pro Prozess auf der lokalen Platte. Fehlt er (neue Instanz),
+baut ihn `python vector_index.py rebuild` aus Supabase neu auf. Ohne Rebuild
+wird jeder Nutzer beim ersten Bedarf einzeln nachindexiert (nachindexieren);
+erst danach gilt er als vollständig (vollstaendig()) – bis dahin nutzt der
+Chat das vollständige Profil und die neuesten Einträge statt der Suche.
+
+Ein Vektor wird vor seiner Metadaten-Zeile geschrieben. Bricht ein Prozess
+dazwischen ab, schneidet das Laden überzählige Vektoren und eine halbe letzte
+Zeile im Log wieder ab, damit spätere Einträge nicht auf fremden Vektoren landen.
+
+Der Index setzt genau einen Server-Prozess voraus: Jeder Prozess sieht nur die
+Einträge, die er selbst geschrieben hat, die Markierung "vollständig" wäre bei
+mehreren Workern (oder Instanzen) also falsch. Ein zweiter Prozess auf dem
+Verzeichnis bricht beim Start ab (Datei owner), ebenso ein Start mit
+WEB_CONCURRENCY > 1. Skripte neben dem Server (z.B. report_batch.py) legen
+keinen Index an; ihre neuen Berichte indexiert der Server regelmäßig nach
+(berichte_nachindexieren).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from map_reduce import zeilen_seitenweise
+
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "vector_index")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "256"))
+# Eingabe fürs Embedding begrenzen (Berichte können lang sein)
+EMBEDDING_MAX_CHARS = 6000
+
+# (key, user_id, quelle, text)
+Eintrag = Tuple[str, str, str, str]
+
+
+def _besitz_pruefen(pfad: str):
+    """Bricht ab bei mehreren Workern oder wenn ein anderer laufender Prozess auf diesem Rechner das Verzeichnis benutzt."""
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        raise RuntimeError("Der lokale Vektor-Index unterstützt nur einen Server-Prozess (WEB_CONCURRENCY=1)")
+    datei = os.path.join(pfad, "owner")
+    ich = f"{socket.gethostname()}:{os.getpid()}"
+    if os.path.exists(datei):
+        with open(datei, encoding="utf-8") as fh:
+            besitzer = fh.read().strip()
+        host, _, pid = besitzer.rpartition(":")
+        if besitzer != ich and host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except (ProcessLookupError, PermissionError):
+                pass  # Prozess beendet (oder fremder Nutzer): Eintrag ist veraltet
+            else:
+                raise RuntimeError(f"Vektor-Index {pfad} wird schon von Prozess {pid} benutzt – nur ein Server-Prozess pro Index")
+    with open(datei, "w", encoding="utf-8") as fh:
+        fh.write(ich)
+
+
+class VektorIndex:
+    def __init__(self, pfad: str = VECTOR_INDEX_DIR, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        os.makedirs(pfad, exist_ok=True)
+        _besitz_pruefen(pfad)
+        self._vec_pfad = os.path.join(pfad, "vectors.f32")
+        self._meta_pfad = os.path.join(pfad, "meta.jsonl")
+        self._lock = threading.Lock()
+        self._meta: List[Dict] = []
+        self._aktuell: Dict[str, int] = {}  # key -> aktuelle Zeile
+        self._zeilen_pro_user: Dict[str, List[int]] = {}
+        self._vollstaendig: Set[str] = set()
+        self._matrix: Optional[np.memmap] = None
+        self._laden()
+
+    def _laden(self):
+        zeilen_vektoren = os.path.getsize(self._vec_pfad) // (4 * self.dim) if os.path.exists(self._vec_pfad) else 0
+        gueltig_bis = 0  # Byte-Position hinter der letzten verwendbaren Log-Zeile
+        if os.path.exists(self._meta_pfad):
+            with open(self._meta_pfad, "rb") as fh:
+                for line in fh:
+                    try:
+                        op = json.loads(line) if line.endswith(b"\n") else None
+                    except ValueError:
+                        op = None
+                    if op is None:
+                        break  # Halb geschriebene letzte Zeile
+                    if op["op"] == "add":
+                        if len(self._meta) >= zeilen_vektoren:
+                            break  # Metadaten ohne Vektor
+                        self._registriere(op["eintrag"])
+                    elif op["op"] == "del":
+                        self._aktuell.pop(op["key"], None)
+                    elif op["op"] == "voll":
+                        self._vollstaendig.add(op["user_id"])
+                    gueltig_bis += len(line)
+            if gueltig_bis < os.path.getsize(self._meta_pfad):
+                print(f"Vektor-Index: unvollständiges Log ab Byte {gueltig_bis} abgeschnitten")
+                os.truncate(self._meta_pfad, gueltig_bis)
+        if os.path.exists(self._vec_pfad) and os.path.getsize(self._vec_pfad) > len(self._meta) * 4 * self.dim:
+            # Vektoren ohne Metadaten (Abbruch zwischen den beiden Schreibvorgängen)
+            print(f"Vektor-Index: {zeilen_vektoren - len(self._meta)} Vektor(en) ohne Metadaten abgeschnitten")
+            os.truncate(self._vec_pfad, len(self._meta) * 4 * self.dim)
+            zeilen_vektoren = len(self._meta)
+        veraltet = len(self._meta) - len(self._aktuell)
+        if self._meta and veraltet / len(self._meta) > 0.3:
+            self._kompaktieren(zeilen_vektoren)
+        else:
+            self._oeffne_matrix()
+
+    def _registriere(self, eintrag: Dict):
+        zeile = len(self._meta)
+        self._meta.append(eintrag)
+        self._aktuell[eintrag["key"]] = zeile
+        self._zeilen_pro_user.setdefault(eintrag["user_id"], []).append(zeile)
+
+    def _oeffne_matrix(self):
+        self._matrix = np.memmap(self._vec_pfad, dtype=np.float32, mode="r", shape=(len(self._meta), self.dim)) if self._meta else None
+
+    def _kompaktieren(self, zeilen_vektoren: int):
+        """Schreibt Matrix und Metadaten ohne ersetzte/entfernte Einträge neu."""
+        alt = np.memmap(self._vec_pfad, dtype=np.float32, mode="r", shape=(zeilen_vektoren, self.dim))
+        behalten = sorted(self._aktuell.values())
+        vektoren = np.array(alt[behalten], dtype=np.float32)
+        eintraege = [self._meta[z] for z in behalten]
+        del alt
+        vektoren.tofile(self._vec_pfad + ".tmp")
+        with open(self._meta_pfad + ".tmp", "w", encoding="utf-8") as fh:
+            for e in eintraege:
+                fh.write(json.dumps({"op": "add", "eintrag": e}, ensure_ascii=False) + "\n")
+            for user_id in sorted(self._vollstaendig):
+                fh.write(json.dumps({"op": "voll", "user_id": user_id}) + "\n")
+        os.replace(self._vec_pfad + ".tmp", self._vec_pfad)
+        os.replace(self._meta_pfad + ".tmp", self._meta_pfad)
+        self._meta, self._aktuell, self._zeilen_pro_user = [], {}, {}
+        for e in eintraege:
+            self._registriere(e)
+        self._oeffne_matrix()
+
+    def __len__(self) -> int:
+        return len(self._aktuell)
+
+    def _zeilen(self, user_id: str, quellen: Optional[Iterable[str]] = None) -> List[int]:
+        """Aktuelle (nicht ersetzte/entfernte) Zeilen des Nutzers, optional nur aus bestimmten Quellen."""
+        quellen = set(quellen) if quellen else None
+        return [
+            z for z in self._zeilen_pro_user.get(user_id, [])
+            if self._aktuell.get(self._meta[z]["key"]) == z and (quellen is None or self._meta[z]["quelle"] in quellen)
+        ]
+
+    def hat_eintraege(self, user_id: str, quellen: Optional[Iterable[str]] = None) -> bool:
+        return bool(self._zeilen(user_id, quellen))
+
+    def enthaelt(self, key: str) -> bool:
+        return key in self._aktuell
+
+    def vollstaendig(self, user_id: str) -> bool:
+        """Sind alle Einträge des Nutzers indexiert (Rebuild oder Nachindexierung gelaufen)?"""
+        return user_id in self._vollstaendig
+
+    def als_vollstaendig_markieren(self, user_id: str):
+        with self._lock:
+            if user_id in self._vollstaendig:
+                return
+            with open(self._meta_pfad, "a", encoding="utf-8") as fh:
+                fh.write(json.dumps({"op": "voll", "user_id": user_id}) + "\n")
+            self._vollstaendig.add(user_id)
+
+    def hinzufuegen(self, eintraege: Sequence[Eintrag], vektoren: Sequence[Sequence[float]]):
+        """Hängt Einträge an; ein bereits vorhandener Key wird durch den neuen Eintrag ersetzt."""
+        if not eintraege:
+            return
+        matrix = np.asarray(vektoren, dtype=np.float32).reshape(len(eintraege), self.dim)
+        normen = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(normen == 0, 1, normen)
+        with self._lock:
+            with open(self._vec_pfad, "ab") as fh:
+                fh.write(matrix.tobytes())
+            with open(self._meta_pfad, "a", encoding="utf-8") as fh:
+                for key, user_id, quelle, text in eintraege:
+                    eintrag = {"key": key, "user_id": user_id, "quelle": quelle, "text": text}
+                    fh.write(json.dumps({"op": "add", "eintrag": eintrag}, ensure_ascii=False) + "\n")
+                    self._registriere(eintrag)
+            self._oeffne_matrix()
+
+    def entfernen(self, keys: Iterable[str]):
+        with self._lock:
+            with open(self._meta_pfad, "a", encoding="utf-8") as fh:
+                for key in keys:
+                    if self._aktuell.pop(key, None) is not None:
+                        fh.write(json.dumps({"op": "del", "key": key}) + "\n")
+
+    def suche(self, user_id: str, vektor: Sequence[float], k: int = 8, quellen: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Top-k Einträge des Nutzers nach Kosinus-Ähnlichkeit (absteigend), mit "score"."""
+        zeilen = self._zeilen(user_id, quellen)
+        if not zeilen or self._matrix is None:
+            return []
+        q = np.asarray(vektor, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1)
+        scores = self._matrix[zeilen] @ q
+        k = min(k, len(zeilen))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**self._meta[zeilen[i]], "score": float(scores[i])} for i in top]
+
+    def max_aehnlichkeit(self, user_id: str, vektoren: Sequence[Sequence[float]], quellen: Optional[Iterable[str]] = None) -> List[float]:
+        """Pro Vektor die höchste Kosinus-Ähnlichkeit zu den Einträgen des Nutzers (-1.0 ohne Einträge)."""
+        zeilen = self._zeilen(user_id, quellen)
+        if not zeilen or self._matrix is None:
+            return [-1.0] * len(vektoren)
+        q = np.asarray(vektoren, dtype=np.float32).reshape(len(vektoren), self.dim)
+        normen = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(normen == 0, 1, normen)
+        return (self._matrix[zeilen] @ q.T).max(axis=0).tolist()
+
+
+BERICHT_THEMEN = ("Wochenrückblick", "Monatsrückblick", "Quartalsbericht", "Jahresrückblick")
+
+
+def profil_key(user_id: str, attribute_name: str) -> str:
+    return f"profil:{user_id}:{attribute_name}"
+
+
+def profil_eintrag(user_id: str, attribute_name: str, attribute_value: str) -> Eintrag:
+    return (profil_key(user_id, attribute_name), user_id, "profil", f"{attribute_name}: {attribute_value}")
+
+
+def frage_eintrag(user_id: str, frage: str) -> Eintrag:
+    """Eintrag für eine gestellte Einstiegsfrage (Grundlage der Neuheitsprüfung)."""
+    return (f"frage:{user_id}:{hashlib.sha1(frage.encode('utf-8')).hexdigest()[:16]}", user_id, "einstiegsfrage", frage)
+
+
+def gedaechtnis_eintrag(user_id: str, row: Dict) -> Eintrag:
+    """Eintrag für eine long_term_memory-Zeile; Berichte werden als eigene Quelle geführt."""
+    quelle = "bericht" if row.get("thema") in BERICHT_THEMEN else "gedaechtnis"
+    datum = (row.get("timestamp") or "")[:10] or "unbekannt"
+    key = f"memory:{row.get('id') or user_id + ':' + str(row.get('timestamp'))}"
+    return (key, user_id, quelle, f"[Aufgezeichnet: {datum}] {row.get('thema')}: {row.get('inhalt')}")
+
+
+async def indexiere(index: VektorIndex, llm, eintraege: Sequence[Eintrag]):
+    """Berechnet die Embeddings für neue Einträge und hängt sie an den Index an."""
+    eintraege = [e for e in eintraege if e[3]]
+    if not eintraege:
+        return
+    vektoren = await llm.embed([e[3][:EMBEDDING_MAX_CHARS] for e in eintraege], model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIM)
+    index.hinzufuegen(eintraege, vektoren)
+
+
+async def nachindexieren(index: VektorIndex, llm, db, user_id: str):
+    """Indexiert alle noch fehlenden Gedächtnis-, Berichts-, Profil- und Fragen-Einträge eines Nutzers
+    und markiert ihn danach als vollständig."""
+    gedaechtnis, profil, fragen = await db.gather(
+        db.table("long_term_memory").select("id, thema, inhalt, timestamp").eq("user_id", user_id),
+        db.table("profile").select("attribute_name, attribute_value").eq("user_id", user_id).eq("archived", False),
+        db.table("conversation_history").select("ai_prompt").eq("user_id", user_id).neq("ai_prompt", ""),
+    )
+    eintraege = [gedaechtnis_eintrag(user_id, row) for row in gedaechtnis]
+    eintraege += [profil_eintrag(user_id, row["attribute_name"], row["attribute_value"]) for row in profil]
+    eintraege += [frage_eintrag(user_id, row["ai_prompt"]) for row in fragen if row.get("ai_prompt")]
+    fehlend = list({e[0]: e for e in eintraege if not index.enthaelt(e[0])}.values())
+    for start in range(0, len(fehlend), 100):
+        await indexiere(index, llm, fehlend[start:start + 100])
+    index.als_vollstaendig_markieren(user_id)
+
+
+async def berichte_nachindexieren(index: VektorIndex, llm, db, seit: str) -> int:
+    """Indexiert seit `seit` gespeicherte Berichte aller Nutzer, die noch fehlen (z.B. aus report_batch.py).
+
+    Erst werden nur die IDs gelesen; Texte nur für die fehlenden Zeilen. Liefert die Anzahl neuer Einträge."""
+    fehlend = []
+    async for row in zeilen_seitenweise(db, lambda: db.table("long_term_memory").select("id, user_id, thema, timestamp")
+                                        .in_("thema", list(BERICHT_THEMEN)).gte("timestamp", seit).order("id", desc=False)):
+        if not index.enthaelt(gedaechtnis_eintrag(str(row["user_id"]), row)[0]):
+            fehlend.append(row["id"])
+    for start in range(0, len(fehlend), 100):
+        zeilen = await db.fetch(db.table("long_term_memory").select("id, user_id, thema, inhalt, timestamp").in_("id", fehlend[start:start + 100]))
+        await indexiere(index, llm, [gedaechtnis_eintrag(str(row["user_id"]), row) for row in zeilen])
+    return len(fehlend)
+
+
+async def _neu_aufbauen(pfad: str):
+    from dotenv import load_dotenv
+    from supabase import create_client
+    from llm_gateway import LLMGateway
+
+    load_dotenv()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+    llm = LLMGateway(api_key=os.getenv("OPENAI_API_KEY"))
+    os.makedirs(pfad, exist_ok=True)
+    _besitz_pruefen(pfad)
+    for datei in ("vectors.f32", "meta.jsonl"):
+        if os.path.exists(os.path.join(pfad, datei)):
+            os.remove(os.path.join(pfad, datei))
+    index = VektorIndex(pfad)
+
+    eintraege: List[Eintrag] = []
+    for row in client.table("long_term_memory").select("id, user_id, thema, inhalt, timestamp").execute().data:
+        eintraege.append(gedaechtnis_eintrag(str(row["user_id"]), row))
+    for row in client.table("profile").select("user_id, attribute_name, attribute_value").eq("archived", False).execute().data:
+        eintraege.append(profil_eintrag(str(row["user_id"]), row["attribute_name"], row["attribute_value"]))
+    for row in client.table("conversation_history").select("user_id, ai_prompt").neq("ai_prompt", "").execute().data:
+        if row.get("ai_prompt"):
+            eintraege.append(frage_eintrag(str(row["user_id"]), row["ai_prompt"]))
+
+    for start in range(0, len(eintraege), 100):
+        await indexiere(index, llm, eintraege[start:start + 100])
+    for user_id in sorted({e[1] for e in eintraege}):
+        index.als_vollstaendig_markieren(user_id)
+    await llm.aclose()
+    print(f"{len(index)} Einträge in {pfad} indexiert.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vektor-Index für Gedächtnis, Berichte und Profil")
+    sub = parser.add_subparsers(dest="befehl", required=True)
+    p_rebuild = sub.add_parser("rebuild", help="Index komplett aus Supabase neu aufbauen")
+    p_rebuild.add_argument("--pfad", default=VECTOR_INDEX_DIR)
+    args = parser.parse_args()
+    asyncio.run(_neu_aufbauen(args.pfad))